@@ -0,0 +1,32 @@
+# =========================
+# ✅ app/clinic_time.py
+# (Hora de pared de la clínica para comparar con las citas)
+# =========================
+"""
+Appointment.start_at / end_at son la hora local que se escribe en el
+formulario (naive, sin zona). Todo lo que las compara con "ahora" (citas
+vencidas, recordatorios de mañana, no agendar en el pasado, huecos libres,
+ventana para iniciar la atención) usa `now()` / `today()` de aquí, no utcnow.
+
+Las marcas técnicas (created_at, updated_at, ended_at de la atención,
+leases, jobs) siguen en UTC.
+
+CLINIC_TZ es un nombre IANA (por defecto America/Guayaquil).
+"""
+import os
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+CLINIC_TZ = os.getenv("CLINIC_TZ", "America/Guayaquil")
+TZ = ZoneInfo(CLINIC_TZ)
+
+
+def now() -> datetime:
+    """
+    Hora local de la clínica, naive (comparable con start_at / end_at).
+    """
+    return datetime.now(TZ).replace(tzinfo=None)
+
+
+def today() -> date:
+    return now().date()
@@ -0,0 +1,144 @@
+# =========================
+# ✅ app/compression.py
+# (Compresión de respuestas: brotli si está instalado, si no gzip)
+# =========================
+"""
+Middleware ASGI propio en lugar de GZipMiddleware para poder ofrecer brotli
+con el mismo umbral y las mismas exclusiones.
+
+Solo se comprimen respuestas de un único cuerpo (HTML, JSON, CSS, JS...):
+
+- las respuestas en streaming (SSE, FileResponse de Excel/PDF) pasan tal cual;
+- si ya traen Content-Encoding (assets precomprimidos, /scan) no se tocan;
+- por debajo de COMPRESS_MIN_BYTES no compensa y se mandan sin comprimir.
+
+`brotli` es opcional: sin el paquete solo se negocia gzip.
+"""
+import gzip
+import os
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+# por encima de esto se comprime en un hilo para no frenar el event loop
+THREAD_MIN_BYTES = 128 * 1024
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+NEVER_COMPRESS = ("text/event-stream",)
+
+
+def accepted_encodings(accept_encoding: str) -> list[str]:
+    """
+    Codificaciones aceptadas por el cliente que podemos producir, en orden
+    de preferencia (br antes que gzip). Respeta q=0.
+    """
+    accepted = set()
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+
+    out = []
+    if brotli is not None and "br" in accepted:
+        out.append("br")
+    if "gzip" in accepted:
+        out.append("gzip")
+    return out
+
+
+def compress(body: bytes, encoding: str, *, best: bool = False) -> bytes:
+    """
+    best=True para assets que se comprimen una sola vez (al arrancar).
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if best else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+
+
+def is_compressible(content_type: str) -> bool:
+    ct = (content_type or "").partition(";")[0].strip().lower()
+    if not ct or ct in NEVER_COMPRESS:
+        return False
+    return ct.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encodings = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        start: Message | None = None
+        passthrough = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start, passthrough
+            kind = message["type"]
+
+            if kind == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if (
+                    "content-encoding" in headers
+                    or message["status"] in (204, 206, 304)
+                    or not is_compressible(headers.get("content-type", ""))
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message  # se decide al ver el cuerpo
+                return
+
+            if kind != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            if start is None:
+                # cuerpos siguientes de un streaming ya iniciado sin comprimir
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+
+            if message.get("more_body", False) or not encodings or len(body) < self.minimum_size:
+                # streaming (SSE, archivos) o respuesta chica: sin comprimir
+                await send(start)
+                start = None
+                await send(message)
+                return
+
+            encoding = encodings[0]
+            if len(body) >= THREAD_MIN_BYTES:
+                packed = await anyio.to_thread.run_sync(compress, body, encoding)
+            else:
+                packed = compress(body, encoding)
+
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(packed))
+            await send(start)
+            start = None
+            await send({**message, "body": packed})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,194 @@
+# =========================
+# ✅ app/db_types.py
+# (Tipos de columna propios: texto comprimido transparente)
+# =========================
+"""
+CompressedText guarda textos largos comprimidos en la MISMA columna TEXT
+(no hace falta migrar el tipo), con una cabecera de 2 caracteres:
+
+- "\\x01z" + base64(zlib)   · "\\x01s" + base64(zstd)
+- "\\x01p" + texto           · texto plano que empezaba con \\x01 (escape)
+- cualquier otro valor      · texto plano (cortos, viejos o sin compresión)
+
+Es opt-in: se comprime al escribir solo con TEXT_COMPRESSION=zlib|zstd y
+valores de al menos TEXT_COMPRESSION_MIN_BYTES, y solo si ocupa menos que el
+original. Leer entiende siempre los tres formatos, así que activar o
+desactivar no rompe nada; `python -m app.db_types` reescribe lo existente
+con la configuración actual (comprime o descomprime).
+
+Los filtros SQL (==, LIKE...) comparan contra lo guardado, no contra el
+texto: estas columnas no se usan para buscar.
+
+`zstandard` es opcional: sin el paquete zstd cae a zlib al escribir.
+"""
+import base64
+import logging
+import os
+import zlib
+
+from sqlalchemy import Text, func, select, type_coerce, update
+from sqlalchemy.orm import Session
+from sqlalchemy.types import TypeDecorator
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+log = logging.getLogger("nexa.db_types")
+
+TEXT_COMPRESSION = os.getenv("TEXT_COMPRESSION", "off").lower()  # off | zlib | zstd
+TEXT_COMPRESSION_MIN_BYTES = int(os.getenv("TEXT_COMPRESSION_MIN_BYTES", "512"))
+ZLIB_LEVEL = int(os.getenv("TEXT_COMPRESSION_ZLIB_LEVEL", "6"))
+ZSTD_LEVEL = int(os.getenv("TEXT_COMPRESSION_ZSTD_LEVEL", "3"))
+
+MARK = "\x01"
+_ZLIB = MARK + "z"
+_ZSTD = MARK + "s"
+_PLAIN = MARK + "p"
+
+
+def _codec(codec: str | None) -> str:
+    codec = (codec or TEXT_COMPRESSION).lower()
+    if codec == "zstd" and zstandard is None:
+        return "zlib"
+    return codec if codec in ("zlib", "zstd") else "off"
+
+
+def encode(value: str | None, codec: str | None = None, min_bytes: int | None = None) -> str | None:
+    """
+    Texto -> forma guardada. `codec` None = TEXT_COMPRESSION.
+    """
+    if value is None:
+        return None
+    codec = _codec(codec)
+    raw = value.encode("utf-8")
+    min_bytes = TEXT_COMPRESSION_MIN_BYTES if min_bytes is None else min_bytes
+
+    if codec != "off" and len(raw) >= min_bytes:
+        if codec == "zstd":
+            packed = _ZSTD + base64.b64encode(zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)).decode("ascii")
+        else:
+            packed = _ZLIB + base64.b64encode(zlib.compress(raw, ZLIB_LEVEL)).decode("ascii")
+        # base64 agrega ~33%: con textos poco repetitivos puede no compensar
+        if len(packed) < len(value):
+            return packed
+
+    return _PLAIN + value if value.startswith(MARK) else value
+
+
+def decode(stored: str | None) -> str | None:
+    """
+    Forma guardada -> texto.
+    """
+    if stored is None or not stored.startswith(MARK):
+        return stored
+    head, body = stored[:2], stored[2:]
+    if head == _ZLIB:
+        return zlib.decompress(base64.b64decode(body)).decode("utf-8")
+    if head == _ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Texto comprimido con zstd y el paquete zstandard no está instalado")
+        return zstandard.ZstdDecompressor().decompress(base64.b64decode(body)).decode("utf-8")
+    if head == _PLAIN:
+        return body
+    return stored
+
+
+class CompressedText(TypeDecorator):
+    """
+    Text que se comprime/descomprime solo (ver módulo). `codec` fija el
+    algoritmo de esta columna; None = TEXT_COMPRESSION.
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, codec: str | None = None, *args, **kwargs):
+        self.codec = codec
+        super().__init__(*args, **kwargs)
+
+    def process_bind_param(self, value, dialect):
+        return encode(value, self.codec)
+
+    def process_result_value(self, value, dialect):
+        return decode(value)
+
+    def coerce_compared_value(self, op, value):
+        # los literales de un filtro no se comprimen
+        return Text()
+
+
+# -------------------------
+# Reescritura de lo existente (migración)
+# -------------------------
+def compressed_columns(model) -> list:
+    return [c for c in model.__table__.columns if isinstance(c.type, CompressedText)]
+
+
+def backfill(db: Session, model, batch: int = 500) -> int:
+    """
+    Reescribe las columnas CompressedText de `model` con la configuración
+    actual (comprime lo largo o, con TEXT_COMPRESSION=off, descomprime).
+    Devuelve cuántas filas cambió.
+    """
+    cols = compressed_columns(model)
+    if not cols:
+        return 0
+    pk = list(model.__table__.primary_key.columns)[0]
+    # lo guardado tal cual, sin pasar por el TypeDecorator
+    raw_cols = [type_coerce(c, Text).label(c.name) for c in cols]
+
+    changed = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(pk, *raw_cols).where(pk > last_id).order_by(pk).limit(batch)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        for row in rows:
+            values = {}
+            for c in cols:
+                stored = row._mapping[c.name]
+                if stored is None:
+                    continue
+                rewritten = encode(decode(stored), c.type.codec)
+                if rewritten != stored:
+                    values[c.name] = rewritten
+            if values:
+                table = model.__table__
+                new = {table.c[k]: type_coerce(v, Text) for k, v in values.items()}
+                # el contenido no cambia: que no salten los onupdate (updated_at)
+                new.update({c: c for c in table.columns if c.onupdate is not None})
+                db.execute(update(table).where(pk == row[0]).values(new))
+                changed += 1
+        db.commit()
+
+    if changed:
+        log.info("%s: %s filas reescritas (TEXT_COMPRESSION=%s)", model.__tablename__, changed, _codec(None))
+    return changed
+
+
+def stored_size(db: Session, model) -> int:
+    """
+    Caracteres guardados en las columnas CompressedText de `model` (para comparar).
+    """
+    cols = compressed_columns(model)
+    total = 0
+    for c in cols:
+        total += db.execute(select(func.coalesce(func.sum(func.length(type_coerce(c, Text))), 0))).scalar()
+    return int(total)
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+    from .models import ClinicalNote, EncounterEvolution
+
+    with SessionLocal() as _db:
+        for _model in (ClinicalNote, EncounterEvolution):
+            _before = stored_size(_db, _model)
+            _n = backfill(_db, _model)
+            print(f"✅ {_model.__tablename__}: {_n} filas reescritas, {_before} -> {stored_size(_db, _model)} caracteres")
@@ -2,7 +2,7 @@
 # ✅ app/deps/auth.py
 # (JWT Bearer para endpoints API, NO UI)
 # =========================
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
 
@@ -32,3 +32,24 @@ def get_current_doctor(
         raise HTTPException(status_code=401, detail="Doctor del token no existe")
 
     return doctor
+
+
+def get_doctor_bearer_or_session(
+    request: Request,
+    creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: Session = Depends(get_db),
+) -> Doctor:
+    """
+    Para endpoints que usa tanto la API (Bearer) como el JS de la UI
+    (cookie de sesión), p. ej. el autosave de la nota clínica.
+    """
+    if creds is not None and creds.credentials:
+        return get_current_doctor(creds, db)
+
+    doctor_id = request.session.get("doctor_id")
+    if doctor_id:
+        doctor = db.query(Doctor).filter(Doctor.id == int(doctor_id)).first()
+        if doctor:
+            return doctor
+
+    raise HTTPException(status_code=401, detail="Falta token (Authorization: Bearer) o sesión")
@@ -1,9 +1,10 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 import os
 
-from .database import engine
+from .database import SessionLocal, engine
 from .models import Base
 
 from .routes.doctors import router as doctors_router
@@ -18,8 +19,47 @@ from .routes.clinical_notes import router as clinical_notes_router
 from .routes.pdf import router as pdf_router
 from .routes.history import router as history_router
 from .routes.appointments_ui import router as appointments_ui_router
+from .routes.jobs import router as jobs_router
+from .routes.blobs import router as blobs_router
+from .routes.agenda_api import router as agenda_api_router
+from .routes.events import router as events_router
+from .routes.ics import router as ics_router
+from .routes.metrics import router as metrics_router
+from .routes.assets import router as assets_router
+from .routes.vitals import router as vitals_router
+from .routes.analytics import router as analytics_router
+from .services import assets, audit, booking, events, jobs, patient_summary, pdf_archive, scheduler, schema, vitals
+from .compression import CompressionMiddleware
+from .request_metrics import RequestMetricsMiddleware
+from . import templating
 
-app = FastAPI(title="NexaCenter")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 🧩 plantillas compiladas antes del primer request (y errores de sintaxis al arrancar)
+    templating.precompile()
+    # 🗜️ assets con huella + gzip/brotli, una sola vez por proceso
+    assets.build()
+    # ⚙️ workers de tareas en segundo plano (Excel, PDFs consolidados, ...)
+    jobs.start_workers()
+    # 🧾 auditoría: los handlers solo encolan, este hilo escribe por lotes
+    audit.start_writer()
+    # ⏱️ citas vencidas -> pending_review y cola de recordatorios (solo el líder)
+    scheduler.start()
+    # 📡 eventos en vivo entre instancias (solo Postgres con EVENTS_PG_NOTIFY=1)
+    events.start_listener()
+    try:
+        yield
+    finally:
+        events.stop_listener()
+        await scheduler.stop()
+        jobs.stop_workers()
+        # lo que quede en el buffer se escribe antes de salir
+        audit.stop_writer()
+        pdf_archive.shutdown_pool()
+
+
+app = FastAPI(title="NexaCenter", lifespan=lifespan)
 
 # 🔐 Middleware de sesión (LOGIN UI) — SOLO UNA VEZ
 app.add_middleware(
@@ -28,9 +68,23 @@ app.add_middleware(
     same_site="lax",
     https_only=True,  # Render usa HTTPS
 )
+# 🗜️ gzip/brotli para HTML/JSON/CSS/JS por encima de COMPRESS_MIN_BYTES (no toca SSE ni archivos)
+app.add_middleware(CompressionMiddleware)
+# ⏱️ latencia por ruta para /metrics (el último agregado es el más externo: mide todo)
+app.add_middleware(RequestMetricsMiddleware)
 
 # 1) crear tablas (SQLite)
 Base.metadata.create_all(bind=engine)
+# 🧱 columnas e índices nuevos en tablas que ya existían (create_all no los agrega)
+schema.add_missing_columns(engine, Base.metadata)
+schema.add_missing_indexes(engine, Base.metadata)
+# 🌡️ temp (texto) -> temp_c en notas anteriores a la columna
+with SessionLocal() as _db:
+    vitals.backfill_temp_c(_db)
+    # 📋 resumen por paciente (listado): se arma entero solo si está vacío
+    patient_summary.ensure_built(_db)
+# 🔒 sin citas cruzadas a nivel de BD (constraint en Postgres / triggers en SQLite)
+booking.install_overlap_guard(engine)
 
 # 2) rutas
 app.include_router(auth_router)
@@ -42,13 +96,22 @@ app.include_router(scan_router)
 
 app.include_router(ui_router)
 app.include_router(appointments_ui_router)
+app.include_router(agenda_api_router)
+app.include_router(analytics_router)
+app.include_router(events_router)
+app.include_router(ics_router)
+app.include_router(metrics_router)
 app.include_router(encounters_router)
 app.include_router(clinical_notes_router)
 
 app.include_router(pdf_router)
 app.include_router(history_router)
+app.include_router(vitals_router)
+app.include_router(jobs_router)
+app.include_router(blobs_router)
 
-# 3) archivos estáticos
+# 3) archivos estáticos (las plantillas usan /assets/<nombre>.<hash>.<ext>; /static queda por compatibilidad)
+app.include_router(assets_router)
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 
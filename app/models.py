@@ -1,8 +1,9 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Text, Boolean, UniqueConstraint, Index, Float, LargeBinary
+from sqlalchemy.orm import deferred, relationship
 
 from .database import Base
+from .db_types import CompressedText
 
 
 # =========================
@@ -59,7 +60,8 @@ class Appointment(Base):
     end_at = Column(DateTime, nullable=False)
 
     status = Column(String, default="scheduled", nullable=False)
-    # scheduled | confirmed | completed | canceled | no_show
+    # scheduled | confirmed | completed | canceled | no_show | pending_review
+    # (pending_review: ya pasó y nadie la cerró; lo marca el scheduler)
 
     reason = Column(String, nullable=True)
     notes = Column(Text, nullable=True)
@@ -73,7 +75,8 @@ class Appointment(Base):
     )
 
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, nullable=True)
+    # ✅ onupdate: el ETag de /api/agenda depende de que siempre se actualice
+    updated_at = Column(DateTime, nullable=True, onupdate=datetime.utcnow)
 
     doctor = relationship("Doctor", back_populates="appointments")
     patient = relationship("Patient", back_populates="appointments")
@@ -91,6 +94,17 @@ class Appointment(Base):
 # =========================
 class Encounter(Base):
     __tablename__ = "encounters"
+    __table_args__ = (
+        # timeline del paciente: orden (created_at, id) y paginación por cursor
+        Index("ix_encounters_patient_created", "patient_id", "created_at", "id"),
+        # rollups diarios (services/analytics.py) filtran por día
+        Index("ix_encounters_created_at", "created_at"),
+        # archivado: firmadas y cerradas hace más de ARCHIVE_AFTER_DAYS
+        Index("ix_encounters_signed_ended", "is_signed", "ended_at"),
+    )
+
+    # las archivadas se leen como services.encounter_store.ArchivedEncounterView
+    archived = False
 
     id = Column(Integer, primary_key=True, index=True)
 
@@ -103,6 +117,9 @@ class Encounter(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     ended_at = Column(DateTime, nullable=True)
     is_signed = Column(Boolean, default=False, nullable=False)
+    signed_at = Column(DateTime, nullable=True)
+    # ✅ onupdate: el ETag del timeline depende de que siempre se actualice
+    updated_at = Column(DateTime, nullable=True, onupdate=datetime.utcnow)
 
     patient = relationship("Patient", back_populates="encounters")
     doctor = relationship("Doctor", back_populates="encounters")
@@ -125,6 +142,41 @@ class Encounter(Base):
     )
 
 
+# =========================
+# ENCOUNTER ARCHIVADA (FRÍA)
+# =========================
+class ArchivedEncounter(Base):
+    __tablename__ = "encounters_archive"
+    __table_args__ = (
+        Index("ix_encounters_archive_patient_created", "patient_id", "created_at", "id"),
+        Index("ix_encounters_archive_created_at", "created_at"),
+    )
+
+    # mismo id que tenía en encounters (URLs, PDFs y blob_refs siguen valiendo)
+    id = Column(Integer, primary_key=True, autoincrement=False)
+
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False)
+
+    # cabecera en columnas: listados, timeline y rollups no descomprimen nada
+    visit_type = Column(String, nullable=True)
+    chief_complaint_short = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    ended_at = Column(DateTime, nullable=True)
+    signed_at = Column(DateTime, nullable=True)
+
+    # la cita que la originó (en appointments el vínculo queda en NULL)
+    appointment_id = Column(Integer, nullable=True, index=True)
+
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    # zlib(JSON): atención, nota, evoluciones e historial de la nota
+    payload = deferred(Column(LargeBinary, nullable=False))
+
+    patient = relationship("Patient")
+    doctor = relationship("Doctor")
+
+
 # =========================
 # CLINICAL NOTE
 # =========================
@@ -139,15 +191,16 @@ class ClinicalNote(Base):
         unique=True
     )
 
-    chief_complaint = Column(Text, nullable=True)
-    hpi = Column(Text, nullable=True)
+    # ✅ textos largos: comprimidos si TEXT_COMPRESSION está activo (app/db_types.py)
+    chief_complaint = Column(CompressedText, nullable=True)
+    hpi = Column(CompressedText, nullable=True)
 
-    physical_exam = Column(Text, nullable=True)
-    complementary_tests = Column(Text, nullable=True)
-    assessment_dx = Column(Text, nullable=True)
-    plan_treatment = Column(Text, nullable=True)
-    indications_alarm_signs = Column(Text, nullable=True)
-    follow_up = Column(Text, nullable=True)
+    physical_exam = Column(CompressedText, nullable=True)
+    complementary_tests = Column(CompressedText, nullable=True)
+    assessment_dx = Column(CompressedText, nullable=True)
+    plan_treatment = Column(CompressedText, nullable=True)
+    indications_alarm_signs = Column(CompressedText, nullable=True)
+    follow_up = Column(CompressedText, nullable=True)
 
     ta_sys = Column(Integer, nullable=True)
     ta_dia = Column(Integer, nullable=True)
@@ -155,10 +208,35 @@ class ClinicalNote(Base):
     rr = Column(Integer, nullable=True)
     temp = Column(String, nullable=True)
     spo2 = Column(Integer, nullable=True)
+    # temp interpretada en °C (services/vitals.parse_temp), para series y alertas
+    temp_c = Column(Float, nullable=True)
+
+    # ✅ concurrencia optimista: cada guardado suma 1 (PATCH /encounters/{id}/note)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(DateTime, nullable=True, onupdate=datetime.utcnow)
 
     encounter = relationship("Encounter", back_populates="note")
 
 
+# =========================
+# CLINICAL NOTE REVISION (historial append-only)
+# =========================
+class ClinicalNoteRevision(Base):
+    __tablename__ = "clinical_note_revisions"
+    __table_args__ = (UniqueConstraint("encounter_id", "version", name="uq_note_revision_version"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    # la nota es única por atención: se indexa por encounter_id para no tener que leerla al guardar
+    encounter_id = Column(Integer, ForeignKey("encounters.id"), nullable=False, index=True)
+    version = Column(Integer, nullable=False)
+
+    kind = Column(String, nullable=False)  # snapshot | delta
+    data = Column(Text, nullable=False)    # JSON: todos los campos (snapshot) o solo los que cambiaron (delta)
+
+    author_doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 # =========================
 # ENCOUNTER EVOLUTION
 # =========================
@@ -171,7 +249,7 @@ class EncounterEvolution(Base):
     author_doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
-    content = Column(Text, nullable=False)
+    content = Column(CompressedText, nullable=False)
 
     encounter = relationship("Encounter", back_populates="evolutions")
 
@@ -188,7 +266,185 @@ class Attendance(Base):
     doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=True)
 
     session_number = Column(Integer, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
 
     patient = relationship("Patient", back_populates="attendances")
     doctor = relationship("Doctor", backref="attendances")
+
+
+# =========================
+# JOB (TAREAS EN SEGUNDO PLANO)
+# =========================
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True)  # uuid4 hex
+
+    kind = Column(String, nullable=False, index=True)
+    status = Column(String, default="queued", nullable=False, index=True)
+    # queued | running | done | failed
+
+    params = Column(Text, nullable=True)  # JSON
+    progress = Column(Integer, default=0, nullable=False)  # 0–100
+    message = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+
+    artifact_sha256 = Column(String(64), nullable=True)
+    artifact_name = Column(String, nullable=True)
+    artifact_media_type = Column(String, nullable=True)
+
+    requested_by = Column(Integer, ForeignKey("doctors.id"), nullable=True, index=True)
+
+    run_after = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # lo renueva el proceso que lo ejecuta; vencido -> se puede volver a encolar
+    heartbeat_at = Column(DateTime, nullable=True)
+    # veces que un worker lo tomó (las vueltas a la cola por latido vencido cuentan)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+# =========================
+# BLOB (ALMACÉN DIRECCIONADO POR CONTENIDO)
+# =========================
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+
+    size_bytes = Column(Integer, nullable=False, default=0)
+    media_type = Column(String, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_access_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    refs = relationship("BlobRef", back_populates="blob")
+
+
+class BlobRef(Base):
+    __tablename__ = "blob_refs"
+    __table_args__ = (UniqueConstraint("owner_type", "owner_id", "role", name="uq_blob_ref_owner_role"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), ForeignKey("blobs.sha256"), nullable=False, index=True)
+
+    # quién usa el archivo: ("encounter", 12, "pdf"), ("patient", 3, "qr"), ("job", "<uuid>", "artifact")...
+    owner_type = Column(String, nullable=False)
+    owner_id = Column(String, nullable=False)
+    role = Column(String, nullable=False)
+
+    # huella de los datos de origen (si cambian, hay que regenerar)
+    source_fingerprint = Column(String(64), nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    blob = relationship("Blob", back_populates="refs")
+
+
+# =========================
+# RECORDATORIOS DE CITAS (COLA)
+# =========================
+class AppointmentReminder(Base):
+    __tablename__ = "appointment_reminders"
+    __table_args__ = (UniqueConstraint("appointment_id", "start_at", name="uq_reminder_appt_start"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    appointment_id = Column(Integer, ForeignKey("appointments.id"), nullable=False, index=True)
+
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False, index=True)
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False, index=True)
+
+    remind_for = Column(DateTime, nullable=False, index=True)  # día de la cita (00:00)
+    start_at = Column(DateTime, nullable=False)  # hora de la cita al encolar (si se reagenda, se cancela)
+
+    status = Column(String, default="pending", nullable=False, index=True)
+    # pending | sent | canceled
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+
+
+# =========================
+# LOCKS DE TAREAS PROGRAMADAS (ELECCIÓN DE LÍDER)
+# =========================
+class SchedulerLock(Base):
+    __tablename__ = "scheduler_locks"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+# =========================
+# ROLLUP DIARIO POR DOCTOR (ANALÍTICA)
+# =========================
+class DailyDoctorStats(Base):
+    __tablename__ = "daily_doctor_stats"
+    __table_args__ = (UniqueConstraint("day", "doctor_id", name="uq_daily_doctor_stats"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False, index=True)
+    doctor_id = Column(Integer, nullable=False, index=True)  # 0 = check-in sin doctor
+
+    checkins = Column(Integer, default=0, nullable=False)
+    protocol_starts = Column(Integer, default=0, nullable=False)       # sesión 1
+    protocol_completions = Column(Integer, default=0, nullable=False)  # última sesión del protocolo
+
+    appointments = Column(Integer, default=0, nullable=False)          # sin contar canceladas
+    appointments_completed = Column(Integer, default=0, nullable=False)
+    appointments_no_show = Column(Integer, default=0, nullable=False)
+    appointments_canceled = Column(Integer, default=0, nullable=False)
+
+    encounters = Column(Integer, default=0, nullable=False)
+    encounters_closed = Column(Integer, default=0, nullable=False)
+    encounter_minutes = Column(Float, default=0, nullable=False)       # suma de (ended_at - created_at)
+
+    computed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+# =========================
+# RESUMEN POR PACIENTE (PROYECCIÓN PARA LISTADOS)
+# =========================
+class PatientSummary(Base):
+    __tablename__ = "patient_summary"
+
+    # mantenida por services/patient_summary.py en el mismo flush que la cambia
+    patient_id = Column(Integer, ForeignKey("patients.id"), primary_key=True)
+
+    encounter_count = Column(Integer, default=0, nullable=False)
+    last_visit_at = Column(DateTime, nullable=True, index=True)
+    last_doctor_id = Column(Integer, nullable=True)
+    last_doctor_name = Column(String, nullable=True)
+
+    next_appointment_at = Column(DateTime, nullable=True, index=True)
+    next_appointment_id = Column(Integer, nullable=True)
+
+    last_checkin_at = Column(DateTime, nullable=True)
+
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+# =========================
+# AUDITORÍA DE ACCESOS (APPEND-ONLY)
+# =========================
+class AuditEvent(Base):
+    __tablename__ = "audit_log"
+    __table_args__ = (
+        # "¿quién vio esta atención / nota / PDF?"
+        Index("ix_audit_log_resource", "resource", "resource_id", "at"),
+        # "¿qué vio este doctor?"
+        Index("ix_audit_log_doctor_at", "doctor_id", "at"),
+    )
+
+    # lo escribe services/audit.py por lotes; sin FKs: el registro sobrevive a borrados
+    id = Column(Integer, primary_key=True)
+    at = Column(DateTime, nullable=False, index=True)
+
+    doctor_id = Column(Integer, nullable=True)
+    action = Column(String, nullable=False)    # view | create | edit | close | sign | download
+    resource = Column(String, nullable=False)  # encounter | note | note_revision | evolution | vitals | pdf | patient_history_pdf
+    resource_id = Column(String, nullable=False)
+    patient_id = Column(Integer, nullable=True, index=True)
+
+    ip = Column(String, nullable=True)
@@ -0,0 +1,102 @@
+# =========================
+# ✅ app/request_metrics.py
+# (Métricas por ruta: latencia, requests en curso, threadpool y pool de BD)
+# =========================
+"""
+Middleware ASGI que mide cada request HTTP y lo registra en services/metrics:
+
+- nexa_http_request_duration_seconds{method,route}: histograma (p50/p99 con
+  histogram_quantile en Prometheus);
+- nexa_http_requests_total{method,route,status};
+- nexa_http_requests_in_flight.
+
+`route` es la plantilla de la ruta ("/encounters/{encounter_id}/pdf"), no la
+URL, para que las etiquetas no crezcan con cada id. Lo que no matchea ninguna
+ruta (404) va como "<unmatched>".
+
+Además, al arrancar cada request se toma una muestra del threadpool de anyio
+(donde corren los handlers `def`), y el pool de conexiones de la BD se lee
+al exponer. Las duraciones se miden hasta el último trozo del cuerpo, así
+que incluyen la compresión y las respuestas en streaming.
+"""
+import time
+
+import anyio.to_thread
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .database import engine
+from .services import metrics
+
+UNMATCHED = "<unmatched>"
+
+REQUEST_SECONDS = metrics.histogram(
+    "nexa_http_request_duration_seconds", "Duración de los requests HTTP por ruta", ["method", "route"]
+)
+REQUESTS = metrics.counter("nexa_http_requests_total", "Requests HTTP por ruta y status", ["method", "route", "status"])
+IN_FLIGHT = metrics.gauge("nexa_http_requests_in_flight", "Requests HTTP en curso")
+THREADPOOL = metrics.gauge(
+    "nexa_threadpool_threads", "Threadpool de anyio al llegar el último request (busy, limit, waiting)", ["state"]
+)
+
+
+def _db_pool() -> dict:
+    pool = engine.pool
+    # QueuePool (Postgres, SQLite en archivo); otros pools no llevan la cuenta
+    if not hasattr(pool, "checkedout"):
+        return {}
+    return {
+        "in_use": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "size": pool.size(),
+    }
+
+
+metrics.gauge("nexa_db_pool_connections", "Conexiones del pool de la BD (in_use, idle, overflow, size)", ["state"], fn=_db_pool)
+
+
+def _route_label(scope: Scope, root_path: str) -> str:
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    # Mount (StaticFiles): el router deja el prefijo en root_path
+    mounted = scope.get("root_path", "")
+    if mounted != root_path:
+        return mounted[len(root_path):] + "/{path}"
+    return UNMATCHED
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = anyio.to_thread.current_default_thread_limiter().statistics()
+        THREADPOOL.set(stats.borrowed_tokens, state="busy")
+        THREADPOOL.set(stats.total_tokens, state="limit")
+        THREADPOOL.set(stats.tasks_waiting, state="waiting")
+
+        root_path = scope.get("root_path", "")
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t0
+            IN_FLIGHT.dec()
+            method = scope["method"]
+            route = _route_label(scope, root_path)
+            REQUEST_SECONDS.observe(elapsed, method=method, route=route)
+            REQUESTS.inc(method=method, route=route, status=status)
@@ -0,0 +1,233 @@
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .. import clinic_time
+from ..database import get_db
+from ..models import Appointment, Patient, Doctor
+from ..services import booking, slots
+from .auth import get_logged_doctor
+
+router = APIRouter(prefix="/api", tags=["Agenda API"])
+
+MAX_RANGE_DAYS = 62
+
+
+def _require_doctor(request: Request, db: Session) -> Doctor:
+    doctor = get_logged_doctor(request, db)
+    if not doctor:
+        raise HTTPException(status_code=401, detail="Sesión requerida")
+    return doctor
+
+
+def _parse_range(date_from: str, date_to: str):
+    try:
+        d_from = datetime.strptime(date_from, "%Y-%m-%d").date()
+        d_to = datetime.strptime(date_to, "%Y-%m-%d").date()
+    except Exception:
+        raise HTTPException(status_code=400, detail="from/to inválidos (YYYY-MM-DD)")
+    if d_to < d_from:
+        raise HTTPException(status_code=400, detail="to debe ser >= from")
+    if (d_to - d_from).days + 1 > MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Rango máximo: {MAX_RANGE_DAYS} días")
+
+    start_dt = datetime(d_from.year, d_from.month, d_from.day)
+    end_dt = datetime(d_to.year, d_to.month, d_to.day) + timedelta(days=1)
+    return d_from, d_to, start_dt, end_dt
+
+
+def agenda_etag(db: Session, doctor_id: int, start_dt: datetime, end_dt: datetime) -> str:
+    """
+    ETag débil del rango: cambia si se crea, edita, cancela o reagenda alguna
+    cita del doctor en ese rango (incluye canceladas a propósito).
+    """
+    max_upd, max_created, count = (
+        db.query(
+            func.max(Appointment.updated_at),
+            func.max(Appointment.created_at),
+            func.count(Appointment.id),
+        )
+        .filter(Appointment.doctor_id == doctor_id)
+        .filter(Appointment.start_at >= start_dt)
+        .filter(Appointment.start_at < end_dt)
+        .one()
+    )
+    stamp = max(
+        (v for v in (max_upd, max_created) if v is not None),
+        default=None,
+    )
+    stamp_s = stamp.strftime("%Y%m%d%H%M%S%f") if stamp else "0"
+    return f'W/"ag-{doctor_id}-{start_dt:%Y%m%d}-{end_dt:%Y%m%d}-{stamp_s}-{count}"'
+
+
+@router.get("/agenda")
+def get_agenda(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    date_from: str = Query(..., alias="from"),
+    date_to: str = Query(..., alias="to"),
+):
+    """
+    Citas no canceladas del doctor en sesión entre from y to (ambos incluidos).
+    Uso: /api/agenda?from=2026-10-18&to=2026-10-26
+    """
+    current_doctor = _require_doctor(request, db)
+    d_from, d_to, start_dt, end_dt = _parse_range(date_from, date_to)
+
+    etag = agenda_etag(db, current_doctor.id, start_dt, end_dt)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    rows = (
+        db.query(
+            Appointment.id,
+            Appointment.start_at,
+            Appointment.end_at,
+            Appointment.status,
+            Appointment.reason,
+            Appointment.patient_id,
+            Patient.full_name,
+        )
+        .join(Patient, Patient.id == Appointment.patient_id)
+        .filter(Appointment.doctor_id == current_doctor.id)
+        .filter(Appointment.start_at >= start_dt)
+        .filter(Appointment.start_at < end_dt)
+        .filter(Appointment.status != "canceled")
+        .order_by(Appointment.start_at.asc())
+        .all()
+    )
+
+    response.headers.update(headers)
+    return {
+        "from": d_from.isoformat(),
+        "to": d_to.isoformat(),
+        "rows": [
+            {
+                "id": r.id,
+                "day": r.start_at.date().isoformat(),
+                "start": r.start_at.strftime("%H:%M"),
+                "end": r.end_at.strftime("%H:%M"),
+                "duration_min": int((r.end_at - r.start_at).total_seconds() // 60),
+                "status": r.status,
+                "reason": r.reason,
+                "patient_id": r.patient_id,
+                "patient": r.full_name,
+            }
+            for r in rows
+        ],
+    }
+
+
+@router.get("/doctors/{doctor_id}/free-slots")
+def get_free_slots(
+    doctor_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    date_from: str = Query(..., alias="from"),
+    date_to: str = Query(..., alias="to"),
+    duration: int = Query(30),
+):
+    """
+    Horarios libres del doctor dentro del horario laboral.
+    Uso: /api/doctors/1/free-slots?from=2026-10-20&to=2026-10-31&duration=45
+    """
+    _require_doctor(request, db)
+    if not db.query(Doctor.id).filter(Doctor.id == doctor_id).first():
+        raise HTTPException(status_code=404, detail="Doctor no encontrado")
+    if duration < 10 or duration > 240:
+        raise HTTPException(status_code=400, detail="Duración inválida (10–240 min)")
+
+    d_from, d_to, _, _ = _parse_range(date_from, date_to)
+    result = slots.free_slots(db, doctor_id, d_from, d_to, duration)
+
+    return {
+        "doctor_id": doctor_id,
+        "from": d_from.isoformat(),
+        "to": d_to.isoformat(),
+        "duration_min": duration,
+        "step_min": slots.SLOT_STEP_MIN,
+        "slots": [
+            {"day": s.date().isoformat(), "start": s.strftime("%H:%M"), "end": e.strftime("%H:%M")}
+            for s, e in result["slots"]
+        ],
+        "gaps": [{"start": s.isoformat(), "end": e.isoformat()} for s, e in result["gaps"]],
+    }
+
+
+@router.post("/appointments/series")
+def book_appointment_series(payload: dict, request: Request, db: Session = Depends(get_db)):
+    """
+    Agenda una serie semanal para un protocolo de sesiones.
+
+    {"patient_id": 1, "start_date": "2026-10-20", "weekdays": [0, 2, 4],
+     "time": "09:00", "duration_min": 45, "sessions": 10,
+     "reason": "Fisioterapia", "skip_conflicts": false}
+
+    Si hay choques y skip_conflicts es false no se agenda nada (409) y se
+    devuelven las fechas en conflicto con alternativas.
+    """
+    current_doctor = _require_doctor(request, db)
+
+    try:
+        patient_id = int(payload.get("patient_id"))
+        start_date = datetime.strptime(str(payload.get("start_date")), "%Y-%m-%d").date()
+        weekdays = [int(w) for w in payload.get("weekdays") or []]
+        at = datetime.strptime(str(payload.get("time")), "%H:%M").time()
+        duration_min = int(payload.get("duration_min") or 60)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Datos inválidos (patient_id, start_date, weekdays, time)")
+
+    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Paciente no encontrado")
+
+    if not weekdays or any(w < 0 or w > 6 for w in weekdays):
+        raise HTTPException(status_code=400, detail="weekdays: lista de 0 (lunes) a 6 (domingo)")
+    if duration_min < 10 or duration_min > 240:
+        raise HTTPException(status_code=400, detail="Duración inválida (10–240 min)")
+
+    # por defecto: las sesiones que le faltan al protocolo del paciente
+    remaining = (patient.total_sessions or 0) - (patient.completed_sessions or 0)
+    sessions = int(payload.get("sessions") or remaining or 0)
+    if sessions < 1 or sessions > 60:
+        raise HTTPException(status_code=400, detail="sessions debe estar entre 1 y 60")
+
+    occurrences = booking.series_occurrences(
+        start_date, weekdays, at, sessions, timedelta(minutes=duration_min)
+    )
+    if occurrences[0][0] < clinic_time.now() - timedelta(minutes=1):
+        raise HTTPException(status_code=400, detail="La serie no puede empezar en el pasado")
+
+    reason = (payload.get("reason") or "").strip()[:120] or None
+    try:
+        result = booking.book_series(
+            db, current_doctor.id, patient.id, occurrences,
+            reason=reason, skip_conflicts=bool(payload.get("skip_conflicts")),
+        )
+    except booking.SlotTaken:
+        raise HTTPException(status_code=409, detail="La agenda cambió mientras se agendaba, intenta de nuevo")
+
+    body = {
+        "requested": len(occurrences),
+        "created": [
+            {"id": a["id"], "day": a["start"].date().isoformat(), "start": a["start"].strftime("%H:%M"),
+             "end": a["end"].strftime("%H:%M")}
+            for a in result.created
+        ],
+        "conflicts": [
+            {
+                "day": c["start"].date().isoformat(),
+                "start": c["start"].strftime("%H:%M"),
+                "end": c["end"].strftime("%H:%M"),
+                "alternatives": [a.strftime("%Y-%m-%d %H:%M") for a in c["alternatives"]],
+            }
+            for c in result.conflicts
+        ],
+    }
+    if result.conflicts and not result.created:
+        return JSONResponse(status_code=409, content=body)
+    return body
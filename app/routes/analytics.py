@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..deps.auth import get_doctor_bearer_or_session
+from ..models import Doctor
+from ..services import analytics
+
+router = APIRouter(prefix="/api", tags=["Analytics"])
+
+MAX_RANGE_DAYS = 3 * 366
+
+
+@router.get("/analytics")
+def get_analytics(
+    date_from: str | None = Query(default=None, alias="from"),
+    date_to: str | None = Query(default=None, alias="to"),
+    doctor_id: int | None = None,
+    group: str = "doctor",
+    db: Session = Depends(get_db),
+    current_doctor: Doctor = Depends(get_doctor_bearer_or_session),
+):
+    """
+    Operación de la clínica entre `from` y `to` (YYYY-MM-DD, por defecto los
+    últimos 30 días), agrupada por doctor o por día: check-ins, protocolos
+    completados, tasa de no-show y duración media de la atención.
+    Lee solo los rollups diarios (ver services/analytics.py).
+    """
+    if group not in ("doctor", "day"):
+        raise HTTPException(status_code=400, detail="group debe ser doctor o day")
+
+    today = datetime.utcnow().date()
+    try:
+        d_to = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else today
+        d_from = datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else d_to - timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from/to inválidos (YYYY-MM-DD)")
+    if d_to < d_from:
+        raise HTTPException(status_code=400, detail="to debe ser >= from")
+    if (d_to - d_from).days + 1 > MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Rango máximo: {MAX_RANGE_DAYS} días")
+
+    return analytics.summary(db, d_from, d_to, doctor_id=doctor_id, group=group)
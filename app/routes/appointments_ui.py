@@ -1,16 +1,17 @@
 from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, Request, HTTPException, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from starlette.status import HTTP_303_SEE_OTHER
 
+from .. import clinic_time
 from ..database import get_db
-from ..models import Appointment, Patient, Encounter
+from ..models import Appointment, ArchivedEncounter, Patient, Encounter
+from ..services import booking, events
+from ..templating import templates
 from .auth import get_logged_doctor
 
 router = APIRouter(tags=["Appointments UI"])
-templates = Jinja2Templates(directory="app/templates")
 
 
 def _redirect_login():
@@ -33,27 +34,8 @@ def _parse_date(s: str | None):
         return None
 
 
-def _overlaps(
-    db: Session,
-    doctor_id: int,
-    start_at: datetime,
-    end_at: datetime,
-    exclude_id: int | None = None,
-) -> bool:
-    q = (
-        db.query(Appointment)
-        .filter(Appointment.doctor_id == doctor_id)
-        .filter(Appointment.status != "canceled")
-        .filter(Appointment.start_at < end_at)
-        .filter(Appointment.end_at > start_at)
-    )
-    if exclude_id:
-        q = q.filter(Appointment.id != exclude_id)
-    return db.query(q.exists()).scalar()
-
-
 def _can_start_now(appt: Appointment) -> bool:
-    now = datetime.utcnow()
+    now = clinic_time.now()
     start_window = appt.start_at - timedelta(minutes=15)
     end_window = appt.end_at + timedelta(minutes=30)
     return start_window <= now <= end_window
@@ -67,7 +49,7 @@ def new_appointment_form(request: Request, db: Session = Depends(get_db), date:
 
     d = _parse_date(date)
     if d is None:
-        d = datetime.utcnow().date()
+        d = clinic_time.today()
 
     patients = db.query(Patient).order_by(Patient.full_name.asc()).all()
 
@@ -108,7 +90,7 @@ def create_appointment(
     except Exception:
         raise HTTPException(status_code=400, detail="Hora inválida")
 
-    if start_at < datetime.utcnow() - timedelta(minutes=1):
+    if start_at < clinic_time.now() - timedelta(minutes=1):
         patients = db.query(Patient).order_by(Patient.full_name.asc()).all()
         return templates.TemplateResponse(
             "appointment_new.html",
@@ -127,7 +109,19 @@ def create_appointment(
 
     end_at = start_at + timedelta(minutes=duration_min)
 
-    if _overlaps(db, current_doctor.id, start_at, end_at):
+    # ✅ el chequeo y el insert van en la misma escritura serializada;
+    # si aun así hay carrera, el constraint de la BD la rechaza (SlotTaken)
+    try:
+        booking.book(
+            db,
+            doctor_id=current_doctor.id,
+            patient_id=patient_id,
+            start_at=start_at,
+            end_at=end_at,
+            reason=(reason or "").strip()[:120] if reason else None,
+            notes=(notes or "").strip() if notes else None,
+        )
+    except booking.SlotTaken:
         patients = db.query(Patient).order_by(Patient.full_name.asc()).all()
         return templates.TemplateResponse(
             "appointment_new.html",
@@ -141,19 +135,6 @@ def create_appointment(
             status_code=400,
         )
 
-    appt = Appointment(
-        doctor_id=current_doctor.id,
-        patient_id=patient_id,
-        start_at=start_at,
-        end_at=end_at,
-        status="scheduled",
-        reason=(reason or "").strip()[:120] if reason else None,
-        notes=(notes or "").strip() if notes else None,
-        updated_at=datetime.utcnow(),
-    )
-    db.add(appt)
-    db.commit()
-
     return RedirectResponse(url=f"/app?date={d.isoformat()}", status_code=HTTP_303_SEE_OTHER)
 
 
@@ -173,8 +154,9 @@ def cancel_appointment(appointment_id: int, request: Request, db: Session = Depe
     appt.status = "canceled"
     appt.updated_at = datetime.utcnow()
     db.commit()
+    events.publish(appt.doctor_id, "appointment", events.appointment_payload(appt, "canceled"))
 
-    d = _parse_date(date) or datetime.utcnow().date()
+    d = _parse_date(date) or clinic_time.today()
     return RedirectResponse(url=f"/app?date={d.isoformat()}", status_code=HTTP_303_SEE_OTHER)
 
 
@@ -208,7 +190,7 @@ def reschedule_appointment(
     except Exception:
         raise HTTPException(status_code=400, detail="Hora inválida")
 
-    if start_at < datetime.utcnow() - timedelta(minutes=1):
+    if start_at < clinic_time.now() - timedelta(minutes=1):
         raise HTTPException(status_code=400, detail="No puedes reagendar una cita al pasado")
 
     if duration_min < 10 or duration_min > 240:
@@ -216,14 +198,11 @@ def reschedule_appointment(
 
     end_at = start_at + timedelta(minutes=duration_min)
 
-    if _overlaps(db, current_doctor.id, start_at, end_at, exclude_id=appt.id):
+    try:
+        booking.reschedule(db, appt, start_at, end_at)
+    except booking.SlotTaken:
         raise HTTPException(status_code=400, detail="Ese horario ya está ocupado")
 
-    appt.start_at = start_at
-    appt.end_at = end_at
-    appt.updated_at = datetime.utcnow()
-    db.commit()
-
     return RedirectResponse(url=f"/app?date={d.isoformat()}", status_code=HTTP_303_SEE_OTHER)
 
 
@@ -254,15 +233,20 @@ def start_encounter_from_appointment(
     if appt.status == "no_show":
         raise HTTPException(status_code=400, detail="La cita está marcada como No asiste")
 
+    # al archivarse la atención, la cita pierde encounter_id (queda en el archivo)
+    encounter_id = appt.encounter_id or (
+        db.query(ArchivedEncounter.id).filter(ArchivedEncounter.appointment_id == appt.id).scalar()
+    )
+
     if appt.status == "completed":
         # si ya está atendida pero tiene encounter, abrirlo
-        if appt.encounter_id:
-            return RedirectResponse(url=f"/app/encounters/{appt.encounter_id}", status_code=HTTP_303_SEE_OTHER)
+        if encounter_id:
+            return RedirectResponse(url=f"/app/encounters/{encounter_id}", status_code=HTTP_303_SEE_OTHER)
         raise HTTPException(status_code=400, detail="La cita ya fue atendida")
 
     # Si ya existe encounter, ir directo
-    if appt.encounter_id:
-        return RedirectResponse(url=f"/app/encounters/{appt.encounter_id}", status_code=HTTP_303_SEE_OTHER)
+    if encounter_id:
+        return RedirectResponse(url=f"/app/encounters/{encounter_id}", status_code=HTTP_303_SEE_OTHER)
 
     # ⏱️ validar ventana de inicio
     if not _can_start_now(appt):
@@ -288,6 +272,7 @@ def start_encounter_from_appointment(
     appt.encounter_id = enc.id
     appt.updated_at = datetime.utcnow()
     db.commit()
+    events.publish(appt.doctor_id, "appointment", events.appointment_payload(appt, "started"))
 
     return RedirectResponse(url=f"/app/encounters/{enc.id}", status_code=HTTP_303_SEE_OTHER)
 
@@ -333,6 +318,7 @@ def mark_no_show(
         appt.notes = entry
 
     db.commit()
+    events.publish(appt.doctor_id, "appointment", events.appointment_payload(appt, "no_show"))
 
-    d = _parse_date(date) or datetime.utcnow().date()
+    d = _parse_date(date) or clinic_time.today()
     return RedirectResponse(url=f"/app?date={d.isoformat()}", status_code=HTTP_303_SEE_OTHER)
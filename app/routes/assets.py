@@ -0,0 +1,17 @@
+from fastapi import APIRouter, HTTPException, Request
+
+from ..services import assets
+
+router = APIRouter(tags=["Assets"])
+
+
+@router.get(assets.ASSETS_PREFIX + "/{name:path}", include_in_schema=False)
+def hashed_asset(name: str, request: Request):
+    """
+    Assets con huella en el nombre (ver services/assets.py): caché inmutable,
+    precomprimidos con gzip/brotli.
+    """
+    item = assets.lookup(name)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Asset no encontrado")
+    return item.response(request, assets.IMMUTABLE)
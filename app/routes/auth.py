@@ -5,15 +5,14 @@
 from datetime import datetime
 from fastapi import APIRouter, Depends, Request, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 from ..database import get_db
 from ..models import Doctor
+from ..templating import templates
 
 router = APIRouter(tags=["Auth UI"])
-templates = Jinja2Templates(directory="app/templates")
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..deps.auth import get_current_doctor
+from ..models import Blob, BlobRef, Doctor, Job
+from ..services import audit, blobstore, encounter_store, jobs
+
+router = APIRouter(prefix="/blobs", tags=["Blobs"])
+
+
+def _allowed(db: Session, ref: BlobRef, current_doctor: Doctor) -> bool:
+    # 🔒 mismas reglas que la ruta dueña del archivo
+    if ref.owner_type == "job":
+        job = db.get(Job, ref.owner_id)
+        return job is not None and job.requested_by in (None, current_doctor.id)
+    # PDFs de atenciones, QR de pacientes y export: cualquier médico autenticado
+    return ref.owner_type in ("encounter", "patient", "export")
+
+
+def _audit_pdf(db: Session, ref: BlobRef, current_doctor: Doctor, request: Request):
+    if ref.owner_type == "encounter":
+        enc = encounter_store.get(db, int(ref.owner_id))
+        audit.record("download", "pdf", ref.owner_id, current_doctor.id, enc.patient_id if enc else None, request)
+        return
+    if ref.owner_type == "job":
+        jobs.record_artifact_download(db.get(Job, ref.owner_id), current_doctor.id, request)
+        return
+    audit.record("download", "blob", ref.sha256, current_doctor.id, request=request)
+
+
+@router.get("/{sha256}")
+def download_blob(
+    sha256: str,
+    request: Request,
+    filename: str | None = None,
+    db: Session = Depends(get_db),
+    current_doctor: Doctor = Depends(get_current_doctor),
+):
+    blob = db.get(Blob, sha256)
+    if not blob or not blobstore.available(sha256):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    # sin referencias (huérfano) no se sirve; con referencias, alguna tiene que ser visible
+    refs = db.query(BlobRef).filter(BlobRef.sha256 == sha256).all()
+    ref = next((r for r in refs if _allowed(db, r, current_doctor)), None)
+    if ref is None:
+        if refs:
+            raise HTTPException(status_code=403, detail="No autorizado")
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    if blob.media_type == "application/pdf":
+        _audit_pdf(db, ref, current_doctor, request)
+
+    blobstore.touch(db, sha256)
+    db.commit()
+    return blobstore.response(request, sha256, blob.media_type, filename)
@@ -1,14 +1,32 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from .. import clinic_time
 from ..database import get_db
 from ..deps.auth import get_current_doctor
-from ..models import Patient, Attendance, Doctor
+from ..models import Appointment, Patient, Attendance, Doctor
+from ..services import events
 
 router = APIRouter(prefix="/checkin", tags=["Check-in"])
 
 
+def _todays_appointment(db: Session, patient_id: int) -> Appointment | None:
+    """
+    Cita de hoy del paciente más cercana a la hora actual (la que vino a cumplir).
+    """
+    now = clinic_time.now()
+    day = datetime.combine(now.date(), datetime.min.time())
+    rows = (
+        db.query(Appointment)
+        .filter(Appointment.patient_id == patient_id)
+        .filter(Appointment.status.notin_(("canceled", "no_show")))
+        .filter(Appointment.start_at >= day, Appointment.start_at < day + timedelta(days=1))
+        .all()
+    )
+    return min(rows, key=lambda a: abs(a.start_at - now), default=None)
+
+
 @router.post("/{qr_code}")
 def check_in_patient(qr_code: str, db: Session = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
     # 1) buscar paciente por QR
@@ -42,6 +60,19 @@ def check_in_patient(qr_code: str, db: Session = Depends(get_db), current_doctor
 
     db.commit()
 
+    # 📣 el aviso es para el médico de la cita (recepción escanea con su cuenta);
+    # quien escaneó también lo ve
+    appt = _todays_appointment(db, patient.id)
+    payload = {
+        "patient_id": patient.id,
+        "patient": patient.full_name,
+        "session": patient.completed_sessions,
+        "total_sessions": patient.total_sessions,
+        "appointment_id": appt.id if appt else None,
+    }
+    for doctor_id in {appt.doctor_id if appt else current_doctor.id, current_doctor.id}:
+        events.publish(doctor_id, "checkin", payload)
+
     return {
         "patient": patient.full_name,
         "session": patient.completed_sessions,
@@ -1,15 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 
 from ..database import get_db
-from ..deps.auth import get_current_doctor
+from ..deps.auth import get_current_doctor, get_doctor_bearer_or_session
 from ..models import Doctor, Encounter, ClinicalNote
+from ..services import audit, encounter_store, note_revisions, vitals
+from ..services.note_revisions import NOTE_INT_FIELDS, NOTE_TEXT_FIELDS
 
 router = APIRouter(prefix="/encounters", tags=["Clinical Notes"])
 
+# campos de la cabecera de la atención que también edita el formulario (máx. largo)
+ENCOUNTER_FIELDS = {"visit_type": 50, "chief_complaint_short": 120}
+
 
 def _can_edit_encounter(enc: Encounter) -> bool:
+    # Firmada → solo lectura
+    if enc.is_signed:
+        return False
     # Si está abierta → editable
     if enc.ended_at is None:
         return True
@@ -18,13 +28,17 @@ def _can_edit_encounter(enc: Encounter) -> bool:
 
 
 @router.get("/{encounter_id}/note")
-def get_note(encounter_id: int, db: Session = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
-    enc = db.query(Encounter).filter(Encounter.id == encounter_id).first()
+def get_note(encounter_id: int, request: Request, db: Session = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
+    enc = encounter_store.get(db, encounter_id)
     if not enc:
         raise HTTPException(status_code=404, detail="Consulta no encontrada")
+    audit.record("view", "note", encounter_id, current_doctor.id, enc.patient_id, request)
 
     # ✅ Todos pueden ver la nota (historial compartido)
-    note = db.query(ClinicalNote).filter(ClinicalNote.encounter_id == encounter_id).first()
+    if enc.archived:
+        note = enc.note
+    else:
+        note = db.query(ClinicalNote).filter(ClinicalNote.encounter_id == encounter_id).first()
     if not note:
         return {"encounter_id": encounter_id, "note": None}
 
@@ -46,12 +60,13 @@ def get_note(encounter_id: int, db: Session = Depends(get_db), current_doctor: D
             "rr": note.rr,
             "temp": note.temp,
             "spo2": note.spo2,
+            "version": note.version,
         },
     }
 
 
 @router.put("/{encounter_id}/note")
-def upsert_note(encounter_id: int, payload: dict, db: Session = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
+def upsert_note(encounter_id: int, payload: dict, request: Request, db: Session = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
     enc = db.query(Encounter).filter(Encounter.id == encounter_id).first()
     if not enc:
         raise HTTPException(status_code=404, detail="Consulta no encontrada")
@@ -64,13 +79,17 @@ def upsert_note(encounter_id: int, payload: dict, db: Session = Depends(get_db),
     if not _can_edit_encounter(enc):
         raise HTTPException(
             status_code=403,
-            detail="Ventana de edición cerrada (20 min). Agrega corrección como Evolución/Addendum."
+            detail="Atención firmada o ventana de edición cerrada (20 min). Agrega corrección como Evolución/Addendum."
         )
 
     note = db.query(ClinicalNote).filter(ClinicalNote.encounter_id == encounter_id).first()
     if not note:
-        note = ClinicalNote(encounter_id=encounter_id)
+        note = ClinicalNote(encounter_id=encounter_id, version=1)
         db.add(note)
+        before = {}
+    else:
+        note.version = (note.version or 0) + 1  # invalida autosaves abiertos con la versión vieja
+        before = note_revisions.note_values(note)
 
     # Campos texto
     for field in [
@@ -91,7 +110,215 @@ def upsert_note(encounter_id: int, payload: dict, db: Session = Depends(get_db),
         if field in payload:
             setattr(note, field, payload.get(field))
 
+    # 🧾 historial: delta de lo que cambió respecto de la versión anterior
+    note_revisions.record(
+        db, encounter_id, note.version,
+        note_revisions.diff(before, note_revisions.note_values(note)),
+        current_doctor.id,
+    )
     db.commit()
     db.refresh(note)
+    audit.record("edit", "note", encounter_id, current_doctor.id, enc.patient_id, request)
+
+    return {"message": "Nota clínica guardada ✅", "note_id": note.id, "version": note.version}
+
+
+def _clean_changes(changes: dict) -> tuple[dict, dict]:
+    """
+    Separa y normaliza los cambios: (campos de la nota, campos de la atención).
+    Un campo desconocido o un número inválido -> 422 (no se guarda nada).
+    """
+    note_values, enc_values = {}, {}
+    for field, value in changes.items():
+        if value is not None and not isinstance(value, (str, int, float)):
+            raise HTTPException(status_code=422, detail=f"Valor inválido en {field}")
+
+        if field in NOTE_TEXT_FIELDS:
+            note_values[field] = (str(value) if value is not None else "").strip()
+        elif field in NOTE_INT_FIELDS:
+            raw = str(value).strip() if value is not None else ""
+            if raw == "":
+                note_values[field] = None
+            else:
+                try:
+                    note_values[field] = int(raw)
+                except ValueError:
+                    raise HTTPException(status_code=422, detail=f"Valor inválido en {field}")
+        elif field == "temp":
+            raw = str(value).strip() if value is not None else ""
+            note_values[field] = raw or None
+            # el UPDATE directo no pasa por el evento del ORM: temp_c se setea acá
+            note_values["temp_c"] = vitals.parse_temp(raw)
+        elif field in ENCOUNTER_FIELDS:
+            enc_values[field] = (str(value) if value is not None else "").strip()[: ENCOUNTER_FIELDS[field]]
+        else:
+            raise HTTPException(status_code=422, detail=f"Campo desconocido: {field}")
+
+    if "visit_type" in enc_values and not enc_values["visit_type"]:
+        enc_values["visit_type"] = "Ambulatorio"
+    return note_values, enc_values
+
+
+def _conflict(db: Session, encounter_id: int):
+    current = (
+        db.query(ClinicalNote.version)
+        .filter(ClinicalNote.encounter_id == encounter_id)
+        .scalar()
+    )
+    return JSONResponse(
+        status_code=409,
+        content={"detail": "La nota cambió en otra pestaña o dispositivo. Recarga para ver la última versión.", "version": current},
+    )
+
+
+@router.patch("/{encounter_id}/note")
+def autosave_note(
+    encounter_id: int,
+    payload: dict,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_doctor: Doctor = Depends(get_doctor_bearer_or_session),
+):
+    """
+    Autosave de la nota: solo los campos que cambiaron.
+
+        {"version": 3, "changes": {"hpi": "...", "ta_sys": "120"}}
+
+    `version` es la que tiene el cliente (0 si la nota todavía no existe).
+    Si en la BD hay otra -> 409 con la versión actual; si no -> {"version": 4}.
+    """
+    enc = (
+        db.query(Encounter.id, Encounter.patient_id, Encounter.doctor_id, Encounter.ended_at, Encounter.is_signed)
+        .filter(Encounter.id == encounter_id)
+        .first()
+    )
+    if not enc:
+        raise HTTPException(status_code=404, detail="Consulta no encontrada")
+
+    # 🔒 Solo el médico dueño puede editar SU nota
+    if enc.doctor_id != current_doctor.id:
+        raise HTTPException(status_code=403, detail="No autorizado")
+
+    # ⏱️ Ventana de 20 min tras cerrar
+    if not _can_edit_encounter(enc):
+        raise HTTPException(
+            status_code=403,
+            detail="Atención firmada o ventana de edición cerrada (20 min). Agrega corrección como Evolución/Addendum."
+        )
+
+    changes = payload.get("changes")
+    if not isinstance(changes, dict) or not changes:
+        raise HTTPException(status_code=422, detail="changes debe ser un objeto con al menos un campo")
+    try:
+        version = int(payload.get("version"))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=422, detail="version es obligatoria")
+
+    note_values, enc_values = _clean_changes(changes)
+    now = datetime.utcnow()
+
+    # ⚡ un solo UPDATE condicionado a la versión (sin leer la nota)
+    updated = (
+        db.query(ClinicalNote)
+        .filter(ClinicalNote.encounter_id == encounter_id, ClinicalNote.version == version)
+        .update(
+            {**note_values, "version": ClinicalNote.version + 1, "updated_at": now},
+            synchronize_session=False,
+        )
+    )
+    if updated:
+        new_version = version + 1
+    elif version == 0:
+        # primera escritura de la nota
+        db.add(ClinicalNote(encounter_id=encounter_id, version=1, updated_at=now, **note_values))
+        new_version = 1
+    else:
+        db.rollback()
+        return _conflict(db, encounter_id)
+
+    try:
+        if enc_values:
+            db.query(Encounter).filter(Encounter.id == encounter_id).update(enc_values, synchronize_session=False)
+
+        # 🧾 historial en la misma transacción (si hay 409 no queda nada);
+        # en la versión 1 hace flush, así que el INSERT de la nota puede fallar aquí
+        note_revisions.record(db, encounter_id, new_version, note_values, current_doctor.id)
+        db.commit()
+    except IntegrityError:
+        # la nota ya existía (version 0 desactualizada) u otra pestaña la creó
+        # al mismo tiempo (encounter_id es único)
+        db.rollback()
+        return _conflict(db, encounter_id)
+
+    audit.record("edit", "note", encounter_id, current_doctor.id, enc.patient_id, request)
+    return {"ok": True, "version": new_version, "saved_at": now.isoformat(timespec="seconds")}
+
+
+@router.get("/{encounter_id}/note/revisions")
+def note_revision_list(
+    encounter_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_doctor: Doctor = Depends(get_doctor_bearer_or_session),
+):
+    """
+    Historial de guardados de la nota (más reciente primero).
+    """
+    current = (
+        db.query(ClinicalNote.version)
+        .filter(ClinicalNote.encounter_id == encounter_id)
+        .scalar()
+    )
+    if current is None:
+        archived = encounter_store.get_archived(db, encounter_id)
+        if not archived or not archived.note:
+            raise HTTPException(status_code=404, detail="Nota no encontrada")
+        audit.record("view", "note_revision", encounter_id, current_doctor.id, archived.patient_id, request)
+        return {
+            "encounter_id": encounter_id,
+            "current_version": archived.note.version,
+            "revisions": note_revisions.describe(reversed(archived.revisions)),
+        }
+
+    audit.record("view", "note_revision", encounter_id, current_doctor.id, request=request)
+    return {
+        "encounter_id": encounter_id,
+        "current_version": current,
+        "revisions": note_revisions.list_revisions(db, encounter_id),
+    }
+
+
+@router.get("/{encounter_id}/note/revisions/{version}")
+def note_revision_detail(
+    encounter_id: int,
+    version: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_doctor: Doctor = Depends(get_doctor_bearer_or_session),
+):
+    """
+    La nota tal como quedó en `version`. La versión actual sale de la fila
+    principal; las anteriores se reconstruyen desde el historial.
+    """
+    archived = None
+    note = db.query(ClinicalNote).filter(ClinicalNote.encounter_id == encounter_id).first()
+    if not note:
+        archived = encounter_store.get_archived(db, encounter_id)
+        note = archived.note if archived else None
+    if not note:
+        raise HTTPException(status_code=404, detail="Nota no encontrada")
+
+    if version == note.version:
+        values = note_revisions.note_values(note)
+    elif 1 <= version < note.version:
+        if archived:
+            values = note_revisions.replay(archived.revisions, version)
+        else:
+            values = note_revisions.reconstruct(db, encounter_id, version)
+        if values is None:
+            raise HTTPException(status_code=404, detail="Esa versión es anterior al historial")
+    else:
+        raise HTTPException(status_code=404, detail="Versión no encontrada")
 
-    return {"message": "Nota clínica guardada ✅", "note_id": note.id}
+    audit.record("view", "note_revision", f"{encounter_id}:{version}", current_doctor.id, request=request)
+    return {"encounter_id": encounter_id, "version": version, "current": version == note.version, "note": values}
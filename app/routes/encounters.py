@@ -1,16 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from datetime import datetime
 
 from ..database import get_db
 from ..deps.auth import get_current_doctor
 from ..models import Doctor, Patient, Encounter
+from ..services import audit, encounter_store, prerender
 
 router = APIRouter(prefix="/encounters", tags=["Encounters"])
 
 
 @router.post("/")
-def create_encounter(payload: dict, db: Session = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
+def create_encounter(payload: dict, request: Request, db: Session = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
     patient_id = payload.get("patient_id")
     if not patient_id:
         raise HTTPException(status_code=400, detail="patient_id es requerido")
@@ -31,6 +32,7 @@ def create_encounter(payload: dict, db: Session = Depends(get_db), current_docto
     db.add(enc)
     db.commit()
     db.refresh(enc)
+    audit.record("create", "encounter", enc.id, current_doctor.id, enc.patient_id, request)
 
     return {
         "id": enc.id,
@@ -46,7 +48,7 @@ def create_encounter(payload: dict, db: Session = Depends(get_db), current_docto
 @router.get("/by-patient/{patient_id}")
 def list_encounters_by_patient(patient_id: int, db: Session = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
     # ✅ Todos los médicos pueden ver el historial (según tu regla nueva)
-    encs = db.query(Encounter).filter(Encounter.patient_id == patient_id).order_by(Encounter.created_at.desc()).all()
+    encs = encounter_store.find(db, patient_ids=[patient_id], newest_first=True)
     return [
         {
             "id": e.id,
@@ -56,13 +58,15 @@ def list_encounters_by_patient(patient_id: int, db: Session = Depends(get_db), c
             "chief_complaint_short": e.chief_complaint_short,
             "created_at": e.created_at.isoformat() if e.created_at else None,
             "ended_at": e.ended_at.isoformat() if e.ended_at else None,
+            "signed_at": e.signed_at.isoformat() if e.signed_at else None,
+            "archived": e.archived,
         }
         for e in encs
     ]
 
 
 @router.post("/{encounter_id}/end")
-def end_encounter(encounter_id: int, db: Session = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
+def end_encounter(encounter_id: int, request: Request, db: Session = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
     enc = db.query(Encounter).filter(Encounter.id == encounter_id).first()
     if not enc:
         raise HTTPException(status_code=404, detail="Consulta no encontrada")
@@ -75,9 +79,35 @@ def end_encounter(encounter_id: int, db: Session = Depends(get_db), current_doct
         enc.ended_at = datetime.utcnow()
         db.commit()
         db.refresh(enc)
+        audit.record("close", "encounter", enc.id, current_doctor.id, enc.patient_id, request)
+        # ⚡ el PDF se genera en segundo plano (normalmente se descarga justo después)
+        prerender.schedule_on_close(db, enc, requested_by=current_doctor.id)
 
     return {
         "encounter_id": enc.id,
         "ended_at": enc.ended_at.isoformat() if enc.ended_at else None,
         "message": "Atención cerrada ✅",
     }
+
+
+@router.post("/{encounter_id}/sign")
+def sign_encounter(encounter_id: int, request: Request, db: Session = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
+    enc = db.query(Encounter).filter(Encounter.id == encounter_id).first()
+    if not enc:
+        raise HTTPException(status_code=404, detail="Consulta no encontrada")
+
+    # 🔒 Solo el médico dueño firma SU atención
+    if enc.doctor_id != current_doctor.id:
+        raise HTTPException(status_code=403, detail="No autorizado")
+
+    if enc.ended_at is None:
+        raise HTTPException(status_code=409, detail="Cierra la atención antes de firmarla")
+
+    if encounter_store.sign(db, enc):
+        audit.record("sign", "encounter", enc.id, current_doctor.id, enc.patient_id, request)
+
+    return {
+        "encounter_id": enc.id,
+        "signed_at": enc.signed_at.isoformat() if enc.signed_at else None,
+        "message": "Atención firmada ✅",
+    }
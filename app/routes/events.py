@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from ..services import events
+
+router = APIRouter(prefix="/api", tags=["Events"])
+
+HEARTBEAT_SECONDS = 15
+
+
+@router.get("/events")
+async def event_stream(request: Request):
+    """
+    Server-Sent Events del doctor en sesión: cambios de citas y check-ins.
+    Uso (JS): new EventSource("/api/events")
+    """
+    doctor_id = request.session.get("doctor_id")
+    if not doctor_id:
+        raise HTTPException(status_code=401, detail="Sesión requerida")
+
+    sub = events.bus.subscribe(int(doctor_id))
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    ev = await asyncio.wait_for(sub.queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # comentario SSE: mantiene viva la conexión a través de proxies
+                    yield ": ping\n\n"
+                    continue
+                yield f"id: {ev['id']}\nevent: {ev['type']}\ndata: {json.dumps(ev['data'], ensure_ascii=False)}\n\n"
+        finally:
+            events.bus.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,14 +1,19 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
+from io import BytesIO
 import pandas as pd
 
 from ..database import get_db
-from ..models import Patient, Attendance
+from ..deps.auth import get_current_doctor
+from ..models import Doctor, Patient, Attendance
+from ..services import blobstore, jobs
 
 router = APIRouter(prefix="/export", tags=["Export"])
 
-@router.get("/excel")
-def export_excel(db: Session = Depends(get_db)):
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _build_excel(db: Session, progress=None) -> bytes:
     # 📄 hoja 1: pacientes
     patients = db.query(Patient).all()
     patients_data = []
@@ -22,6 +27,8 @@ def export_excel(db: Session = Depends(get_db)):
         })
 
     df_patients = pd.DataFrame(patients_data)
+    if progress:
+        progress(30, "Pacientes listos")
 
     # 📄 hoja 2: historial de asistencias
     attendance = db.query(Attendance).all()
@@ -36,14 +43,42 @@ def export_excel(db: Session = Depends(get_db)):
         })
 
     df_attendance = pd.DataFrame(attendance_data)
+    if progress:
+        progress(60, "Asistencias listas")
 
     # 📁 crear excel
-    file_name = "nexa_care_club.xlsx"
-    with pd.ExcelWriter(file_name, engine="openpyxl") as writer:
+    buf = BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
         df_patients.to_excel(writer, sheet_name="Pacientes", index=False)
         df_attendance.to_excel(writer, sheet_name="Asistencias", index=False)
+    return buf.getvalue()
+
+
+@jobs.handler("export_excel")
+def _export_excel_job(db: Session, ctx: jobs.JobContext, params: dict) -> jobs.JobResult:
+    content = _build_excel(db, progress=ctx.progress)
+    return jobs.JobResult(content=content, filename="nexa_care_club.xlsx", media_type=XLSX_MEDIA_TYPE)
+
+
+@router.get("/excel")
+def export_excel(db: Session = Depends(get_db)):
+    file_name = "nexa_care_club.xlsx"
+
+    # ✅ ya no se escribe en el directorio de trabajo: va al almacén de artefactos
+    blob = blobstore.put(db, _build_excel(db), XLSX_MEDIA_TYPE)
+    blobstore.attach(db, blob, "export", "excel", "latest")
+    db.commit()
 
     return {
         "message": "Excel generado correctamente ✅",
-        "file": file_name
+        "file": file_name,
+        "sha256": blob.sha256,
+        "download_url": f"/blobs/{blob.sha256}?filename={file_name}",
     }
+
+
+@router.post("/excel")
+def enqueue_export_excel(db: Session = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
+    # ✅ no bloquea la petición: se genera en segundo plano y se descarga desde /jobs/{id}/artifact
+    job = jobs.enqueue(db, "export_excel", requested_by=current_doctor.id)
+    return jobs.job_to_dict(job)
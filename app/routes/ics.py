@@ -0,0 +1,41 @@
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..models import Doctor
+from ..services import ics
+
+router = APIRouter(tags=["Calendar"])
+log = logging.getLogger("nexa.ics")
+
+
+@router.get("/ics/{doctor_id}/{token}.ics")
+def doctor_calendar_feed(doctor_id: int, token: str, request: Request, db: Session = Depends(get_db)):
+    """
+    Feed iCalendar del doctor para suscribirse desde el teléfono.
+    La URL (con token) se muestra en /app/clinic.
+    """
+    if not ics.enabled():
+        log.error("Feed de calendario pedido sin ICS_SECRET/JWT_SECRET configurado")
+        raise HTTPException(status_code=503, detail="Calendario no configurado")
+
+    # 🔒 el calendario no manda sesión ni bearer: el token va en la URL
+    if not ics.check_token(doctor_id, token):
+        raise HTTPException(status_code=404, detail="Calendario no encontrado")
+
+    doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
+    if not doctor:
+        raise HTTPException(status_code=404, detail="Calendario no encontrado")
+
+    etag, body = ics.get_feed(db, doctor)
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=300"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    return Response(
+        content=body,
+        media_type="text/calendar; charset=utf-8",
+        headers={**headers, "Content-Disposition": f'inline; filename="nexacenter-{doctor_id}.ics"'},
+    )
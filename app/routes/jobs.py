@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..deps.auth import get_current_doctor
+from ..models import Doctor, Job
+from ..services import blobstore, jobs
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+def _get_own_job(job_id: str, db: Session, current_doctor: Doctor) -> Job:
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+
+    # 🔒 Solo quien lo pidió puede consultarlo
+    if job.requested_by is not None and job.requested_by != current_doctor.id:
+        raise HTTPException(status_code=403, detail="No autorizado")
+    return job
+
+
+@router.post("/")
+def create_job(payload: dict, db: Session = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
+    kind = (payload.get("kind") or "").strip()
+    if kind not in jobs.known_kinds():
+        raise HTTPException(status_code=400, detail=f"kind inválido. Opciones: {', '.join(jobs.known_kinds())}")
+
+    params = payload.get("params") or {}
+    if not isinstance(params, dict):
+        raise HTTPException(status_code=400, detail="params debe ser un objeto")
+
+    job = jobs.enqueue(db, kind, params, requested_by=current_doctor.id)
+    return jobs.job_to_dict(job)
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str, db: Session = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
+    job = _get_own_job(job_id, db, current_doctor)
+    return jobs.job_to_dict(job)
+
+
+@router.get("/{job_id}/artifact")
+def download_job_artifact(
+    job_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_doctor: Doctor = Depends(get_current_doctor),
+):
+    job = _get_own_job(job_id, db, current_doctor)
+
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"El job aún no termina (estado: {job.status})")
+    if not job.artifact_sha256 or not blobstore.available(job.artifact_sha256):
+        raise HTTPException(status_code=410, detail="El archivo ya no está disponible")
+
+    jobs.record_artifact_download(job, current_doctor.id, request)
+    return blobstore.response(request, job.artifact_sha256, job.artifact_media_type, job.artifact_name)
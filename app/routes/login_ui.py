@@ -1,15 +1,14 @@
 from fastapi import APIRouter, Depends, Request, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from starlette.status import HTTP_303_SEE_OTHER
 
 from ..database import get_db
 from ..models import Doctor
 from ..deps.passwords import verify_password
+from ..templating import templates
 
 router = APIRouter(tags=["Login UI"])
-templates = Jinja2Templates(directory="app/templates")
 
 
 @router.get("/login", response_class=HTMLResponse)
@@ -0,0 +1,50 @@
+import hmac
+import os
+from datetime import datetime, timedelta
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import func
+
+from ..database import SessionLocal
+from ..models import Attendance
+from ..services import jobs, metrics
+
+router = APIRouter(tags=["Metrics"])
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+# -------------------------
+# Gauges de negocio (se consultan en cada scrape, no en cada request)
+# -------------------------
+def _checkins_last_minute() -> int:
+    with SessionLocal() as db:
+        since = datetime.utcnow() - timedelta(minutes=1)
+        return db.query(func.count(Attendance.id)).filter(Attendance.timestamp >= since).scalar()
+
+
+def _pdf_queue_depth() -> dict:
+    kinds = [k for k in jobs.known_kinds() if k.endswith("_pdf")]
+    with SessionLocal() as db:
+        depth = jobs.queue_depth(db, kinds)
+    # en 0 también, para que la serie no desaparezca con la cola vacía
+    return {(k, state): depth.get((k, state), 0) for k in kinds for state in ("queued", "running")}
+
+
+metrics.gauge("nexa_checkins_per_minute", "Check-ins registrados en el último minuto", fn=_checkins_last_minute)
+metrics.gauge("nexa_pdf_queue_depth", "Jobs de PDF pendientes (queued listos, running)", ["kind", "state"], fn=_pdf_queue_depth)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics(request: Request):
+    """
+    Métricas del proceso en formato Prometheus.
+    Si METRICS_TOKEN está definido se exige "Authorization: Bearer <token>".
+    """
+    if METRICS_TOKEN:
+        auth = request.headers.get("authorization", "")
+        if not hmac.compare_digest(auth, f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="No autorizado")
+
+    return PlainTextResponse(metrics.registry.expose(), media_type="text/plain; version=0.0.4")
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
+from io import BytesIO
+import hashlib
 import secrets
 
+import qrcode
+
 from ..database import get_db
 from ..models import Patient
+from ..services import blobstore
 
 router = APIRouter(prefix="/patients", tags=["Patients"])
 
@@ -52,6 +57,26 @@ def get_patient(patient_id: int, db: Session = Depends(get_db)):
     }
 
 
+@router.get("/{patient_id}/qr.png")
+def get_patient_qr_image(patient_id: int, request: Request, db: Session = Depends(get_db)):
+    p = db.query(Patient).filter(Patient.id == patient_id).first()
+    if not p or not p.qr_code:
+        raise HTTPException(status_code=404, detail="Paciente sin QR")
+
+    # ✅ la imagen se genera una vez por código y queda en el almacén de artefactos
+    fp = hashlib.sha256(p.qr_code.encode("utf-8")).hexdigest()
+    ref = blobstore.get_ref(db, "patient", p.id, "qr")
+    if ref and ref.source_fingerprint == fp and blobstore.available(ref.sha256):
+        return blobstore.response(request, ref.sha256, "image/png")
+
+    buf = BytesIO()
+    qrcode.make(p.qr_code).save(buf, format="PNG")
+    blob = blobstore.put(db, buf.getvalue(), "image/png")
+    blobstore.attach(db, blob, "patient", p.id, "qr", source_fingerprint=fp)
+    db.commit()
+    return blobstore.response(request, blob.sha256, "image/png")
+
+
 @router.get("/qr/{qr_code}")
 def get_patient_by_qr(qr_code: str, db: Session = Depends(get_db)):
     p = db.query(Patient).filter(Patient.qr_code == qr_code).first()
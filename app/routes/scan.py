@@ -1,12 +1,12 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
 
+from ..services import assets
+
 router = APIRouter(tags=["Scanner"])
 
-@router.get("/scan", response_class=HTMLResponse)
-def scan_page():
-    # HTML + JS: seleccionas doctor, abres cámara, escaneas, y hace check-in
-    return """
+# HTML + JS: seleccionas doctor, abres cámara, escaneas, y hace check-in
+SCAN_HTML = """
 <!doctype html>
 <html>
 <head>
@@ -131,3 +131,12 @@ const doctorId = stored ? stored : doctorSel.value;
 </body>
 </html>
 """
+
+# ⚡ el cuerpo no cambia entre requests: se arma y comprime una sola vez
+_page = assets.Precompressed.build(SCAN_HTML.encode("utf-8"), "text/html; charset=utf-8")
+
+
+@router.get("/scan", response_class=HTMLResponse)
+def scan_page(request: Request):
+    # no-cache = revalidar siempre (304 con ETag); así un deploy nuevo se ve enseguida
+    return _page.response(request, "no-cache")
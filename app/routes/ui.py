@@ -1,15 +1,17 @@
 from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, Request, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session, joinedload  # ✅ joinedload
 
+from .. import clinic_time
 from ..database import get_db
-from ..models import Appointment, Patient, Encounter, Doctor, ClinicalNote, EncounterEvolution
+from ..models import Appointment, Patient, PatientSummary, Encounter, Doctor, ClinicalNote, EncounterEvolution
+from ..services import audit, encounter_store, fragments, ics, note_revisions, prerender
+from ..templating import templates
 from .auth import get_logged_doctor
 
 router = APIRouter(tags=["UI"])
-templates = Jinja2Templates(directory="app/templates")
 
 
 def _redirect_login():
@@ -33,6 +35,8 @@ def _parse_date(s: str | None):
 
 
 def _is_editable(enc: Encounter) -> bool:
+    if enc.is_signed:
+        return False
     if enc.ended_at is None:
         return True
     return datetime.utcnow() <= (enc.ended_at + timedelta(minutes=20))
@@ -47,7 +51,7 @@ def ui_dashboard(request: Request, db: Session = Depends(get_db), date: str | No
     if not current_doctor:
         return _redirect_login()
 
-    base_date = _parse_date(date) or datetime.utcnow().date()
+    base_date = _parse_date(date) or clinic_time.today()
     start_date = base_date - timedelta(days=1)  # ayer
     end_date = base_date + timedelta(days=7)    # +7 días
 
@@ -96,6 +100,72 @@ def ui_dashboard(request: Request, db: Session = Depends(get_db), date: str | No
     )
 
 
+# =========================
+# CLÍNICA (todos los doctores, día o semana)
+# =========================
+@router.get("/app/clinic", response_class=HTMLResponse)
+def ui_clinic(request: Request, db: Session = Depends(get_db), date: str | None = None, view: str = "day"):
+    current_doctor = _require_login(request, db)
+    if not current_doctor:
+        return _redirect_login()
+
+    view = "week" if view == "week" else "day"
+    base_date = _parse_date(date) or clinic_time.today()
+    if view == "week":
+        start_date = base_date - timedelta(days=base_date.weekday())  # lunes
+        n_days = 7
+    else:
+        start_date = base_date
+        n_days = 1
+    step = timedelta(days=n_days)
+
+    start_dt = datetime(start_date.year, start_date.month, start_date.day)
+    end_dt = start_dt + step
+
+    doctors = db.query(Doctor).order_by(Doctor.name.asc()).all()
+
+    # ✅ una sola consulta para todas las citas; se agrupa en Python
+    rows = (
+        db.query(
+            Appointment.id,
+            Appointment.doctor_id,
+            Appointment.start_at,
+            Appointment.end_at,
+            Appointment.status,
+            Appointment.reason,
+            Patient.full_name.label("patient_name"),
+        )
+        .join(Patient, Patient.id == Appointment.patient_id)
+        .filter(Appointment.start_at >= start_dt)
+        .filter(Appointment.start_at < end_dt)
+        .filter(Appointment.status != "canceled")
+        .order_by(Appointment.start_at.asc())
+        .all()
+    )
+
+    ordered_days = [(start_date + timedelta(days=i)).isoformat() for i in range(n_days)]
+    grid = {day: {d.id: [] for d in doctors} for day in ordered_days}
+    for r in rows:
+        grid[r.start_at.date().isoformat()].setdefault(r.doctor_id, []).append(r)
+
+    return templates.TemplateResponse(
+        "clinic.html",
+        {
+            "request": request,
+            "current_doctor": current_doctor,
+            "view": view,
+            "base_date": base_date,
+            "prev_date": (base_date - step).isoformat(),
+            "next_date": (base_date + step).isoformat(),
+            "ordered_days": ordered_days,
+            "doctors": doctors,
+            "grid": grid,
+            "total": len(rows),
+            "ics_url": str(request.base_url).rstrip("/") + ics.feed_url(current_doctor.id) if ics.enabled() else None,
+        },
+    )
+
+
 # =========================
 # PACIENTES
 # =========================
@@ -105,10 +175,17 @@ def ui_patients(request: Request, db: Session = Depends(get_db)):
     if not current_doctor:
         return _redirect_login()
 
-    patients = db.query(Patient).order_by(Patient.id.desc()).all()
+    # ⚡ una consulta: paciente + su fila de patient_summary (por PK)
+    rows = (
+        db.query(Patient, PatientSummary)
+        .outerjoin(PatientSummary, PatientSummary.patient_id == Patient.id)
+        .order_by(Patient.id.desc())
+        .all()
+    )
+    patients = [{"p": p, "s": s} for p, s in rows]
     return templates.TemplateResponse(
         "patients.html",
-        {"request": request, "current_doctor": current_doctor, "patients": patients},
+        {"request": request, "current_doctor": current_doctor, "patients": patients, "now": datetime.utcnow()},
     )
 
 
@@ -122,17 +199,9 @@ def ui_patient_detail(patient_id: int, request: Request, db: Session = Depends(g
     if not patient:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
 
-    encounters = (
-        db.query(Encounter)
-        .filter(Encounter.patient_id == patient_id)
-        .order_by(Encounter.created_at.desc(), Encounter.id.desc())
-        .all()
-    )
-
-    items = []
-    for enc in encounters:
-        doc = db.query(Doctor).filter(Doctor.id == enc.doctor_id).first()
-        items.append({"enc": enc, "doc": doc, "pdf_url": f"/encounters/{enc.id}/pdf"})
+    # ✅ calientes + archivadas, con el doctor ya cargado
+    encounters = encounter_store.find(db, patient_ids=[patient_id], newest_first=True)
+    items = [{"enc": enc, "doc": enc.doctor, "pdf_url": f"/encounters/{enc.id}/pdf"} for enc in encounters]
 
     return templates.TemplateResponse(
         "patient_detail.html",
@@ -181,41 +250,106 @@ def ui_encounter(encounter_id: int, request: Request, db: Session = Depends(get_
     if not current_doctor:
         return _redirect_login()
 
-    enc = db.query(Encounter).filter(Encounter.id == encounter_id).first()
-    if not enc:
-        raise HTTPException(status_code=404, detail="Consulta no encontrada")
-
-    patient = db.query(Patient).filter(Patient.id == enc.patient_id).first()
-    doc = db.query(Doctor).filter(Doctor.id == enc.doctor_id).first()
-
-    note = db.query(ClinicalNote).filter(ClinicalNote.encounter_id == encounter_id).first()
-    evols = (
-        db.query(EncounterEvolution)
-        .filter(EncounterEvolution.encounter_id == encounter_id)
-        .order_by(EncounterEvolution.created_at.asc())
-        .all()
+    # ⚡ una sola consulta: atención + paciente + doctor + nota + marca de evoluciones
+    evo_count = (
+        select(func.count(EncounterEvolution.id))
+        .where(EncounterEvolution.encounter_id == Encounter.id)
+        .correlate(Encounter)
+        .scalar_subquery()
     )
+    evo_last = (
+        select(func.max(EncounterEvolution.id))
+        .where(EncounterEvolution.encounter_id == Encounter.id)
+        .correlate(Encounter)
+        .scalar_subquery()
+    )
+    row = (
+        db.query(Encounter, evo_count, evo_last)
+        .options(
+            joinedload(Encounter.patient),
+            joinedload(Encounter.doctor),
+            joinedload(Encounter.note),
+        )
+        .filter(Encounter.id == encounter_id)
+        .first()
+    )
+    if not row:
+        archived = encounter_store.get_archived(db, encounter_id)
+        if not archived:
+            raise HTTPException(status_code=404, detail="Consulta no encontrada")
+        audit.record("view", "encounter", archived.id, current_doctor.id, archived.patient_id, request)
+        return _ui_archived_encounter(archived, request, current_doctor)
+
+    enc, n_evols, last_evol_id = row
+    audit.record("view", "encounter", enc.id, current_doctor.id, enc.patient_id, request)
+    patient, doc, note = enc.patient, enc.doctor, enc.note
 
     editable_window = _is_editable(enc)
     is_owner = (enc.doctor_id == current_doctor.id)
     can_edit_note = is_owner and editable_window
 
-    return templates.TemplateResponse(
-        "encounter.html",
-        {
-            "request": request,
-            "current_doctor": current_doctor,
-            "enc": enc,
-            "patient": patient,
-            "doc": doc,
-            "note": note,
-            "evols": evols,
-            "editable": editable_window,
-            "is_owner": is_owner,
-            "can_edit_note": can_edit_note,
-            "pdf_url": f"/encounters/{enc.id}/pdf",
-        },
+    ctx = {
+        "request": request,
+        "current_doctor": current_doctor,
+        "enc": enc,
+        "patient": patient,
+        "doc": doc,
+        "note": note,
+        "editable": editable_window,
+        "is_owner": is_owner,
+        "can_edit_note": can_edit_note,
+        "pdf_url": f"/encounters/{enc.id}/pdf",
+    }
+
+    # 🧩 fragmentos de solo lectura cacheados por versión (las evoluciones solo se agregan)
+    def render_evols():
+        evols = (
+            db.query(EncounterEvolution)
+            .filter(EncounterEvolution.encounter_id == encounter_id)
+            .order_by(EncounterEvolution.created_at.asc(), EncounterEvolution.id.asc())
+            .all()
+        )
+        return templates.get_template("partials/encounter_evolutions.html").render(evols=evols)
+
+    ctx["evols_html"] = fragments.cache.get_or_render(
+        ("encounter_evols", enc.id, n_evols, last_evol_id), render_evols
+    )
+
+    ctx["note_html"] = None
+    if not can_edit_note:
+        key = (
+            "encounter_note", enc.id, note.version if note else 0,
+            enc.visit_type, enc.chief_complaint_short,
+        )
+        ctx["note_html"] = fragments.cache.get_or_render(
+            key, lambda: templates.get_template("partials/encounter_note.html").render(ctx)
+        )
+
+    return templates.TemplateResponse("encounter.html", ctx)
+
+
+def _ui_archived_encounter(enc, request: Request, current_doctor: Doctor):
+    # archivada = inmutable: los fragmentos se cachean por id y solo se descomprime al renderizarlos
+    ctx = {
+        "request": request,
+        "current_doctor": current_doctor,
+        "enc": enc,
+        "patient": enc.patient,
+        "doc": enc.doctor,
+        "editable": False,
+        "is_owner": enc.doctor_id == current_doctor.id,
+        "can_edit_note": False,
+        "pdf_url": f"/encounters/{enc.id}/pdf",
+    }
+    ctx["evols_html"] = fragments.cache.get_or_render(
+        ("archived_encounter_evols", enc.id),
+        lambda: templates.get_template("partials/encounter_evolutions.html").render(evols=enc.evolutions),
+    )
+    ctx["note_html"] = fragments.cache.get_or_render(
+        ("archived_encounter_note", enc.id),
+        lambda: templates.get_template("partials/encounter_note.html").render({**ctx, "note": enc.note}),
     )
+    return templates.TemplateResponse("encounter.html", ctx)
 
 
 @router.post("/app/encounters/{encounter_id}/save-note")
@@ -234,7 +368,7 @@ async def ui_save_note(encounter_id: int, request: Request, db: Session = Depend
     if not _is_editable(enc):
         raise HTTPException(
             status_code=403,
-            detail="Ventana de edición cerrada (20 min). Usa Evolución/Addendum para correcciones."
+            detail="Atención firmada o ventana de edición cerrada (20 min). Usa Evolución/Addendum para correcciones."
         )
 
     form = await request.form()
@@ -244,8 +378,12 @@ async def ui_save_note(encounter_id: int, request: Request, db: Session = Depend
 
     note = db.query(ClinicalNote).filter(ClinicalNote.encounter_id == encounter_id).first()
     if not note:
-        note = ClinicalNote(encounter_id=encounter_id)
+        note = ClinicalNote(encounter_id=encounter_id, version=1)
         db.add(note)
+        before = {}
+    else:
+        note.version = (note.version or 0) + 1  # invalida autosaves abiertos con la versión vieja
+        before = note_revisions.note_values(note)
 
     note.chief_complaint = (form.get("chief_complaint") or "").strip()
     note.hpi = (form.get("hpi") or "").strip()
@@ -274,7 +412,14 @@ async def ui_save_note(encounter_id: int, request: Request, db: Session = Depend
     temp = (form.get("temp") or "").strip()
     note.temp = temp if temp else None
 
+    # 🧾 historial: solo lo que cambió respecto de la versión anterior
+    note_revisions.record(
+        db, encounter_id, note.version,
+        note_revisions.diff(before, note_revisions.note_values(note)),
+        current_doctor.id,
+    )
     db.commit()
+    audit.record("edit", "note", encounter_id, current_doctor.id, enc.patient_id, request)
     return RedirectResponse(url=f"/app/encounters/{encounter_id}", status_code=302)
 
 
@@ -294,7 +439,31 @@ def ui_end_encounter(encounter_id: int, request: Request, db: Session = Depends(
     if enc.ended_at is None:
         enc.ended_at = datetime.utcnow()
         db.commit()
+        audit.record("close", "encounter", enc.id, current_doctor.id, enc.patient_id, request)
+        # ⚡ el PDF se genera en segundo plano (normalmente se descarga justo después)
+        prerender.schedule_on_close(db, enc, requested_by=current_doctor.id)
+
+    return RedirectResponse(url=f"/app/encounters/{encounter_id}", status_code=302)
+
+
+@router.post("/app/encounters/{encounter_id}/sign")
+def ui_sign_encounter(encounter_id: int, request: Request, db: Session = Depends(get_db)):
+    current_doctor = _require_login(request, db)
+    if not current_doctor:
+        return _redirect_login()
+
+    enc = db.query(Encounter).filter(Encounter.id == encounter_id).first()
+    if not enc:
+        raise HTTPException(status_code=404, detail="Consulta no encontrada")
+
+    if enc.doctor_id != current_doctor.id:
+        raise HTTPException(status_code=403, detail="No autorizado")
+
+    if enc.ended_at is None:
+        raise HTTPException(status_code=409, detail="Cierra la atención antes de firmarla")
 
+    if encounter_store.sign(db, enc):
+        audit.record("sign", "encounter", enc.id, current_doctor.id, enc.patient_id, request)
     return RedirectResponse(url=f"/app/encounters/{encounter_id}", status_code=302)
 
 
@@ -306,6 +475,8 @@ async def ui_add_evolution(encounter_id: int, request: Request, db: Session = De
 
     enc = db.query(Encounter).filter(Encounter.id == encounter_id).first()
     if not enc:
+        if encounter_store.get_archived(db, encounter_id):
+            raise HTTPException(status_code=409, detail="Atención archivada: solo lectura")
         raise HTTPException(status_code=404, detail="Consulta no encontrada")
 
     form = await request.form()
@@ -320,5 +491,6 @@ async def ui_add_evolution(encounter_id: int, request: Request, db: Session = De
     )
     db.add(ev)
     db.commit()
+    audit.record("create", "evolution", ev.id, current_doctor.id, enc.patient_id, request)
 
     return RedirectResponse(url=f"/app/encounters/{encounter_id}", status_code=302)
@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..deps.auth import get_doctor_bearer_or_session
+from ..models import Doctor, Patient
+from ..services import audit, vitals
+
+router = APIRouter(prefix="/patients", tags=["Vitals"])
+
+
+@router.get("/{patient_id}/vitals")
+def get_patient_vitals(
+    patient_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_doctor: Doctor = Depends(get_doctor_bearer_or_session),
+    window: int = vitals.DEFAULT_WINDOW,
+    max_points: int = vitals.DEFAULT_MAX_POINTS,
+):
+    """
+    Series de signos vitales del paciente (TA, FC, FR, SpO2, temperatura):
+    estadísticas, promedio móvil de `window` mediciones, banderas de fuera
+    de rango y puntos reducidos a `max_points` para graficar.
+    """
+    patient = db.query(Patient.id).filter(Patient.id == patient_id).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Paciente no encontrado")
+    audit.record("view", "vitals", patient_id, current_doctor.id, patient_id, request)
+
+    window = max(1, min(window, 50))
+    max_points = max(10, min(max_points, 5000))
+    return {"patient_id": patient_id, **vitals.patient_vitals(db, patient_id, window, max_points)}
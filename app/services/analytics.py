@@ -0,0 +1,259 @@
+# =========================
+# ✅ app/services/analytics.py
+# (Rollups diarios por doctor y lecturas para /api/analytics)
+# =========================
+"""
+daily_doctor_stats guarda, por día y doctor, los conteos crudos (check-ins,
+citas por estado, atenciones y minutos de atención). Se mantiene de forma
+incremental desde el scheduler (solo el líder):
+
+- se recalculan los días desde el último rollup menos ANALYTICS_REOPEN_DAYS
+  hasta hoy (las citas cambian de estado y las atenciones se cierran
+  después del día en que empiezan);
+- cada tramo: GROUP BY día/doctor en SQL por tabla fuente, unión con pandas,
+  borrar el tramo y reinsertarlo en la misma transacción.
+
+Las tasas (no-show, protocolos completados, duración media) se derivan al
+leer, sumando rollups: nunca se consultan las tablas crudas desde la API.
+"""
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import case, func, select, union_all
+from sqlalchemy.orm import Session
+
+from ..models import Appointment, ArchivedEncounter, Attendance, DailyDoctorStats, Doctor, Encounter, Patient
+
+log = logging.getLogger("nexa.analytics")
+
+ANALYTICS_REOPEN_DAYS = int(os.getenv("ANALYTICS_REOPEN_DAYS", "3"))
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "300"))
+CHUNK_DAYS = 31
+
+COUNT_COLUMNS = (
+    "checkins",
+    "protocol_starts",
+    "protocol_completions",
+    "appointments",
+    "appointments_completed",
+    "appointments_no_show",
+    "appointments_canceled",
+    "encounters",
+    "encounters_closed",
+    "encounter_minutes",
+)
+
+
+# -------------------------
+# Expresiones por dialecto
+# -------------------------
+def _minutes_between(db: Session, start, end):
+    if db.get_bind().dialect.name == "sqlite":
+        return (func.julianday(end) - func.julianday(start)) * 1440.0
+    return func.extract("epoch", end - start) / 60.0
+
+
+def _flag(cond):
+    return func.sum(case((cond, 1), else_=0))
+
+
+# -------------------------
+# Cálculo de un tramo [start, end)
+# -------------------------
+def _frame(rows, columns) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=["day", "doctor_id", *columns])
+    # SQLite devuelve date() como texto y Postgres como date: se normaliza
+    df["day"] = pd.to_datetime(df["day"]).dt.date
+    return df
+
+
+def compute_range(db: Session, start: date, end: date) -> pd.DataFrame:
+    """
+    Rollups de los días [start, end) como DataFrame (día, doctor, conteos...).
+    """
+    start_dt = datetime.combine(start, datetime.min.time())
+    end_dt = datetime.combine(end, datetime.min.time())
+
+    att_day = func.date(Attendance.timestamp)
+    att_doctor = func.coalesce(Attendance.doctor_id, 0)
+    checkins = _frame(
+        db.query(
+            att_day,
+            att_doctor,
+            func.count(Attendance.id),
+            _flag(Attendance.session_number == 1),
+            _flag(Attendance.session_number >= Patient.total_sessions),
+        )
+        .join(Patient, Patient.id == Attendance.patient_id)
+        .filter(Attendance.timestamp >= start_dt, Attendance.timestamp < end_dt)
+        .group_by(att_day, att_doctor)
+        .all(),
+        ["checkins", "protocol_starts", "protocol_completions"],
+    )
+
+    appt_day = func.date(Appointment.start_at)
+    appointments = _frame(
+        db.query(
+            appt_day,
+            Appointment.doctor_id,
+            _flag(Appointment.status != "canceled"),
+            _flag(Appointment.status == "completed"),
+            _flag(Appointment.status == "no_show"),
+            _flag(Appointment.status == "canceled"),
+        )
+        .filter(Appointment.start_at >= start_dt, Appointment.start_at < end_dt)
+        .group_by(appt_day, Appointment.doctor_id)
+        .all(),
+        ["appointments", "appointments_completed", "appointments_no_show", "appointments_canceled"],
+    )
+
+    # atenciones calientes + archivadas (un recálculo completo no pierde las viejas)
+    enc = union_all(*[
+        select(m.id, m.doctor_id, m.created_at, m.ended_at)
+        .where(m.created_at >= start_dt, m.created_at < end_dt)
+        for m in (Encounter, ArchivedEncounter)
+    ]).subquery()
+    enc_day = func.date(enc.c.created_at)
+    minutes = _minutes_between(db, enc.c.created_at, enc.c.ended_at)
+    encounters = _frame(
+        db.query(
+            enc_day,
+            enc.c.doctor_id,
+            func.count(enc.c.id),
+            func.count(enc.c.ended_at),
+            func.coalesce(func.sum(case((enc.c.ended_at.isnot(None), minutes), else_=0.0)), 0.0),
+        )
+        .group_by(enc_day, enc.c.doctor_id)
+        .all(),
+        ["encounters", "encounters_closed", "encounter_minutes"],
+    )
+
+    df = checkins.merge(appointments, on=["day", "doctor_id"], how="outer")
+    df = df.merge(encounters, on=["day", "doctor_id"], how="outer")
+    df[list(COUNT_COLUMNS)] = df[list(COUNT_COLUMNS)].fillna(0)
+    return df
+
+
+def _store(db: Session, start: date, end: date, df: pd.DataFrame, now: datetime) -> int:
+    db.query(DailyDoctorStats).filter(DailyDoctorStats.day >= start, DailyDoctorStats.day < end).delete(
+        synchronize_session=False
+    )
+    rows = []
+    for rec in df.to_dict("records"):
+        row = {"day": rec["day"], "doctor_id": int(rec["doctor_id"]), "computed_at": now}
+        for col in COUNT_COLUMNS:
+            row[col] = float(rec[col]) if col == "encounter_minutes" else int(rec[col])
+        rows.append(row)
+    if rows:
+        db.bulk_insert_mappings(DailyDoctorStats, rows)
+    return len(rows)
+
+
+def _first_activity_day(db: Session) -> date | None:
+    firsts = [
+        db.query(func.min(Attendance.timestamp)).scalar(),
+        db.query(func.min(Appointment.start_at)).scalar(),
+        db.query(func.min(Encounter.created_at)).scalar(),
+        db.query(func.min(ArchivedEncounter.created_at)).scalar(),
+    ]
+    firsts = [f for f in firsts if f is not None]
+    return min(firsts).date() if firsts else None
+
+
+def refresh(db: Session, now: datetime | None = None, full: bool = False) -> int:
+    """
+    Recalcula los días pendientes (o todo con full=True). Devuelve cuántas
+    filas de rollup escribió.
+    """
+    now = now or datetime.utcnow()
+    today = now.date()
+
+    last = None if full else db.query(func.max(DailyDoctorStats.day)).scalar()
+    if last is None:
+        start = _first_activity_day(db)
+        if start is None:
+            return 0
+    else:
+        start = min(last, today) - timedelta(days=ANALYTICS_REOPEN_DAYS)
+
+    end = today + timedelta(days=1)
+    written = 0
+    # tramos acotados: una reconstrucción completa no carga años en memoria
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + timedelta(days=CHUNK_DAYS), end)
+        df = compute_range(db, chunk_start, chunk_end)
+        written += _store(db, chunk_start, chunk_end, df, now)
+        db.commit()
+        chunk_start = chunk_end
+    return written
+
+
+# -------------------------
+# Lectura (solo rollups)
+# -------------------------
+def _rates(df: pd.DataFrame) -> pd.DataFrame:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["no_show_rate"] = df["appointments_no_show"] / df["appointments"]
+        df["attendance_rate"] = df["appointments_completed"] / df["appointments"]
+        df["protocol_completion_rate"] = df["protocol_completions"] / df["protocol_starts"]
+        df["avg_encounter_minutes"] = df["encounter_minutes"] / df["encounters_closed"]
+    rate_cols = ["no_show_rate", "attendance_rate", "protocol_completion_rate", "avg_encounter_minutes"]
+    df[rate_cols] = df[rate_cols].replace([np.inf, -np.inf], np.nan).round(4)
+    return df
+
+
+def _records(df: pd.DataFrame) -> list[dict]:
+    # to_json resuelve tipos numpy y NaN -> null de una vez
+    df = df.copy()
+    if "day" in df.columns:
+        df["day"] = df["day"].map(lambda d: d.isoformat())
+    int_cols = [c for c in COUNT_COLUMNS if c != "encounter_minutes" and c in df.columns]
+    df[int_cols] = df[int_cols].astype("int64")
+    if "encounter_minutes" in df.columns:
+        df["encounter_minutes"] = df["encounter_minutes"].round(2)
+    return json.loads(df.to_json(orient="records"))
+
+
+def summary(db: Session, d_from: date, d_to: date, doctor_id: int | None = None, group: str = "doctor") -> dict:
+    """
+    Agregado de [d_from, d_to] por doctor o por día, con tasas derivadas y total.
+    """
+    q = db.query(
+        DailyDoctorStats.day,
+        DailyDoctorStats.doctor_id,
+        *[getattr(DailyDoctorStats, c) for c in COUNT_COLUMNS],
+    ).filter(DailyDoctorStats.day >= d_from, DailyDoctorStats.day <= d_to)
+    if doctor_id is not None:
+        q = q.filter(DailyDoctorStats.doctor_id == doctor_id)
+    df = pd.DataFrame(q.all(), columns=["day", "doctor_id", *COUNT_COLUMNS])
+    # sin filas las columnas quedan object y .sum() da ints de Python (0/0 -> ZeroDivisionError)
+    df = df.astype({c: "float64" for c in COUNT_COLUMNS})
+
+    key = "day" if group == "day" else "doctor_id"
+    grouped = df.groupby(key, as_index=False)[list(COUNT_COLUMNS)].sum().sort_values(key)
+    total = df[list(COUNT_COLUMNS)].sum().to_frame().T
+
+    grouped = _rates(grouped)
+    total = _rates(total)
+
+    items = _records(grouped)
+    if key == "doctor_id" and items:
+        ids = [i["doctor_id"] for i in items if i["doctor_id"]]
+        names = dict(db.query(Doctor.id, Doctor.name).filter(Doctor.id.in_(ids)).all()) if ids else {}
+        for i in items:
+            i["doctor_name"] = names.get(i["doctor_id"]) if i["doctor_id"] else "Sin doctor"
+
+    last_computed = db.query(func.max(DailyDoctorStats.computed_at)).scalar()
+    return {
+        "from": d_from.isoformat(),
+        "to": d_to.isoformat(),
+        "group": "day" if key == "day" else "doctor",
+        "items": items,
+        "total": _records(total)[0],
+        "computed_at": last_computed.isoformat(timespec="seconds") if last_computed else None,
+    }
@@ -0,0 +1,127 @@
+# =========================
+# ✅ app/services/assets.py
+# (Assets estáticos con huella en el nombre y precomprimidos)
+# =========================
+"""
+Al arrancar se leen los archivos de app/static, se calcula un hash corto del
+contenido y se guardan en memoria junto con sus versiones gzip/brotli:
+
+    styles.css  ->  /assets/styles.3f2a9c1b0d.css
+
+Como el nombre cambia cuando cambia el contenido, la URL con huella se sirve
+con `Cache-Control: immutable` de un año. Las plantillas usan
+`{{ asset_url('styles.css') }}`; /static sigue montado para enlaces viejos.
+
+`Precompressed` también sirve para cualquier cuerpo fijo (p. ej. /scan).
+"""
+import hashlib
+import mimetypes
+import os
+from dataclasses import dataclass, field
+
+from fastapi import Request, Response
+
+from .. import compression
+
+STATIC_DIR = "app/static"
+ASSETS_PREFIX = "/assets"
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+@dataclass
+class Precompressed:
+    body: bytes
+    media_type: str
+    etag: str = ""
+    variants: dict[str, bytes] = field(default_factory=dict)  # encoding -> cuerpo
+
+    @classmethod
+    def build(cls, body: bytes, media_type: str) -> "Precompressed":
+        item = cls(body=body, media_type=media_type)
+        item.etag = f'"{hashlib.sha256(body).hexdigest()[:20]}"'
+        if compression.is_compressible(media_type) and len(body) >= compression.COMPRESS_MIN_BYTES:
+            for enc in ("br", "gzip"):
+                if enc == "br" and compression.brotli is None:
+                    continue
+                packed = compression.compress(body, enc, best=True)
+                if len(packed) < len(body):
+                    item.variants[enc] = packed
+        return item
+
+    def response(self, request: Request, cache_control: str) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if request.headers.get("if-none-match") == self.etag:
+            return Response(status_code=304, headers=headers)
+
+        for enc in compression.accepted_encodings(request.headers.get("accept-encoding", "")):
+            packed = self.variants.get(enc)
+            if packed is not None:
+                return Response(
+                    content=packed,
+                    media_type=self.media_type,
+                    headers={**headers, "Content-Encoding": enc},
+                )
+        return Response(content=self.body, media_type=self.media_type, headers=headers)
+
+
+@dataclass
+class _Asset:
+    name: str
+    hashed_name: str
+    content: Precompressed
+
+
+_by_name: dict[str, _Asset] = {}
+_by_hashed: dict[str, _Asset] = {}
+
+
+def _media_type(name: str) -> str:
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type in ("application/javascript", "image/svg+xml"):
+        media_type += "; charset=utf-8"
+    return media_type
+
+
+def _hashed(name: str, digest: str) -> str:
+    stem, dot, ext = name.rpartition(".")
+    return f"{stem}.{digest}.{ext}" if dot else f"{name}.{digest}"
+
+
+def build(static_dir: str = STATIC_DIR) -> int:
+    """
+    (Re)construye el manifiesto completo. Devuelve cuántos assets cargó.
+    """
+    by_name, by_hashed = {}, {}
+    for root, _dirs, files in os.walk(static_dir):
+        for fname in sorted(files):
+            path = os.path.join(root, fname)
+            name = os.path.relpath(path, static_dir).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                body = f.read()
+            digest = hashlib.sha256(body).hexdigest()[:10]
+            asset = _Asset(name=name, hashed_name=_hashed(name, digest), content=Precompressed.build(body, _media_type(name)))
+            by_name[name] = asset
+            by_hashed[asset.hashed_name] = asset
+
+    # se reemplazan de una vez: un request concurrente ve el manifiesto viejo o el nuevo
+    global _by_name, _by_hashed
+    _by_name, _by_hashed = by_name, by_hashed
+    return len(by_name)
+
+
+def url(name: str) -> str:
+    """
+    URL con huella para usar en plantillas. Si el asset no existe se cae a
+    /static/<name> (mejor un enlace sin caché que una página rota).
+    """
+    if not _by_name:
+        build()
+    asset = _by_name.get(name)
+    if asset is None:
+        return f"/static/{name}"
+    return f"{ASSETS_PREFIX}/{asset.hashed_name}"
+
+
+def lookup(hashed_name: str) -> Precompressed | None:
+    asset = _by_hashed.get(hashed_name)
+    return asset.content if asset else None
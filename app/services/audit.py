@@ -0,0 +1,196 @@
+# =========================
+# ✅ app/services/audit.py
+# (Auditoría de accesos a datos clínicos: buffer en memoria + escritor por lotes)
+# =========================
+"""
+Quién vio, editó o descargó qué atención, nota o PDF.
+
+Los handlers llaman a `record(...)`, que solo agrega el evento a un buffer en
+memoria (microsegundos, sin ir a la BD). Un hilo escritor lo vacía con un
+INSERT de varias filas cada AUDIT_FLUSH_MS o apenas junta AUDIT_BATCH eventos.
+
+- backpressure: con el buffer lleno (AUDIT_BUFFER_SIZE), `record` despierta
+  al escritor y espera hasta AUDIT_BLOCK_MS a que haya lugar; si la BD no da
+  abasto, el evento se descarta y se cuenta en nexa_audit_events_total;
+- al apagar (lifespan) se escribe todo lo pendiente;
+- sin el hilo (scripts, AUDIT_WRITER=0) `flush()` escribe lo acumulado.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from fastapi import Request
+from sqlalchemy import insert
+
+from ..database import engine
+from ..models import AuditEvent
+from . import metrics
+
+log = logging.getLogger("nexa.audit")
+
+AUDIT_ENABLED = os.getenv("AUDIT_ENABLED", "1") == "1"
+AUDIT_WRITER = os.getenv("AUDIT_WRITER", "1") == "1"
+AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "10000"))
+AUDIT_BATCH = int(os.getenv("AUDIT_BATCH", "500"))
+AUDIT_FLUSH_MS = int(os.getenv("AUDIT_FLUSH_MS", "250"))
+AUDIT_BLOCK_MS = int(os.getenv("AUDIT_BLOCK_MS", "50"))
+AUDIT_RETRIES = 3
+
+EVENTS = metrics.counter(
+    "nexa_audit_events_total", "Eventos de auditoría (queued, written, dropped, failed)", ["result"]
+)
+FLUSH_SECONDS = metrics.histogram("nexa_audit_flush_seconds", "Duración de cada INSERT por lotes de auditoría")
+
+
+class AuditBuffer:
+    """
+    Cola acotada con espera para productores (backpressure) y lectura por lotes.
+    """
+
+    def __init__(self, capacity: int = AUDIT_BUFFER_SIZE, batch: int = AUDIT_BATCH):
+        self.capacity = capacity
+        self.batch = batch
+        self._items: deque[dict] = deque()
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, event: dict, block_seconds: float = AUDIT_BLOCK_MS / 1000) -> bool:
+        with self._cond:
+            if len(self._items) >= self.capacity:
+                self._cond.notify_all()
+                deadline = time.monotonic() + block_seconds
+                while len(self._items) >= self.capacity:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            self._items.append(event)
+            # lote completo: no esperar al próximo tick
+            if len(self._items) >= self.batch:
+                self._cond.notify_all()
+        return True
+
+    def take(self, timeout: float | None = None) -> list[dict]:
+        """
+        Hasta `batch` eventos. Con timeout espera a que se junte un lote o a
+        que venza el plazo, lo que pase primero.
+        """
+        with self._cond:
+            if timeout and len(self._items) < self.batch:
+                self._cond.wait(timeout)
+            n = min(self.batch, len(self._items))
+            out = [self._items.popleft() for _ in range(n)]
+            if out:
+                self._cond.notify_all()  # productores esperando lugar
+            return out
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+
+buffer = AuditBuffer()
+
+
+def record(
+    action: str,
+    resource: str,
+    resource_id,
+    doctor_id: int | None = None,
+    patient_id: int | None = None,
+    request: Request | None = None,
+) -> None:
+    """
+    Encola un evento (action y resource como en AuditEvent). No toca la BD.
+    """
+    if not AUDIT_ENABLED:
+        return
+    event = {
+        "at": datetime.utcnow(),
+        "doctor_id": doctor_id,
+        "action": action,
+        "resource": resource,
+        "resource_id": str(resource_id),
+        "patient_id": patient_id,
+        "ip": request.client.host if request is not None and request.client else None,
+    }
+    if buffer.put(event):
+        EVENTS.inc(result="queued")
+    else:
+        EVENTS.inc(result="dropped")
+        log.warning("Auditoría: buffer lleno, evento descartado (%s %s %s)", action, resource, resource_id)
+
+
+# -------------------------
+# Escritura
+# -------------------------
+def _write(batch: list[dict]) -> bool:
+    for attempt in range(1, AUDIT_RETRIES + 1):
+        t0 = time.perf_counter()
+        try:
+            # executemany: SQLAlchemy lo arma como INSERT ... VALUES (...), (...), ...
+            with engine.begin() as conn:
+                conn.execute(insert(AuditEvent), batch)
+        except Exception:
+            log.exception("Auditoría: no se pudo escribir un lote de %s (intento %s)", len(batch), attempt)
+            time.sleep(0.2 * attempt)
+            continue
+        FLUSH_SECONDS.observe(time.perf_counter() - t0)
+        EVENTS.inc(len(batch), result="written")
+        return True
+    EVENTS.inc(len(batch), result="failed")
+    return False
+
+
+def flush() -> int:
+    """
+    Escribe todo lo pendiente en el hilo actual. Devuelve cuántos eventos escribió.
+    """
+    written = 0
+    while True:
+        batch = buffer.take()
+        if not batch:
+            return written
+        if _write(batch):
+            written += len(batch)
+
+
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+
+
+def _writer_loop():
+    while True:
+        batch = buffer.take(timeout=AUDIT_FLUSH_MS / 1000)
+        if batch:
+            _write(batch)
+        elif _stop.is_set():
+            return
+
+
+def start_writer():
+    global _thread
+    if _thread is not None or not (AUDIT_ENABLED and AUDIT_WRITER):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_writer_loop, name="audit-writer", daemon=True)
+    _thread.start()
+
+
+def stop_writer(timeout: float = 10):
+    """
+    Vacía el buffer y detiene el hilo (lifespan al apagar).
+    """
+    global _thread
+    _stop.set()
+    buffer.wake()
+    if _thread is not None:
+        _thread.join(timeout=timeout)
+        _thread = None
+    # lo que haya quedado (sin hilo, o si el join venció)
+    flush()
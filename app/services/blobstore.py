@@ -0,0 +1,308 @@
+# =========================
+# ✅ app/services/blobstore.py
+# (Almacén de artefactos direccionado por contenido: PDFs, Excel, QR)
+# =========================
+"""
+Cada archivo se guarda una sola vez bajo su SHA-256. Quien lo usa deja una
+referencia (BlobRef: dueño + rol); un mismo contenido generado dos veces no
+ocupa espacio extra. El GC borra blobs sin referencias cuando el total supera
+BLOB_MAX_BYTES (primero los menos usados).
+
+Backends:
+- local (por defecto): BLOB_DIR/ab/cd/<sha256>, se sirve con FileResponse.
+- s3: BLOB_BACKEND=s3 + BLOB_S3_BUCKET (+ BLOB_S3_ENDPOINT para MinIO u otro
+  compatible en local). Requiere boto3.
+
+`python -m app.services.blobstore check` prueba el backend configurado (p. ej.
+contra un MinIO local) con un blob de prueba: put, exists, read, chunks, delete.
+
+Dos renders simultáneos del mismo PDF insertan el mismo Blob / BlobRef: `put`
+y `attach` usan INSERT ... ON CONFLICT, así el segundo no falla con IntegrityError.
+"""
+import hashlib
+import os
+import tempfile
+from datetime import datetime
+from typing import Iterator
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..models import Blob, BlobRef
+
+BLOB_BACKEND = os.getenv("BLOB_BACKEND", "local")
+BLOB_DIR = os.getenv("BLOB_DIR", "./artifacts/blobs")
+BLOB_MAX_BYTES = int(os.getenv("BLOB_MAX_BYTES", str(2 * 1024 ** 3)))  # 2 GB
+
+
+class LocalBackend:
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, sha: str) -> str:
+        return os.path.join(self.root, sha[:2], sha[2:4], sha)
+
+    def exists(self, sha: str) -> bool:
+        return os.path.exists(self.path(sha))
+
+    def put(self, sha: str, content: bytes):
+        path = self.path(sha)
+        if os.path.exists(path):
+            return
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        # escritura atómica: nunca se ve un archivo a medias
+        fd, tmp = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    def read(self, sha: str) -> bytes:
+        with open(self.path(sha), "rb") as f:
+            return f.read()
+
+    def delete(self, sha: str):
+        try:
+            os.remove(self.path(sha))
+        except FileNotFoundError:
+            pass
+
+
+class S3Backend:
+    """
+    Cualquier servicio compatible con S3. Para pruebas locales basta un MinIO
+    (BLOB_S3_ENDPOINT=http://localhost:9000) o pasar un cliente propio.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "blobs/", client=None, endpoint_url: str | None = None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError as e:
+                raise RuntimeError("BLOB_BACKEND=s3 requiere boto3 instalado") from e
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def key(self, sha: str) -> str:
+        return f"{self.prefix}{sha[:2]}/{sha[2:4]}/{sha}"
+
+    def path(self, sha: str) -> None:
+        return None  # no hay archivo local
+
+    def exists(self, sha: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(sha))
+            return True
+        except Exception as e:
+            # solo "no existe" es False; credenciales o red caída no se disimulan
+            code = str(getattr(e, "response", {}).get("Error", {}).get("Code", ""))
+            if code in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, sha: str, content: bytes):
+        if not self.exists(sha):
+            self.client.put_object(Bucket=self.bucket, Key=self.key(sha), Body=content)
+
+    def read(self, sha: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=self.key(sha))["Body"].read()
+
+    def iter_chunks(self, sha: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        body = self.client.get_object(Bucket=self.bucket, Key=self.key(sha))["Body"]
+        while True:
+            chunk = body.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def delete(self, sha: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(sha))
+
+
+def _make_backend():
+    if BLOB_BACKEND == "s3":
+        return S3Backend(
+            bucket=os.environ["BLOB_S3_BUCKET"],
+            prefix=os.getenv("BLOB_S3_PREFIX", "blobs/"),
+            endpoint_url=os.getenv("BLOB_S3_ENDPOINT") or None,
+        )
+    return LocalBackend(BLOB_DIR)
+
+
+backend = _make_backend()
+
+
+# -------------------------
+# API
+# -------------------------
+def _insert(db: Session, model):
+    # INSERT con ON CONFLICT (los dos motores que usamos lo soportan)
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+def put(db: Session, content: bytes, media_type: str | None = None) -> Blob:
+    """
+    Guarda el contenido (si no existía) y devuelve su Blob. No hace commit.
+    """
+    sha = hashlib.sha256(content).hexdigest()
+    backend.put(sha, content)  # idempotente: no reescribe si ya está
+    now = datetime.utcnow()
+    db.execute(
+        _insert(db, Blob)
+        .values(sha256=sha, size_bytes=len(content), media_type=media_type, created_at=now, last_access_at=now)
+        .on_conflict_do_nothing(index_elements=["sha256"])
+    )
+    blob = db.get(Blob, sha)
+    blob.last_access_at = now
+    return blob
+
+
+def attach(
+    db: Session,
+    blob: Blob,
+    owner_type: str,
+    owner_id,
+    role: str,
+    source_fingerprint: str | None = None,
+) -> BlobRef:
+    """
+    Apunta (dueño, rol) a este blob, reemplazando la referencia anterior. No hace commit.
+    """
+    values = {"sha256": blob.sha256, "source_fingerprint": source_fingerprint, "created_at": datetime.utcnow()}
+    db.execute(
+        _insert(db, BlobRef)
+        .values(owner_type=owner_type, owner_id=str(owner_id), role=role, **values)
+        .on_conflict_do_update(index_elements=["owner_type", "owner_id", "role"], set_=values)
+    )
+    ref = get_ref(db, owner_type, owner_id, role)
+    db.refresh(ref)  # si ya estaba en la sesión, que vea lo que escribió el upsert
+    return ref
+
+
+def get_ref(db: Session, owner_type: str, owner_id, role: str) -> BlobRef | None:
+    return (
+        db.query(BlobRef)
+        .filter(BlobRef.owner_type == owner_type, BlobRef.owner_id == str(owner_id), BlobRef.role == role)
+        .first()
+    )
+
+
+def detach(db: Session, owner_type: str, owner_id, role: str | None = None):
+    q = db.query(BlobRef).filter(BlobRef.owner_type == owner_type, BlobRef.owner_id == str(owner_id))
+    if role is not None:
+        q = q.filter(BlobRef.role == role)
+    q.delete(synchronize_session=False)
+
+
+def available(sha: str) -> bool:
+    return backend.exists(sha)
+
+
+def read(sha: str) -> bytes:
+    return backend.read(sha)
+
+
+def response(request: Request | None, sha: str, media_type: str | None, filename: str | None = None) -> Response:
+    """
+    Respuesta para servir un blob. Local: FileResponse (el servidor puede usar
+    sendfile / pathsend). El ETag es el propio hash, así que un cliente que ya
+    lo tiene recibe 304 sin leer disco.
+    """
+    etag = f'"{sha}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if request is not None and request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    path = backend.path(sha)
+    if path is not None:
+        return FileResponse(path, media_type=media_type or "application/octet-stream", filename=filename, headers=headers)
+
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return StreamingResponse(backend.iter_chunks(sha), media_type=media_type or "application/octet-stream", headers=headers)
+
+
+def touch(db: Session, sha: str):
+    blob = db.get(Blob, sha)
+    if blob is not None:
+        blob.last_access_at = datetime.utcnow()
+
+
+def total_bytes(db: Session) -> int:
+    return int(db.query(func.coalesce(func.sum(Blob.size_bytes), 0)).scalar() or 0)
+
+
+def gc(db: Session, max_bytes: int = BLOB_MAX_BYTES) -> int:
+    """
+    Si el almacén supera max_bytes, borra blobs sin referencias (los de acceso
+    más antiguo primero) hasta bajar del límite. Devuelve bytes liberados.
+    """
+    total = total_bytes(db)
+    if total <= max_bytes:
+        return 0
+
+    unreferenced = (
+        db.query(Blob)
+        .outerjoin(BlobRef, BlobRef.sha256 == Blob.sha256)
+        .filter(BlobRef.id.is_(None))
+        .order_by(Blob.last_access_at.asc())
+        .all()
+    )
+    freed = 0
+    for blob in unreferenced:
+        if total - freed <= max_bytes:
+            break
+        backend.delete(blob.sha256)
+        freed += blob.size_bytes or 0
+        db.delete(blob)
+    db.commit()
+    return freed
+
+
+def _expect(ok: bool, what: str):
+    if not ok:
+        raise RuntimeError(f"blobstore check: {what}")
+
+
+def check(store=None) -> list[str]:
+    """
+    Ida y vuelta con un blob de prueba contra el backend (por defecto el
+    configurado). Devuelve los pasos que pasaron; lanza en el primero que falla.
+    """
+    store = store or backend
+    content = f"nexa blobstore check {datetime.utcnow().isoformat()}".encode()
+    sha = hashlib.sha256(content).hexdigest()
+    done = []
+    _expect(not store.exists(sha), "el blob de prueba ya existía")
+    done.append("exists (ausente)")
+    store.put(sha, content)
+    store.put(sha, content)  # idempotente
+    done.append("put")
+    _expect(store.exists(sha), "no aparece tras put")
+    done.append("exists")
+    _expect(store.read(sha) == content, "read devolvió otro contenido")
+    done.append("read")
+    if store.path(sha) is None:
+        # sin archivo local se sirve por trozos (ver response)
+        _expect(b"".join(store.iter_chunks(sha, chunk_size=7)) == content, "iter_chunks devolvió otro contenido")
+        done.append("iter_chunks")
+    store.delete(sha)
+    _expect(not store.exists(sha), "sigue existiendo tras delete")
+    done.append("delete")
+    return done
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] != ["check"]:
+        sys.exit("uso: python -m app.services.blobstore check")
+    for _step in check():
+        print(f"✅ {_step}")
+    print(f"✅ backend {BLOB_BACKEND} OK")
@@ -0,0 +1,320 @@
+# =========================
+# ✅ app/services/booking.py
+# (Reserva de citas sin doble agendamiento)
+# =========================
+"""
+El solapamiento de citas de un mismo doctor lo impide la base de datos:
+
+- Postgres: constraint EXCLUDE USING gist sobre (doctor_id, tsrange) para
+  citas no canceladas (requiere la extensión btree_gist).
+- SQLite: triggers BEFORE INSERT/UPDATE que abortan si hay cruce. SQLite
+  admite un solo escritor a la vez y el trigger corre dentro del mismo
+  INSERT/UPDATE, así que verificar + escribir ya es atómico: `book` y
+  `reschedule` no toman ningún lock propio. Solo `book_series`, que decide
+  qué insertar según lo que leyó, abre la transacción con BEGIN IMMEDIATE.
+
+La verificación previa (`overlaps`) solo sirve para dar un mensaje amable;
+la garantía es el constraint/trigger.
+"""
+import bisect
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models import Appointment
+from . import events, slots
+
+log = logging.getLogger("nexa.booking")
+
+CONSTRAINT_NAME = "appointments_no_overlap"
+
+
+class SlotTaken(Exception):
+    """El horario ya está ocupado por otra cita del doctor."""
+
+
+# -------------------------
+# Instalación del constraint
+# -------------------------
+_PG_CONSTRAINT = f"""
+ALTER TABLE appointments
+ADD CONSTRAINT {CONSTRAINT_NAME}
+EXCLUDE USING gist (
+    doctor_id WITH =,
+    tsrange(start_at, end_at) WITH &&
+) WHERE (status <> 'canceled')
+"""
+
+_SQLITE_OVERLAP = """
+SELECT RAISE(ABORT, '{name}')
+WHERE EXISTS (
+    SELECT 1 FROM appointments a
+    WHERE a.doctor_id = NEW.doctor_id
+      AND a.status <> 'canceled'
+      AND a.start_at < NEW.end_at
+      AND a.end_at > NEW.start_at
+      {extra}
+);
+"""
+
+_SQLITE_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {CONSTRAINT_NAME}_ins
+    BEFORE INSERT ON appointments
+    WHEN NEW.status <> 'canceled'
+    BEGIN {_SQLITE_OVERLAP.format(name=CONSTRAINT_NAME, extra="")} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {CONSTRAINT_NAME}_upd
+    BEFORE UPDATE OF doctor_id, start_at, end_at, status ON appointments
+    WHEN NEW.status <> 'canceled' AND (
+        OLD.status = 'canceled' OR NEW.doctor_id <> OLD.doctor_id
+        OR NEW.start_at <> OLD.start_at OR NEW.end_at <> OLD.end_at
+    )
+    BEGIN {_SQLITE_OVERLAP.format(name=CONSTRAINT_NAME, extra="AND a.id <> NEW.id")} END
+    """,
+)
+
+
+def install_overlap_guard(engine: Engine):
+    """
+    Crea el constraint (Postgres) o los triggers (SQLite) si no existen.
+    Idempotente: se llama al arrancar, después de create_all.
+    """
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM pg_constraint WHERE conname = :n"), {"n": CONSTRAINT_NAME}
+            ).first()
+            if exists:
+                return
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(_PG_CONSTRAINT))
+        except IntegrityError:
+            # ⚠️ ya hay citas cruzadas en la tabla: hay que limpiarlas a mano
+            log.error("No se pudo crear %s: existen citas solapadas", CONSTRAINT_NAME)
+    elif dialect == "sqlite":
+        # se recrean siempre (es barato) para que un cambio de definición aplique
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {CONSTRAINT_NAME}_ins")
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {CONSTRAINT_NAME}_upd")
+            for ddl in _SQLITE_TRIGGERS:
+                conn.exec_driver_sql(ddl)
+
+
+def _is_overlap_error(e: IntegrityError) -> bool:
+    # Postgres: exclusion_violation (23P01); SQLite: mensaje del RAISE
+    code = getattr(e.orig, "pgcode", None) or getattr(e.orig, "sqlstate", None)
+    return code == "23P01" or CONSTRAINT_NAME in str(e.orig)
+
+
+# -------------------------
+# Lectura + escritura en una transacción (SQLite)
+# -------------------------
+@contextmanager
+def write_lock(db: Session):
+    """
+    En SQLite toma el lock de escritura de la base (BEGIN IMMEDIATE) antes de
+    leer + escribir; los demás escritores esperan con el busy timeout del
+    driver. En Postgres no hace nada: el constraint resuelve la carrera.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        yield
+        return
+
+    dbapi_conn = db.connection().connection.dbapi_connection
+    # si la sesión ya escribió, la transacción ya tiene el lock de escritura
+    if not dbapi_conn.in_transaction:
+        dbapi_conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        db.rollback()
+        raise
+
+
+def overlaps(
+    db: Session,
+    doctor_id: int,
+    start_at: datetime,
+    end_at: datetime,
+    exclude_id: int | None = None,
+) -> bool:
+    q = (
+        db.query(Appointment)
+        .filter(Appointment.doctor_id == doctor_id)
+        .filter(Appointment.status != "canceled")
+        .filter(Appointment.start_at < end_at)
+        .filter(Appointment.end_at > start_at)
+    )
+    if exclude_id:
+        q = q.filter(Appointment.id != exclude_id)
+    return db.query(q.exists()).scalar()
+
+
+def _commit(db: Session, flush_only: bool = False):
+    try:
+        db.flush() if flush_only else db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if _is_overlap_error(e):
+            raise SlotTaken("Ese horario ya está ocupado") from e
+        raise
+
+
+# -------------------------
+# API del servicio
+# -------------------------
+def book(
+    db: Session,
+    doctor_id: int,
+    patient_id: int,
+    start_at: datetime,
+    end_at: datetime,
+    reason: str | None = None,
+    notes: str | None = None,
+) -> Appointment:
+    """
+    Crea la cita o lanza SlotTaken. Hace commit.
+    """
+    # ⚡ sin lock: si otro reserva entre esta lectura y el INSERT, el
+    # constraint/trigger lo rechaza y _commit lo convierte en SlotTaken
+    if overlaps(db, doctor_id, start_at, end_at):
+        raise SlotTaken("Ese horario ya está ocupado")
+
+    appt = Appointment(
+        doctor_id=doctor_id,
+        patient_id=patient_id,
+        start_at=start_at,
+        end_at=end_at,
+        status="scheduled",
+        reason=reason,
+        notes=notes,
+        updated_at=datetime.utcnow(),
+    )
+    db.add(appt)
+    _commit(db)
+    events.publish(doctor_id, "appointment", events.appointment_payload(appt, "created"))
+    return appt
+
+
+def reschedule(db: Session, appt: Appointment, start_at: datetime, end_at: datetime) -> Appointment:
+    """
+    Mueve la cita o lanza SlotTaken. Hace commit.
+    """
+    if overlaps(db, appt.doctor_id, start_at, end_at, exclude_id=appt.id):
+        raise SlotTaken("Ese horario ya está ocupado")
+
+    appt.start_at = start_at
+    appt.end_at = end_at
+    appt.updated_at = datetime.utcnow()
+    _commit(db)
+    events.publish(appt.doctor_id, "appointment", events.appointment_payload(appt, "rescheduled"))
+    return appt
+
+
+# -------------------------
+# Series (protocolos de N sesiones)
+# -------------------------
+@dataclass
+class SeriesResult:
+    created: list[dict] = field(default_factory=list)  # {"id", "start", "end"}
+    conflicts: list[dict] = field(default_factory=list)
+
+
+def series_occurrences(
+    start_date: date,
+    weekdays: list[int],
+    at: time,
+    sessions: int,
+    duration: timedelta,
+) -> list[tuple[datetime, datetime]]:
+    """
+    Fechas de la serie: `sessions` ocurrencias en los días de semana dados
+    (0 = lunes), a partir de start_date inclusive.
+    """
+    days = sorted(set(weekdays))
+    out = []
+    d = start_date
+    while len(out) < sessions:
+        if d.weekday() in days:
+            s = datetime.combine(d, at)
+            out.append((s, s + duration))
+        d += timedelta(days=1)
+    return out
+
+
+def book_series(
+    db: Session,
+    doctor_id: int,
+    patient_id: int,
+    occurrences: list[tuple[datetime, datetime]],
+    reason: str | None = None,
+    skip_conflicts: bool = False,
+) -> SeriesResult:
+    """
+    Verifica toda la serie con una sola consulta de rango y la inserta en una
+    sola transacción. Si hay choques y no se pide saltarlos, no inserta nada.
+    """
+    result = SeriesResult()
+    if not occurrences:
+        return result
+
+    first = min(s for s, _ in occurrences)
+    last = max(e for _, e in occurrences)
+
+    with write_lock(db):
+        # ⚡ una consulta para todo el rango (+ margen para sugerencias)
+        busy = slots.busy_intervals(db, doctor_id, first, last + timedelta(days=4))
+        merged = slots.merge(busy)
+        ends = [e for _, e in merged]
+
+        ok = []
+        for s, e in occurrences:
+            i = bisect.bisect_right(ends, s)
+            if i < len(merged) and merged[i][0] < e:
+                result.conflicts.append({
+                    "start": s,
+                    "end": e,
+                    "alternatives": slots.suggest(busy, s, e - s),
+                })
+            else:
+                ok.append((s, e))
+
+        if result.conflicts and not skip_conflicts:
+            db.rollback()
+            return result
+
+        now = datetime.utcnow()
+        appts = [
+            Appointment(
+                doctor_id=doctor_id,
+                patient_id=patient_id,
+                start_at=s,
+                end_at=e,
+                status="scheduled",
+                reason=reason,
+                updated_at=now,
+            )
+            for s, e in ok
+        ]
+        db.add_all(appts)
+        _commit(db, flush_only=True)
+        # ids antes del commit: así no se recarga cada fila después
+        result.created = [{"id": a.id, "start": a.start_at, "end": a.end_at} for a in appts]
+        _commit(db)
+    if result.created:
+        events.publish(doctor_id, "appointment", {
+            "action": "series",
+            "days": sorted({a["start"].date().isoformat() for a in result.created}),
+        })
+    return result
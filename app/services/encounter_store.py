@@ -0,0 +1,305 @@
+# =========================
+# ✅ app/services/encounter_store.py
+# (Atenciones: firma, archivado en frío y lectura caliente + archivo)
+# =========================
+"""
+Las atenciones firmadas y cerradas hace más de ARCHIVE_AFTER_DAYS salen de
+las tablas calientes (encounters, clinical_notes, encounter_evolutions,
+clinical_note_revisions) a encounters_archive: la cabecera en columnas y
+todo lo demás en un JSON comprimido con zlib (`payload`, diferido).
+
+- el scheduler archiva un lote de ARCHIVE_BATCH por pasada (solo el líder);
+  `python -m app.services.encounter_store` archiva todo lo pendiente;
+- la atención conserva su id: URLs, PDFs guardados y blob_refs siguen valiendo;
+- nunca se archiva la de id más alto (SQLite reutilizaría el id si se borra
+  la última fila de encounters).
+
+Lectura: `get`, `find` y `headers` devuelven atenciones de ambos lados; las
+archivadas como ArchivedEncounterView (solo lectura, `archived = True`), con
+los mismos atributos que Encounter + `note`, `evolutions` y `revisions`.
+"""
+import json
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta
+from functools import cached_property
+from types import SimpleNamespace
+
+from sqlalchemy import func, inspect, insert, literal, select, union_all
+from sqlalchemy.orm import Session, joinedload, undefer
+
+from ..models import (
+    Appointment,
+    ArchivedEncounter,
+    ClinicalNote,
+    ClinicalNoteRevision,
+    Encounter,
+    EncounterEvolution,
+)
+
+log = logging.getLogger("nexa.encounter_store")
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))  # 0 = no archivar
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "200"))
+
+PAYLOAD_FORMAT = 1
+_DATETIME_KEYS = {"created_at", "updated_at", "ended_at", "signed_at"}
+
+
+# -------------------------
+# Firma
+# -------------------------
+def sign(db: Session, enc: Encounter, now: datetime | None = None) -> bool:
+    """
+    Firma (finaliza) una atención cerrada: la nota queda de solo lectura y la
+    atención pasa a ser candidata a archivo. False si ya estaba firmada.
+    """
+    if enc.is_signed:
+        return False
+    enc.is_signed = True
+    enc.signed_at = now or datetime.utcnow()
+    db.commit()
+    return True
+
+
+# -------------------------
+# Payload (JSON + zlib)
+# -------------------------
+def _row_dict(obj) -> dict:
+    out = {}
+    for attr in inspect(obj).mapper.column_attrs:
+        v = getattr(obj, attr.key)
+        out[attr.key] = v.isoformat() if isinstance(v, datetime) else v
+    return out
+
+
+def _parse_dates(d: dict) -> dict:
+    for k in _DATETIME_KEYS & d.keys():
+        if d[k]:
+            d[k] = datetime.fromisoformat(d[k])
+    return d
+
+
+def pack(enc: Encounter, note, evolutions, revisions) -> bytes:
+    data = {
+        "format": PAYLOAD_FORMAT,
+        "encounter": _row_dict(enc),
+        "note": _row_dict(note) if note else None,
+        "evolutions": [_row_dict(e) for e in evolutions],
+        "revisions": [_row_dict(r) for r in revisions],
+    }
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(raw.encode("utf-8"), 6)
+
+
+def unpack(payload: bytes) -> dict:
+    data = json.loads(zlib.decompress(payload).decode("utf-8"))
+    data["encounter"] = _parse_dates(data["encounter"])
+    data["note"] = _parse_dates(data["note"]) if data["note"] else None
+    data["evolutions"] = [_parse_dates(e) for e in data["evolutions"]]
+    data["revisions"] = [_parse_dates(r) for r in data["revisions"]]
+    return data
+
+
+# -------------------------
+# Vista de solo lectura de una archivada
+# -------------------------
+class ArchivedEncounterView:
+    archived = True
+    is_signed = True
+
+    def __init__(self, row: ArchivedEncounter):
+        self._row = row
+
+    def __getattr__(self, name):
+        # cabecera (id, patient_id, created_at...) y relaciones patient / doctor
+        return getattr(self._row, name)
+
+    @cached_property
+    def _data(self) -> dict:
+        return unpack(self._row.payload)
+
+    @cached_property
+    def note(self):
+        note = self._data["note"]
+        return SimpleNamespace(**note) if note else None
+
+    @cached_property
+    def evolutions(self) -> list:
+        evols = [SimpleNamespace(**e) for e in self._data["evolutions"]]
+        return sorted(evols, key=lambda e: (e.created_at, e.id))
+
+    @cached_property
+    def revisions(self) -> list:
+        # ascendente por versión, como las espera note_revisions.replay
+        return sorted((SimpleNamespace(**r) for r in self._data["revisions"]), key=lambda r: r.version)
+
+
+# -------------------------
+# Lectura (caliente + archivo)
+# -------------------------
+def get_archived(db: Session, encounter_id: int) -> ArchivedEncounterView | None:
+    row = (
+        db.query(ArchivedEncounter)
+        .options(joinedload(ArchivedEncounter.patient), joinedload(ArchivedEncounter.doctor))
+        .filter(ArchivedEncounter.id == encounter_id)
+        .first()
+    )
+    return ArchivedEncounterView(row) if row else None
+
+
+def get(db: Session, encounter_id: int):
+    """
+    La atención `encounter_id`, caliente (Encounter) o archivada (vista); None si no existe.
+    """
+    enc = db.query(Encounter).filter(Encounter.id == encounter_id).first()
+    return enc if enc else get_archived(db, encounter_id)
+
+
+def find(
+    db: Session,
+    patient_ids: list[int] | None = None,
+    doctor_id: int | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    newest_first: bool = False,
+    limit: int | None = None,
+    with_payload: bool = False,
+) -> list:
+    """
+    Atenciones de ambos lados que cumplen los filtros (created_at en [start, end)),
+    ordenadas por (created_at, id). Doctor y paciente vienen cargados.
+    """
+    def filtered(model):
+        q = db.query(model).options(joinedload(model.patient), joinedload(model.doctor))
+        if with_payload and model is ArchivedEncounter:
+            # en la misma consulta, no una lectura por atención
+            q = q.options(undefer(ArchivedEncounter.payload))
+        if patient_ids is not None:
+            q = q.filter(model.patient_id.in_(patient_ids))
+        if doctor_id is not None:
+            q = q.filter(model.doctor_id == doctor_id)
+        if start is not None:
+            q = q.filter(model.created_at >= start)
+        if end is not None:
+            q = q.filter(model.created_at < end)
+        order = (model.created_at.desc(), model.id.desc()) if newest_first else (model.created_at, model.id)
+        q = q.order_by(*order)
+        return q.limit(limit).all() if limit is not None else q.all()
+
+    items = filtered(Encounter) + [ArchivedEncounterView(r) for r in filtered(ArchivedEncounter)]
+    items.sort(key=lambda e: (e.created_at, e.id), reverse=newest_first)
+    return items[:limit] if limit is not None else items
+
+
+def headers(patient_id: int | None = None):
+    """
+    Subquery UNION ALL con la cabecera de las atenciones calientes y archivadas
+    (id, patient_id, doctor_id, visit_type, chief_complaint_short, created_at,
+    ended_at, is_signed, archived). Para paginar en SQL sobre ambos lados.
+    """
+    def side(model, is_signed, archived):
+        stmt = select(
+            model.id,
+            model.patient_id,
+            model.doctor_id,
+            model.visit_type,
+            model.chief_complaint_short,
+            model.created_at,
+            model.ended_at,
+            is_signed.label("is_signed"),
+            literal(archived).label("archived"),
+        )
+        # el filtro va dentro de cada lado para que use su índice (patient_id, created_at, id)
+        return stmt.where(model.patient_id == patient_id) if patient_id is not None else stmt
+
+    return union_all(
+        side(Encounter, Encounter.is_signed, False),
+        side(ArchivedEncounter, literal(True), True),
+    ).subquery("encounter_headers")
+
+
+# -------------------------
+# Archivado
+# -------------------------
+def archive_batch(db: Session, now: datetime | None = None, batch: int = ARCHIVE_BATCH) -> int:
+    """
+    Mueve al archivo un lote de atenciones firmadas cerradas antes del corte,
+    en una transacción. Devuelve cuántas movió.
+    """
+    if ARCHIVE_AFTER_DAYS <= 0:
+        return 0
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=ARCHIVE_AFTER_DAYS)
+
+    newest_id = db.query(func.max(Encounter.id)).scalar()
+    encs = (
+        db.query(Encounter)
+        .filter(Encounter.is_signed.is_(True), Encounter.ended_at < cutoff, Encounter.id != newest_id)
+        .order_by(Encounter.id)
+        .limit(batch)
+        .all()
+    )
+    if not encs:
+        return 0
+    ids = [e.id for e in encs]
+
+    notes = {n.encounter_id: n for n in db.query(ClinicalNote).filter(ClinicalNote.encounter_id.in_(ids)).all()}
+    evols: dict[int, list] = {}
+    for ev in db.query(EncounterEvolution).filter(EncounterEvolution.encounter_id.in_(ids)).all():
+        evols.setdefault(ev.encounter_id, []).append(ev)
+    revs: dict[int, list] = {}
+    for r in db.query(ClinicalNoteRevision).filter(ClinicalNoteRevision.encounter_id.in_(ids)).all():
+        revs.setdefault(r.encounter_id, []).append(r)
+    appts = dict(
+        db.query(Appointment.encounter_id, Appointment.id).filter(Appointment.encounter_id.in_(ids)).all()
+    )
+
+    rows = [
+        {
+            "id": e.id,
+            "patient_id": e.patient_id,
+            "doctor_id": e.doctor_id,
+            "visit_type": e.visit_type,
+            "chief_complaint_short": e.chief_complaint_short,
+            "created_at": e.created_at,
+            "ended_at": e.ended_at,
+            "signed_at": e.signed_at,
+            "appointment_id": appts.get(e.id),
+            "archived_at": now,
+            "payload": pack(e, notes.get(e.id), evols.get(e.id, []), revs.get(e.id, [])),
+        }
+        for e in encs
+    ]
+    db.execute(insert(ArchivedEncounter), rows)
+
+    # sin pasar por el ORM: el resumen por paciente ya cuenta el archivo (mismo total)
+    db.query(Appointment).filter(Appointment.encounter_id.in_(ids)).update(
+        {"encounter_id": None}, synchronize_session=False
+    )
+    for model in (ClinicalNoteRevision, EncounterEvolution, ClinicalNote):
+        db.query(model).filter(model.encounter_id.in_(ids)).delete(synchronize_session=False)
+    db.query(Encounter).filter(Encounter.id.in_(ids)).delete(synchronize_session=False)
+    # los objetos cargados ya no existen en la BD
+    for obj in [*encs, *notes.values(), *(x for v in evols.values() for x in v), *(x for v in revs.values() for x in v)]:
+        db.expunge(obj)
+    db.commit()
+    return len(ids)
+
+
+def archive_all(db: Session, now: datetime | None = None) -> int:
+    total = 0
+    while True:
+        n = archive_batch(db, now=now)
+        if not n:
+            return total
+        total += n
+        log.info("%s atenciones archivadas (total %s)", n, total)
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal
+
+    with SessionLocal() as _db:
+        print(f"✅ atenciones archivadas: {archive_all(_db)}")
@@ -0,0 +1,193 @@
+# =========================
+# ✅ app/services/events.py
+# (Pub/sub de cambios de agenda y check-ins por doctor)
+# =========================
+"""
+Bus en memoria: cada conexión SSE se suscribe con el id de su doctor y
+recibe los eventos que se publican para ese doctor.
+
+`publish` se puede llamar desde rutas síncronas (threadpool) o desde el
+event loop. Siempre se llama DESPUÉS del commit.
+
+Con varios procesos/instancias sobre Postgres (EVENTS_PG_NOTIFY=1), la
+publicación va por NOTIFY y un hilo con LISTEN la reparte localmente en
+cada proceso, incluido el que publicó.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import select
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlalchemy import text
+
+from ..database import engine
+
+log = logging.getLogger("nexa.events")
+
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+PG_CHANNEL = "nexa_events"
+PG_NOTIFY = os.getenv("EVENTS_PG_NOTIFY", "0") == "1" and engine.dialect.name == "postgresql"
+
+
+@dataclass(eq=False)
+class Subscriber:
+    doctor_id: int
+    loop: asyncio.AbstractEventLoop
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE))
+
+
+class EventBus:
+    def __init__(self):
+        self._subs: dict[int, set[Subscriber]] = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+
+    # -------------------------
+    # Suscripción (desde el event loop)
+    # -------------------------
+    def subscribe(self, doctor_id: int) -> Subscriber:
+        sub = Subscriber(doctor_id=doctor_id, loop=asyncio.get_running_loop())
+        with self._lock:
+            self._subs.setdefault(doctor_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        with self._lock:
+            subs = self._subs.get(sub.doctor_id)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.doctor_id]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(s) for s in self._subs.values())
+
+    # -------------------------
+    # Publicación
+    # -------------------------
+    def publish(self, doctor_id: int, kind: str, data: dict | None = None):
+        event = {
+            "type": kind,
+            "doctor_id": doctor_id,
+            "data": data or {},
+            "ts": datetime.utcnow().isoformat(timespec="seconds"),
+        }
+        if PG_NOTIFY:
+            try:
+                _pg_notify(event)
+                return
+            except Exception:
+                log.exception("NOTIFY falló; se entrega solo en este proceso")
+        self.dispatch(event)
+
+    def dispatch(self, event: dict):
+        with self._lock:
+            subs = list(self._subs.get(event["doctor_id"], ()))
+        if not subs:
+            return
+        event = {**event, "id": next(self._seq)}
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(_offer, sub, event)
+            except RuntimeError:
+                # el loop de esa conexión ya cerró
+                self.unsubscribe(sub)
+
+
+def _offer(sub: Subscriber, event: dict):
+    try:
+        sub.queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # cliente lento: se descarta lo acumulado y se le pide recargar
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait({**event, "type": "resync", "data": {}})
+
+
+bus = EventBus()
+
+
+def publish(doctor_id: int | None, kind: str, data: dict | None = None):
+    if doctor_id is None:
+        return
+    try:
+        bus.publish(int(doctor_id), kind, data)
+    except Exception:
+        # un evento perdido no debe romper la escritura que ya se hizo
+        log.exception("No se pudo publicar %s", kind)
+
+
+def appointment_payload(appt, action: str) -> dict:
+    return {
+        "action": action,
+        "id": appt.id,
+        "day": appt.start_at.date().isoformat(),
+        "start": appt.start_at.strftime("%H:%M"),
+        "end": appt.end_at.strftime("%H:%M"),
+        "status": appt.status,
+    }
+
+
+# -------------------------
+# Puente Postgres LISTEN/NOTIFY
+# -------------------------
+def _pg_notify(event: dict):
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_notify(:ch, :payload)"), {"ch": PG_CHANNEL, "payload": json.dumps(event)})
+        conn.commit()
+
+
+_listener: threading.Thread | None = None
+_stop = threading.Event()
+
+
+def _listen_loop():
+    while not _stop.is_set():
+        raw = None
+        try:
+            raw = engine.raw_connection()
+            pg = raw.driver_connection
+            pg.set_isolation_level(0)  # autocommit: LISTEN necesita recibir fuera de transacción
+            pg.cursor().execute(f"LISTEN {PG_CHANNEL}")
+            while not _stop.is_set():
+                if select.select([pg], [], [], 5) == ([], [], []):
+                    continue
+                pg.poll()
+                while pg.notifies:
+                    note = pg.notifies.pop(0)
+                    try:
+                        bus.dispatch(json.loads(note.payload))
+                    except Exception:
+                        log.exception("Evento NOTIFY inválido")
+        except Exception:
+            log.exception("LISTEN %s se cayó; reintentando", PG_CHANNEL)
+            _stop.wait(3)
+        finally:
+            if raw is not None:
+                try:
+                    raw.invalidate()
+                except Exception:
+                    pass
+
+
+def start_listener():
+    global _listener
+    if not PG_NOTIFY or _listener is not None:
+        return
+    _stop.clear()
+    _listener = threading.Thread(target=_listen_loop, name="events-listen", daemon=True)
+    _listener.start()
+
+
+def stop_listener():
+    global _listener
+    _stop.set()
+    if _listener is not None:
+        _listener.join(timeout=10)
+    _listener = None
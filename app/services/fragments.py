@@ -0,0 +1,62 @@
+# =========================
+# ✅ app/services/fragments.py
+# (Caché LRU de fragmentos HTML ya renderizados)
+# =========================
+"""
+Para secciones de solo lectura que se ven muchas veces (nota de una atención
+cerrada, lista de evoluciones). La clave incluye la versión de los datos
+(p. ej. ClinicalNote.version), así que nunca hace falta invalidar: una
+versión nueva es otra clave y la vieja termina saliendo por LRU.
+
+Es por proceso; con varios workers cada uno arma su copia.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+from markupsafe import Markup
+
+from . import metrics
+
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", "500"))
+
+LOOKUPS = metrics.counter("nexa_fragment_cache_total", "Consultas a la caché de fragmentos", ["result"])
+
+
+class FragmentCache:
+    def __init__(self, max_entries: int = FRAGMENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._items: OrderedDict[Hashable, Markup] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Markup | None:
+        with self._lock:
+            html = self._items.get(key)
+            if html is not None:
+                self._items.move_to_end(key)
+        LOOKUPS.inc(result="hit" if html is not None else "miss")
+        return html
+
+    def set(self, key: Hashable, html: str) -> Markup:
+        html = Markup(html)
+        with self._lock:
+            self._items[key] = html
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return html
+
+    def get_or_render(self, key: Hashable, render: Callable[[], str]) -> Markup:
+        html = self.get(key)
+        if html is None:
+            # se renderiza fuera del lock: dos requests pueden hacerlo a la vez, da igual
+            html = self.set(key, render())
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+cache = FragmentCache()
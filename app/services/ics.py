@@ -0,0 +1,237 @@
+# =========================
+# ✅ app/services/ics.py
+# (Feed iCalendar por doctor, con caché incremental)
+# =========================
+"""
+El calendario del teléfono consulta el feed cada pocos minutos. Por doctor
+se guarda en memoria el VEVENT de cada cita y la marca del último cambio:
+
+- si la marca (max(updated_at|created_at), cantidad) no cambió -> 304 o el
+  cuerpo ya armado, sin regenerar nada;
+- si cambió -> solo se consultan y rearman las citas modificadas desde la
+  última marca;
+- si cambió la ventana (nuevo día) o la cantidad no cuadra -> se rearma todo.
+"""
+import hashlib
+import hmac
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .. import clinic_time
+from ..models import Appointment, Doctor, Patient
+
+log = logging.getLogger("nexa.ics")
+
+# 🔒 sin secreto propio no hay feeds: el valor por defecto del JWT es público
+# y con él cualquiera podría calcular la URL de cualquier doctor
+ICS_SECRET = os.getenv("ICS_SECRET") or os.getenv("JWT_SECRET") or ""
+ICS_PAST_DAYS = int(os.getenv("ICS_PAST_DAYS", "30"))
+ICS_FUTURE_DAYS = int(os.getenv("ICS_FUTURE_DAYS", "180"))
+
+PRODID = "-//NexaCenter//Agenda//ES"
+
+
+def enabled() -> bool:
+    return bool(ICS_SECRET)
+
+
+if not enabled():
+    log.error("ICS_SECRET/JWT_SECRET sin configurar: los feeds de calendario quedan deshabilitados")
+
+
+def feed_token(doctor_id: int) -> str:
+    """
+    Token estable por doctor (HMAC), para la URL secreta del feed.
+    """
+    mac = hmac.new(ICS_SECRET.encode(), f"ics:{doctor_id}".encode(), hashlib.sha256)
+    return mac.hexdigest()[:32]
+
+
+def check_token(doctor_id: int, token: str) -> bool:
+    if not enabled():
+        return False
+    return hmac.compare_digest(feed_token(doctor_id), token or "")
+
+
+def feed_url(doctor_id: int) -> str | None:
+    if not enabled():
+        return None
+    return f"/ics/{doctor_id}/{feed_token(doctor_id)}.ics"
+
+
+# -------------------------
+# Formato iCalendar (RFC 5545)
+# -------------------------
+def _esc(value: str | None) -> str:
+    v = value or ""
+    return v.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n")
+
+
+def _fold(line: str) -> str:
+    # líneas de máx. 75 octetos; la continuación empieza con un espacio
+    raw = line.encode("utf-8")
+    if len(raw) <= 75:
+        return line
+    parts, cur = [], b""
+    for ch in line:
+        b = ch.encode("utf-8")
+        if len(cur) + len(b) > (75 if not parts else 74):
+            parts.append(cur.decode("utf-8"))
+            cur = b""
+        cur += b
+    parts.append(cur.decode("utf-8"))
+    return "\r\n ".join(parts)
+
+
+def _dt(value: datetime) -> str:
+    # marcas de cambio (DTSTAMP, LAST-MODIFIED): utcnow, van en UTC
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def _local_dt(value: datetime) -> str:
+    # start_at/end_at son la hora de pared de la clínica tal como se cargó:
+    # hora "flotante" (sin Z ni TZID), el calendario la muestra tal cual
+    return value.strftime("%Y%m%dT%H%M%S")
+
+
+def _vevent(appt_id, start_at, end_at, status, reason, patient_name, changed_at) -> str:
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:appt-{appt_id}@nexacenter",
+        f"DTSTAMP:{_dt(changed_at)}",
+        f"LAST-MODIFIED:{_dt(changed_at)}",
+        f"SEQUENCE:{int(changed_at.timestamp()) // 60 % 2_000_000_000}",
+        f"DTSTART:{_local_dt(start_at)}",
+        f"DTEND:{_local_dt(end_at)}",
+        f"SUMMARY:{_esc('Cita: ' + (patient_name or 'Paciente'))}",
+        f"STATUS:{'TENTATIVE' if status == 'scheduled' else 'CONFIRMED'}",
+    ]
+    if reason:
+        lines.append(f"DESCRIPTION:{_esc(reason)}")
+    lines.append("END:VEVENT")
+    return "\r\n".join(_fold(line) for line in lines)
+
+
+# -------------------------
+# Caché incremental
+# -------------------------
+@dataclass
+class _Feed:
+    window_start: date
+    stamp: datetime | None = None
+    count: int = 0
+    events: dict[int, tuple[datetime, str]] = field(default_factory=dict)  # id -> (start_at, VEVENT)
+    body: bytes = b""
+    etag: str = ""
+
+
+_feeds: dict[int, _Feed] = {}
+_lock = threading.Lock()
+
+
+def _window(today: date) -> tuple[datetime, datetime]:
+    start = datetime.combine(today - timedelta(days=ICS_PAST_DAYS), datetime.min.time())
+    end = datetime.combine(today + timedelta(days=ICS_FUTURE_DAYS + 1), datetime.min.time())
+    return start, end
+
+
+def _changed_at():
+    return func.coalesce(Appointment.updated_at, Appointment.created_at)
+
+
+def _current_stamp(db: Session, doctor_id: int, start: datetime, end: datetime):
+    """
+    Marca barata: una consulta agregada. Incluye canceladas a propósito:
+    cancelar una cita tiene que cambiar la marca.
+    """
+    stamp, total = (
+        db.query(func.max(_changed_at()), func.count(Appointment.id))
+        .filter(Appointment.doctor_id == doctor_id)
+        .filter(Appointment.start_at >= start)
+        .filter(Appointment.start_at < end)
+        .one()
+    )
+    return stamp, total
+
+
+def _load_rows(db: Session, doctor_id: int, start: datetime, end: datetime, since: datetime | None):
+    q = db.query(
+        Appointment.id, Appointment.start_at, Appointment.end_at, Appointment.status,
+        Appointment.reason, Patient.full_name, _changed_at().label("changed_at"),
+    ).join(Patient, Patient.id == Appointment.patient_id)
+    q = q.filter(Appointment.doctor_id == doctor_id)
+    if since is not None:
+        # sin filtro de ventana ni de estado: hay que ver también las citas
+        # canceladas o reagendadas fuera de la ventana para sacarlas del feed
+        q = q.filter(_changed_at() >= since)
+    else:
+        q = (
+            q.filter(Appointment.status != "canceled")
+            .filter(Appointment.start_at >= start)
+            .filter(Appointment.start_at < end)
+        )
+    return q.all()
+
+
+def _render(doctor: Doctor, feed: _Feed):
+    head = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        _fold(f"X-WR-CALNAME:{_esc('NexaCenter • ' + doctor.name)}"),
+        "X-PUBLISHED-TTL:PT5M",
+    ]
+    ordered = sorted(feed.events.items(), key=lambda kv: (kv[1][0], kv[0]))
+    parts = head + [vevent for _, (_, vevent) in ordered] + ["END:VCALENDAR", ""]
+    feed.body = "\r\n".join(parts).encode("utf-8")
+    stamp_s = feed.stamp.strftime("%Y%m%d%H%M%S%f") if feed.stamp else "0"
+    feed.etag = f'W/"ics-{doctor.id}-{feed.window_start:%Y%m%d}-{stamp_s}-{feed.count}"'
+
+
+def get_feed(db: Session, doctor: Doctor, today: date | None = None) -> tuple[str, bytes]:
+    """
+    (etag, cuerpo .ics) del doctor, regenerando solo lo necesario.
+    """
+    today = today or clinic_time.today()
+    start, end = _window(today)
+    stamp, total = _current_stamp(db, doctor.id, start, end)
+
+    with _lock:
+        feed = _feeds.get(doctor.id)
+        if feed is not None and feed.window_start == start.date() and feed.stamp == stamp and feed.count == total:
+            return feed.etag, feed.body
+
+        incremental = (
+            feed is not None
+            and feed.window_start == start.date()
+            and feed.stamp is not None
+            and total >= feed.count  # en esta app no se borran citas; si baja, rearmar
+        )
+        if not incremental:
+            feed = _Feed(window_start=start.date())
+            rows = _load_rows(db, doctor.id, start, end, since=None)
+        else:
+            rows = _load_rows(db, doctor.id, start, end, since=feed.stamp)
+
+        for r in rows:
+            if r.status == "canceled" or not (start <= r.start_at < end):
+                feed.events.pop(r.id, None)
+            else:
+                feed.events[r.id] = (
+                    r.start_at,
+                    _vevent(r.id, r.start_at, r.end_at, r.status, r.reason, r.full_name, r.changed_at or r.start_at),
+                )
+
+        feed.stamp = stamp
+        feed.count = total
+        _render(doctor, feed)
+        _feeds[doctor.id] = feed
+        return feed.etag, feed.body
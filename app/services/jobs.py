@@ -0,0 +1,358 @@
+# =========================
+# ✅ app/services/jobs.py
+# (Cola de tareas local respaldada por la tabla "jobs")
+# =========================
+import json
+import logging
+import os
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models import Job
+from . import audit, blobstore
+
+log = logging.getLogger("nexa.jobs")
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS", "24"))
+JOB_CLEANUP_EVERY_SECONDS = 15 * 60
+# un job "running" sin latido durante JOB_LEASE_SECONDS quedó huérfano (proceso caído)
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+# un job que tumba al proceso (OOM, segfault) no se reintenta para siempre
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+
+@dataclass
+class JobResult:
+    content: bytes
+    filename: str
+    media_type: str
+
+
+class JobContext:
+    """
+    Lo que recibe cada handler: el id del job y un callback de progreso
+    que escribe en su propia sesión (no toca la sesión del handler).
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+
+    def progress(self, pct: int, message: str | None = None):
+        pct = max(0, min(100, int(pct)))
+        db = SessionLocal()
+        try:
+            values = {"progress": pct}
+            if message is not None:
+                values["message"] = message[:255]
+            db.execute(update(Job).where(Job.id == self.job_id).values(**values))
+            db.commit()
+        finally:
+            db.close()
+
+
+Handler = Callable[[Session, JobContext, dict], JobResult | None]
+
+_HANDLERS: dict[str, Handler] = {}
+
+
+def handler(kind: str):
+    """
+    Registra un handler para un tipo de job:
+
+        @handler("export_excel")
+        def _run(db, ctx, params) -> JobResult: ...
+    """
+    def deco(fn: Handler) -> Handler:
+        _HANDLERS[kind] = fn
+        return fn
+    return deco
+
+
+def known_kinds() -> list[str]:
+    return sorted(_HANDLERS)
+
+
+# -------------------------
+# Encolar / consultar
+# -------------------------
+def enqueue(
+    db: Session,
+    kind: str,
+    params: dict | None = None,
+    requested_by: int | None = None,
+    run_after: datetime | None = None,
+) -> Job:
+    if kind not in _HANDLERS:
+        raise ValueError(f"Tipo de job desconocido: {kind}")
+
+    job = Job(
+        id=uuid.uuid4().hex,
+        kind=kind,
+        status="queued",
+        params=json.dumps(params or {}),
+        progress=0,
+        requested_by=requested_by,
+        run_after=run_after or datetime.utcnow(),
+        created_at=datetime.utcnow(),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    _wakeup.set()
+    return job
+
+
+def job_params(job: Job) -> dict:
+    return json.loads(job.params or "{}")
+
+
+def record_artifact_download(job: Job, doctor_id: int, request=None):
+    """
+    🧾 Auditoría al entregar el artefacto (no al encolar): los PDFs llevan
+    datos del paciente, que viene en params["patient_id"].
+    """
+    if job.artifact_media_type != "application/pdf":
+        return
+    patient_id = job_params(job).get("patient_id")
+    audit.record("download", job.kind, patient_id or job.id, doctor_id, patient_id, request)
+
+
+def job_to_dict(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "attempts": job.attempts,
+        "message": job.message,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "artifact_url": f"/jobs/{job.id}/artifact" if job.status == "done" and job.artifact_sha256 else None,
+    }
+
+
+def queue_depth(db: Session, kinds: list[str] | None = None, now: datetime | None = None) -> dict:
+    """
+    {(kind, state): n} de lo pendiente: "queued" (listo para correr, sin los
+    diferidos por run_after) y "running".
+    """
+    now = now or datetime.utcnow()
+    q = db.query(Job.kind, Job.status, func.count()).filter(
+        or_(Job.status == "running", and_(Job.status == "queued", Job.run_after <= now))
+    )
+    if kinds is not None:
+        q = q.filter(Job.kind.in_(kinds))
+    return {(kind, status): n for kind, status, n in q.group_by(Job.kind, Job.status).all()}
+
+
+# -------------------------
+# Worker
+# -------------------------
+def _claim_next(db: Session) -> Job | None:
+    """
+    Toma el siguiente job pendiente. El UPDATE condicionado a status='queued'
+    hace el "claim" atómico aunque haya varios workers/procesos.
+    """
+    now = datetime.utcnow()
+    candidates = (
+        db.query(Job.id)
+        .filter(Job.status == "queued")
+        .filter(Job.run_after <= now)
+        .order_by(Job.run_after.asc(), Job.created_at.asc())
+        .limit(5)
+        .all()
+    )
+    for (job_id,) in candidates:
+        res = db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == "queued")
+            .values(status="running", started_at=now, heartbeat_at=now, progress=0, attempts=Job.attempts + 1)
+        )
+        db.commit()
+        if res.rowcount == 1:
+            return db.query(Job).filter(Job.id == job_id).first()
+    return None
+
+
+def _store_artifact(db: Session, job_id: str, result: JobResult) -> str:
+    blob = blobstore.put(db, result.content, result.media_type)
+    blobstore.attach(db, blob, "job", job_id, "artifact")
+    db.commit()
+    return blob.sha256
+
+
+def run_job(db: Session, job: Job):
+    fn = _HANDLERS.get(job.kind)
+    ctx = JobContext(job.id)
+    try:
+        if fn is None:
+            raise RuntimeError(f"Sin handler para {job.kind}")
+        result = fn(db, ctx, job_params(job))
+
+        db.rollback()
+        values = {"status": "done", "progress": 100, "finished_at": datetime.utcnow()}
+        if result is not None:
+            values.update(
+                artifact_sha256=_store_artifact(db, job.id, result),
+                artifact_name=result.filename,
+                artifact_media_type=result.media_type,
+            )
+        db.execute(update(Job).where(Job.id == job.id).values(**values))
+        db.commit()
+    except Exception as e:
+        log.exception("Job %s (%s) falló", job.id, job.kind)
+        db.rollback()
+        db.execute(
+            update(Job)
+            .where(Job.id == job.id)
+            .values(status="failed", error=str(e)[:2000], finished_at=datetime.utcnow())
+        )
+        db.commit()
+
+
+def cleanup_expired(db: Session, now: datetime | None = None) -> int:
+    """
+    Borra jobs terminados más antiguos que JOB_RETENTION_HOURS y suelta la
+    referencia a su artefacto (el GC del almacén decide cuándo borrar el archivo).
+    """
+    now = now or datetime.utcnow()
+    limit = now - timedelta(hours=JOB_RETENTION_HOURS)
+    old = (
+        db.query(Job)
+        .filter(Job.status.in_(["done", "failed"]))
+        .filter(Job.finished_at < limit)
+        .all()
+    )
+    for job in old:
+        blobstore.detach(db, "job", job.id)
+        db.delete(job)
+    db.commit()
+    blobstore.gc(db)
+    return len(old)
+
+
+def requeue_stale(db: Session, now: datetime | None = None) -> int:
+    """
+    Vuelve a la cola los "running" cuyo latido venció (el proceso que los
+    ejecutaba se cayó). Los de otras instancias vivas siguen latiendo y no se tocan.
+    Los que ya se tomaron JOB_MAX_ATTEMPTS veces quedan "failed".
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=JOB_LEASE_SECONDS)
+    stale = (Job.status == "running", func.coalesce(Job.heartbeat_at, Job.started_at) < cutoff)
+    failed = db.execute(
+        update(Job)
+        .where(*stale, Job.attempts >= JOB_MAX_ATTEMPTS)
+        .values(
+            status="failed",
+            error=f"Interrumpido {JOB_MAX_ATTEMPTS} veces (el proceso se cayó mientras corría)",
+            finished_at=now,
+            heartbeat_at=None,
+        )
+    ).rowcount
+    res = db.execute(
+        update(Job)
+        .where(*stale)
+        .values(status="queued", started_at=None, heartbeat_at=None)
+    )
+    db.commit()
+    if failed:
+        log.error("%s jobs huérfanos marcados failed tras %s intentos", failed, JOB_MAX_ATTEMPTS)
+    if res.rowcount:
+        log.warning("%s jobs huérfanos vueltos a la cola", res.rowcount)
+    return res.rowcount
+
+
+_wakeup = threading.Event()
+_stop = threading.Event()
+_threads: list[threading.Thread] = []
+# jobs que está ejecutando este proceso (para el latido)
+_running: set[str] = set()
+_running_lock = threading.Lock()
+
+
+def _heartbeat_loop():
+    while not _stop.wait(JOB_HEARTBEAT_SECONDS):
+        with _running_lock:
+            ids = list(_running)
+        if not ids:
+            continue
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(Job)
+                .where(Job.id.in_(ids), Job.status == "running")
+                .values(heartbeat_at=datetime.utcnow())
+            )
+            db.commit()
+        except Exception:
+            log.exception("No se pudo renovar el latido de los jobs")
+        finally:
+            db.close()
+
+
+def _worker_loop(n: int):
+    last_cleanup = last_requeue = datetime.min
+    while not _stop.is_set():
+        db = SessionLocal()
+        try:
+            job = _claim_next(db)
+            if job is not None:
+                with _running_lock:
+                    _running.add(job.id)
+                try:
+                    run_job(db, job)
+                finally:
+                    with _running_lock:
+                        _running.discard(job.id)
+                continue
+
+            if n == 0 and (datetime.utcnow() - last_requeue).total_seconds() > JOB_LEASE_SECONDS / 2:
+                # huérfanos de instancias caídas, sin esperar a un reinicio
+                requeue_stale(db)
+                last_requeue = datetime.utcnow()
+            if n == 0 and (datetime.utcnow() - last_cleanup).total_seconds() > JOB_CLEANUP_EVERY_SECONDS:
+                cleanup_expired(db)
+                last_cleanup = datetime.utcnow()
+        except Exception:
+            log.exception("Error en worker de jobs")
+        finally:
+            db.close()
+
+        _wakeup.wait(JOB_POLL_SECONDS)
+        _wakeup.clear()
+
+
+def start_workers(n: int = JOB_WORKERS):
+    if _threads or n <= 0:
+        return
+    _stop.clear()
+
+    for i in range(n):
+        t = threading.Thread(target=_worker_loop, args=(i,), name=f"job-worker-{i}", daemon=True)
+        t.start()
+        _threads.append(t)
+    t = threading.Thread(target=_heartbeat_loop, name="job-heartbeat", daemon=True)
+    t.start()
+    _threads.append(t)
+
+
+def stop_workers(timeout: float = 10):
+    _stop.set()
+    _wakeup.set()
+    for t in _threads:
+        t.join(timeout=timeout)
+    _threads.clear()
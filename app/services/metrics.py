@@ -0,0 +1,195 @@
+# =========================
+# ✅ app/services/metrics.py
+# (Métricas en memoria del proceso, formato Prometheus)
+# =========================
+"""
+Registro mínimo de métricas sin dependencias externas:
+
+    RENDER = metrics.histogram("nexa_template_render_seconds", "Render de plantillas", ["template"])
+    RENDER.observe(0.012, template="dashboard.html")
+
+    QUEUED = metrics.gauge("nexa_pdf_queue_depth", "PDFs en cola", ["kind"], fn=contar_en_cola)
+
+Los gauges con `fn` se calculan al exponer (en cada scrape), no en cada
+request: `fn` devuelve un número o {valores de etiquetas: número}.
+
+`/metrics` expone todo el registro en formato texto de Prometheus.
+"""
+import bisect
+import logging
+import threading
+
+log = logging.getLogger("nexa.metrics")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _fmt_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_esc(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _esc(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_fmt_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), fn=None):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+        self._fn = fn
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def _items(self) -> list[tuple[tuple, float]]:
+        if self._fn is None:
+            with self._lock:
+                return sorted(self._values.items())
+        value = self._fn()
+        if not isinstance(value, dict):
+            return [((), value)]
+        return sorted(((k if isinstance(k, tuple) else (k,)), v) for k, v in value.items())
+
+    def expose(self) -> list[str]:
+        return self._header() + [f"{self.name}{_fmt_labels(self.labelnames, k)} {_num(v)}" for k, v in self._items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [conteo por bucket..., suma, total]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if i < len(self.buckets):
+                row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def snapshot(self) -> dict[tuple, dict]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        out = {}
+        for key, row in items:
+            out[key] = {"count": row[-1], "sum": row[-2], "buckets": dict(zip(self.buckets, row[:-2]))}
+        return out
+
+    def expose(self) -> list[str]:
+        lines = self._header()
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, row in items:
+            acc = 0
+            for le, n in zip(self.buckets, row[:-2]):
+                acc += n
+                labels = _fmt_labels(self.labelnames, key, 'le="%s"' % _num(le))
+                lines.append(f"{self.name}_bucket{labels} {acc}")
+            labels = _fmt_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {row[-1]}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_num(row[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {row[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kw):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = self._metrics[name] = cls(name, *args, **kw)
+            return m
+
+    def expose(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            try:
+                lines.extend(m.expose())
+            except Exception:
+                # un gauge con fn que falla (BD caída...) no tumba el resto
+                log.exception("No se pudo exponer la métrica %s", m.name)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, help_text: str, labelnames=()) -> Counter:
+    return registry._get_or_create(Counter, name, help_text, labelnames)
+
+
+def histogram(name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return registry._get_or_create(Histogram, name, help_text, labelnames, buckets)
+
+
+def gauge(name: str, help_text: str, labelnames=(), fn=None) -> Gauge:
+    return registry._get_or_create(Gauge, name, help_text, labelnames, fn)
@@ -0,0 +1,175 @@
+# =========================
+# ✅ app/services/note_revisions.py
+# (Historial de la nota clínica: deltas por campo + snapshots periódicos)
+# =========================
+"""
+Cada guardado de la nota (versión N) deja una fila en clinical_note_revisions:
+
+- snapshot: todos los campos. Se escribe en la versión 1, cada
+  NOTE_SNAPSHOT_EVERY versiones y cuando falta la revisión anterior
+  (notas creadas antes del historial);
+- delta: solo los campos que cambiaron, con su valor nuevo.
+
+Reconstruir la versión N = último snapshot <= N + los deltas hasta N, o sea
+como mucho NOTE_SNAPSHOT_EVERY filas. La versión actual se lee de
+clinical_notes directamente, sin pasar por el historial.
+"""
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models import ClinicalNote, ClinicalNoteRevision
+
+NOTE_TEXT_FIELDS = (
+    "chief_complaint",
+    "hpi",
+    "physical_exam",
+    "complementary_tests",
+    "assessment_dx",
+    "plan_treatment",
+    "indications_alarm_signs",
+    "follow_up",
+)
+NOTE_INT_FIELDS = ("ta_sys", "ta_dia", "hr", "rr", "spo2")
+NOTE_FIELDS = NOTE_TEXT_FIELDS + NOTE_INT_FIELDS + ("temp",)
+
+NOTE_SNAPSHOT_EVERY = max(2, int(os.getenv("NOTE_SNAPSHOT_EVERY", "10")))
+
+
+def _dumps(values: dict) -> str:
+    return json.dumps(values, ensure_ascii=False, separators=(",", ":"))
+
+
+def note_values(note: ClinicalNote) -> dict:
+    return {f: getattr(note, f) for f in NOTE_FIELDS}
+
+
+def diff(before: dict, after: dict) -> dict:
+    """
+    Campos de `after` cuyo valor es distinto al de `before`.
+    """
+    return {f: v for f, v in after.items() if before.get(f) != v}
+
+
+def _current_values(db: Session, encounter_id: int) -> dict:
+    cols = [getattr(ClinicalNote, f) for f in NOTE_FIELDS]
+    row = db.query(*cols).filter(ClinicalNote.encounter_id == encounter_id).one()
+    return dict(zip(NOTE_FIELDS, row))
+
+
+def record(db: Session, encounter_id: int, version: int, changes: dict, author_doctor_id: int | None):
+    """
+    Registra la revisión `version` (ya escrita en clinical_notes, en la misma
+    transacción, sin commit). `changes` = campos de la nota que cambiaron.
+    """
+    need_snapshot = version == 1 or version % NOTE_SNAPSHOT_EVERY == 0
+    if not need_snapshot:
+        prev = (
+            db.query(func.max(ClinicalNoteRevision.version))
+            .filter(ClinicalNoteRevision.encounter_id == encounter_id)
+            .scalar()
+        )
+        # sin la revisión anterior un delta no se podría reconstruir
+        need_snapshot = prev != version - 1
+
+    if need_snapshot:
+        db.flush()
+        data = _current_values(db, encounter_id)
+        kind = "snapshot"
+    else:
+        data = {f: v for f, v in changes.items() if f in NOTE_FIELDS}
+        kind = "delta"
+
+    db.add(ClinicalNoteRevision(
+        encounter_id=encounter_id,
+        version=version,
+        kind=kind,
+        data=_dumps(data),
+        author_doctor_id=author_doctor_id,
+        created_at=datetime.utcnow(),
+    ))
+
+
+def describe(rows) -> list[dict]:
+    """
+    Listado de revisiones (filas con version, kind, data, created_at,
+    author_doctor_id), en el orden recibido.
+    """
+    out = []
+    for r in rows:
+        data = json.loads(r.data)
+        out.append({
+            "version": r.version,
+            "kind": r.kind,
+            "created_at": r.created_at.isoformat(timespec="seconds"),
+            "author_doctor_id": r.author_doctor_id,
+            # en un snapshot no se sabe qué cambió sin leer el anterior: se listan todos
+            "fields": sorted(data.keys()),
+        })
+    return out
+
+
+def replay(rows, version: int) -> dict | None:
+    """
+    Aplica sobre el último snapshot <= `version` los deltas siguientes hasta
+    `version`. `rows`: revisiones en orden ascendente. None si hay huecos.
+    """
+    rows = [r for r in rows if r.version <= version]
+    base_idx = next((i for i in range(len(rows) - 1, -1, -1) if rows[i].kind == "snapshot"), None)
+    if base_idx is None:
+        return None
+
+    values = json.loads(rows[base_idx].data)
+    expected = rows[base_idx].version + 1
+    for d in rows[base_idx + 1:]:
+        if d.version != expected:
+            return None  # hueco en el historial
+        values.update(json.loads(d.data))
+        expected += 1
+    if expected - 1 != version:
+        return None
+    return values
+
+
+def list_revisions(db: Session, encounter_id: int) -> list[dict]:
+    rows = (
+        db.query(ClinicalNoteRevision)
+        .filter(ClinicalNoteRevision.encounter_id == encounter_id)
+        .order_by(ClinicalNoteRevision.version.desc())
+        .all()
+    )
+    return describe(rows)
+
+
+def reconstruct(db: Session, encounter_id: int, version: int) -> dict | None:
+    """
+    Campos de la nota tal como quedaron en `version`, o None si no hay
+    historial suficiente para reconstruirla.
+    """
+    base = (
+        db.query(ClinicalNoteRevision.version, ClinicalNoteRevision.kind, ClinicalNoteRevision.data)
+        .filter(
+            ClinicalNoteRevision.encounter_id == encounter_id,
+            ClinicalNoteRevision.kind == "snapshot",
+            ClinicalNoteRevision.version <= version,
+        )
+        .order_by(ClinicalNoteRevision.version.desc())
+        .first()
+    )
+    if base is None:
+        return None
+
+    deltas = (
+        db.query(ClinicalNoteRevision.version, ClinicalNoteRevision.kind, ClinicalNoteRevision.data)
+        .filter(
+            ClinicalNoteRevision.encounter_id == encounter_id,
+            ClinicalNoteRevision.version > base.version,
+            ClinicalNoteRevision.version <= version,
+        )
+        .order_by(ClinicalNoteRevision.version.asc())
+        .all()
+    )
+    return replay([base, *deltas], version)
@@ -0,0 +1,205 @@
+# =========================
+# ✅ app/services/patient_summary.py
+# (Proyección patient_summary: última visita, último médico, próxima cita...)
+# =========================
+"""
+Una fila por paciente con lo que muestra /app/patients, para no hacer N+1
+contra encounters/appointments/attendance al listar.
+
+Se mantiene así:
+
+- en cada flush del ORM que toca Encounter, Appointment o Attendance se
+  recalculan los pacientes afectados, en la misma transacción (after_flush);
+- el scheduler recalcula los pacientes cuya "próxima cita" ya pasó;
+- `python -m app.services.patient_summary` la reconstruye entera.
+
+El cálculo es siempre el mismo INSERT…SELECT por conjunto (ventanas
+row_number para "la última" / "la próxima"), para todos o para algunos ids.
+Las escrituras masivas con query.update() no pasan por el ORM; las que hay
+hoy (estado pending_review, cabecera de la atención, archivado) no cambian
+el resumen.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import delete, event, func, inspect, literal, select, true, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..models import Appointment, ArchivedEncounter, Attendance, Doctor, Encounter, Patient, PatientSummary
+
+log = logging.getLogger("nexa.patient_summary")
+
+OPEN_STATUSES = ("scheduled", "confirmed")
+TRACKED = (Encounter, Appointment, Attendance)
+
+_COLUMNS = [
+    "patient_id",
+    "encounter_count",
+    "last_visit_at",
+    "last_doctor_id",
+    "last_doctor_name",
+    "next_appointment_at",
+    "next_appointment_id",
+    "last_checkin_at",
+    "updated_at",
+]
+
+
+def _summary_select(now: datetime, patient_ids=None):
+    def only(stmt, col):
+        return stmt.where(col.in_(patient_ids)) if patient_ids is not None else stmt
+
+    # atenciones calientes + archivadas (services/encounter_store.py)
+    encs = union_all(*[
+        only(select(m.id, m.patient_id, m.created_at, m.doctor_id), m.patient_id)
+        for m in (Encounter, ArchivedEncounter)
+    ]).subquery()
+    ranked_enc = select(
+        encs.c.patient_id,
+        encs.c.created_at,
+        encs.c.doctor_id,
+        func.count().over(partition_by=encs.c.patient_id).label("n"),
+        func.row_number().over(
+            partition_by=encs.c.patient_id,
+            order_by=(encs.c.created_at.desc(), encs.c.id.desc()),
+        ).label("rn"),
+    ).subquery()
+    last_enc = select(ranked_enc).where(ranked_enc.c.rn == 1).subquery()
+
+    ranked_appt = only(
+        select(
+            Appointment.patient_id,
+            Appointment.id,
+            Appointment.start_at,
+            func.row_number().over(
+                partition_by=Appointment.patient_id,
+                order_by=(Appointment.start_at.asc(), Appointment.id.asc()),
+            ).label("rn"),
+        )
+        .where(Appointment.start_at > now)
+        .where(Appointment.status.in_(OPEN_STATUSES)),
+        Appointment.patient_id,
+    ).subquery()
+    next_appt = select(ranked_appt).where(ranked_appt.c.rn == 1).subquery()
+
+    checkins = only(
+        select(Attendance.patient_id, func.max(Attendance.timestamp).label("last_at"))
+        .group_by(Attendance.patient_id),
+        Attendance.patient_id,
+    ).subquery()
+
+    stmt = (
+        select(
+            Patient.id,
+            func.coalesce(last_enc.c.n, 0),
+            last_enc.c.created_at,
+            last_enc.c.doctor_id,
+            Doctor.name,
+            next_appt.c.start_at,
+            next_appt.c.id,
+            checkins.c.last_at,
+            literal(now),
+        )
+        .select_from(Patient)
+        .outerjoin(last_enc, last_enc.c.patient_id == Patient.id)
+        .outerjoin(Doctor, Doctor.id == last_enc.c.doctor_id)
+        .outerjoin(next_appt, next_appt.c.patient_id == Patient.id)
+        .outerjoin(checkins, checkins.c.patient_id == Patient.id)
+        # SQLite: INSERT…SELECT…ON CONFLICT necesita un WHERE en el SELECT
+        .where(true())
+    )
+    return only(stmt, Patient.id)
+
+
+def refresh(conn, patient_ids=None, now: datetime | None = None) -> None:
+    """
+    Recalcula el resumen de `patient_ids` (o de todos con None). `conn` puede
+    ser una Session o una Connection; no hace commit.
+
+    Upsert (INSERT…ON CONFLICT DO UPDATE), no DELETE + INSERT: dos flushes
+    simultáneos del mismo paciente en Postgres (READ COMMITTED) insertarían
+    los dos y uno fallaría por la PK.
+    """
+    now = now or datetime.utcnow()
+    if patient_ids is not None:
+        patient_ids = sorted(set(patient_ids))
+        if not patient_ids:
+            return
+
+    # Connection tiene .dialect; Session, get_bind()
+    name = (conn.dialect if hasattr(conn, "dialect") else conn.get_bind().dialect).name
+    dialect = postgresql if name == "postgresql" else sqlite
+    stmt = dialect.insert(PatientSummary).from_select(_COLUMNS, _summary_select(now, patient_ids))
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=["patient_id"],
+        set_={c: stmt.excluded[c] for c in _COLUMNS if c != "patient_id"},
+    ))
+
+    # pacientes que ya no existen
+    orphans = delete(PatientSummary).where(PatientSummary.patient_id.not_in(select(Patient.id)))
+    if patient_ids is not None:
+        orphans = orphans.where(PatientSummary.patient_id.in_(patient_ids))
+    conn.execute(orphans)
+
+
+def rebuild(db: Session) -> int:
+    refresh(db)
+    db.commit()
+    return db.query(func.count(PatientSummary.patient_id)).scalar()
+
+
+def ensure_built(db: Session) -> None:
+    """
+    Primer arranque con la tabla vacía y pacientes existentes -> reconstruir.
+    """
+    if db.query(PatientSummary.patient_id).first() is None and db.query(Patient.id).first() is not None:
+        log.info("patient_summary vacía: reconstruyendo (%s pacientes)", rebuild(db))
+
+
+def refresh_passed_appointments(db: Session, now: datetime | None = None) -> int:
+    """
+    Pacientes cuya "próxima cita" ya empezó: se recalculan (lo llama el scheduler).
+    """
+    now = now or datetime.utcnow()
+    ids = [
+        pid for (pid,) in db.query(PatientSummary.patient_id)
+        .filter(PatientSummary.next_appointment_at <= now)
+        .all()
+    ]
+    if ids:
+        refresh(db, ids, now=now)
+        db.commit()
+    return len(ids)
+
+
+# -------------------------
+# Mantenimiento en el flush
+# -------------------------
+def _affected_patient_ids(session: Session) -> set[int]:
+    ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, TRACKED):
+            continue
+        if obj.patient_id is not None:
+            ids.add(obj.patient_id)
+        # si se movió a otro paciente, el anterior también cambia
+        for old in inspect(obj).attrs.patient_id.history.deleted or ():
+            if old is not None:
+                ids.add(old)
+    return ids
+
+
+@event.listens_for(Session, "after_flush")
+def _refresh_after_flush(session: Session, _flush_context):
+    ids = _affected_patient_ids(session)
+    if ids:
+        # mismo connection/transacción que el flush: se confirma o se revierte junto
+        refresh(session.connection(), ids)
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal
+
+    with SessionLocal() as _db:
+        print(f"✅ patient_summary reconstruida: {rebuild(_db)} pacientes")
@@ -0,0 +1,191 @@
+# =========================
+# ✅ app/services/pdf_archive.py
+# (ZIP masivo de PDFs de atenciones, renderizado en procesos paralelos)
+# =========================
+import hashlib
+import json
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, Iterator
+
+from ..database import SessionLocal, engine
+from ..models import Encounter
+from . import encounter_store
+from .pdf_documents import render_encounter_pdf
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0")) or (os.cpu_count() or 2)
+ARCHIVE_MAX_ENCOUNTERS = int(os.getenv("ARCHIVE_MAX_ENCOUNTERS", "2000"))
+# renders encolados a la vez por ZIP: los procesos no se quedan sin trabajo,
+# pero un ZIP grande (o uno abandonado) no acapara el pool ni la memoria
+ARCHIVE_IN_FLIGHT = 2 * PDF_WORKERS
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _init_worker():
+    # Cada proceso hijo abre sus propias conexiones (no compartir sockets del padre)
+    engine.dispose(close=False)
+
+
+def _mp_context():
+    # 🔒 nunca fork: el padre ya tiene hilos (jobs, auditoría, scheduler) y un
+    # hijo "forkeado" puede heredar un lock tomado (logging, Condition) y colgarse
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=_mp_context(), initializer=_init_worker)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def render_encounter_pdf_by_id(encounter_id: int) -> bytes:
+    """
+    Punto de entrada en el proceso hijo: abre sesión propia y renderiza.
+    """
+    db = SessionLocal()
+    try:
+        enc = encounter_store.get(db, encounter_id)
+        if not enc:
+            raise ValueError(f"Encounter {encounter_id} no existe")
+        return render_encounter_pdf(db, enc)
+    finally:
+        db.close()
+
+
+class _ZipSink:
+    """
+    Destino no "seekable" para zipfile: acumula lo escrito y se vacía por trozos,
+    así el ZIP sale por la red a medida que se completa cada entrada.
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._pos = 0
+
+    def write(self, b) -> int:
+        b = bytes(b)
+        self._chunks.append(b)
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+
+def _entry_name(enc: Encounter) -> str:
+    when = enc.ended_at or enc.created_at
+    day = when.strftime("%Y-%m-%d") if when else "sin-fecha"
+    return f"paciente_{enc.patient_id}/{day}_atencion_{enc.id}.pdf"
+
+
+def stream_archive(
+    encounters: list[Encounter],
+    filters: dict,
+    on_entry: Callable[[dict], None] | None = None,
+) -> Iterator[bytes]:
+    """
+    Reparte los PDFs entre procesos y va escribiendo cada uno en el ZIP
+    apenas termina. Al final agrega manifest.json con el resultado de cada entrada.
+    `on_entry(item)` se llama por cada PDF que entró bien al ZIP (auditoría).
+
+    Los metadatos se leen aquí (con la sesión del request aún abierta);
+    el generador ya no toca la BD.
+    """
+    meta = {
+        enc.id: {
+            "encounter_id": enc.id,
+            "patient_id": enc.patient_id,
+            "patient": enc.patient.full_name if enc.patient else None,
+            "doctor_id": enc.doctor_id,
+            "doctor": enc.doctor.name if enc.doctor else None,
+            "date": (enc.ended_at or enc.created_at).isoformat() if (enc.ended_at or enc.created_at) else None,
+            "file": _entry_name(enc),
+        }
+        for enc in encounters
+    }
+    return _stream(meta, filters, on_entry)
+
+
+def _stream(meta: dict[int, dict], filters: dict, on_entry=None) -> Iterator[bytes]:
+    sink = _ZipSink()
+    manifest = []
+
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        pool = _get_pool()
+        todo = iter(meta)
+        futures = {}
+
+        def _fill():
+            for enc_id in todo:
+                futures[pool.submit(render_encounter_pdf_by_id, enc_id)] = enc_id
+                if len(futures) >= ARCHIVE_IN_FLIGHT:
+                    return
+
+        try:
+            _fill()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    enc_id = futures.pop(fut)
+                    item = dict(meta[enc_id])
+                    try:
+                        data = fut.result()
+                        # PDF ya viene comprimido: se guarda tal cual (ZIP_STORED)
+                        zf.writestr(item["file"], data)
+                        item.update(status="ok", bytes=len(data), sha256=hashlib.sha256(data).hexdigest())
+                        if on_entry is not None:
+                            on_entry(item)
+                    except Exception as e:
+                        item.update(status="error", error=str(e)[:500], file=None)
+                    manifest.append(item)
+                _fill()
+
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+        finally:
+            # cliente desconectado (GeneratorExit) o error: no dejar renders huérfanos en el pool
+            for fut in futures:
+                fut.cancel()
+
+        manifest.sort(key=lambda m: (m["date"] or "", m["encounter_id"]))
+        zf.writestr(
+            "manifest.json",
+            json.dumps(
+                {
+                    "generated_at": datetime.utcnow().isoformat() + "Z",
+                    "filters": filters,
+                    "total": len(manifest),
+                    "ok": sum(1 for m in manifest if m["status"] == "ok"),
+                    "items": manifest,
+                },
+                ensure_ascii=False,
+                indent=2,
+            ),
+            compress_type=zipfile.ZIP_DEFLATED,
+        )
+
+    tail = sink.drain()
+    if tail:
+        yield tail
@@ -0,0 +1,265 @@
+# =========================
+# ✅ app/services/pdf_documents.py
+# (Documentos PDF: resumen de atención e historia consolidada)
+# =========================
+import functools
+import time
+from datetime import datetime
+
+from sqlalchemy import asc
+from sqlalchemy.orm import Session
+
+from ..models import Doctor, Patient, Encounter, ClinicalNote, EncounterEvolution
+from . import encounter_store, metrics
+from .pdf_layout import BRAND_NAME, Document
+
+# ⏱️ armado + render; los del ZIP masivo corren en otros procesos y no se cuentan aquí
+RENDER_SECONDS = metrics.histogram(
+    "nexa_pdf_render_seconds", "Tiempo de generación de PDFs", ["document"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+
+def _timed(document: str):
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                RENDER_SECONDS.observe(time.perf_counter() - t0, document=document)
+        return wrapper
+    return deco
+
+
+# ✅ fallback hardcoded (por si aún no se actualiza BD)
+KNOWN_DOCTORS = {
+    "Dra. Yiria Rosario Collantes Santos": {
+        "registration": "1312059627",
+        "specialty": "Médico General",
+    },
+    "Dr. Miguel Andrés Herrería Rodríguez": {
+        "registration": "1750785220",
+        "specialty": "Médico Cirujano",
+    },
+}
+
+
+def best_datetime(enc: Encounter):
+    for attr in ("ended_at", "encounter_date", "date", "start_time", "created_at", "updated_at"):
+        if hasattr(enc, attr):
+            val = getattr(enc, attr)
+            if val is not None:
+                return val
+    return None
+
+
+def fmt_dt(val) -> str:
+    if val is None:
+        return "-"
+    try:
+        return val.strftime("%Y-%m-%d %H:%M")
+    except Exception:
+        return str(val)
+
+
+def doctor_meta(doctor: Doctor | None):
+    """
+    Devuelve (name, specialty, registration) usando:
+    1) DB si existe
+    2) fallback KNOWN_DOCTORS si coincide por nombre
+    """
+    name = getattr(doctor, "name", None) if doctor else None
+    specialty = getattr(doctor, "specialty", None) if doctor else None
+    registration = getattr(doctor, "registration", None) if doctor else None
+
+    if name and (not specialty or not registration):
+        kb = KNOWN_DOCTORS.get(name)
+        if kb:
+            specialty = specialty or kb.get("specialty")
+            registration = registration or kb.get("registration")
+
+    return (name or "-", specialty or "-", registration or "-")
+
+
+def vitals_text(note: ClinicalNote) -> str:
+    sv_parts = []
+    if note.ta_sys is not None and note.ta_dia is not None:
+        sv_parts.append(f"TA: {note.ta_sys}/{note.ta_dia}")
+    if note.hr is not None:
+        sv_parts.append(f"FC: {note.hr}")
+    if note.rr is not None:
+        sv_parts.append(f"FR: {note.rr}")
+    if note.temp is not None:
+        sv_parts.append(f"T°: {note.temp}")
+    if note.spo2 is not None:
+        sv_parts.append(f"SpO2: {note.spo2}%")
+    return " | ".join(sv_parts) if sv_parts else "-"
+
+
+def _note_sections(doc: Document, note: ClinicalNote | None):
+    if not note:
+        doc.section("Nota clínica", "No existe nota clínica registrada para esta atención.")
+        return
+
+    doc.section("Motivo de consulta", note.chief_complaint)
+    doc.section("Enfermedad actual", note.hpi)
+    doc.section("Signos vitales", vitals_text(note))
+    doc.section("Examen físico", note.physical_exam)
+    doc.section("Exámenes complementarios", note.complementary_tests)
+    doc.section("Impresión diagnóstica", note.assessment_dx)
+    doc.section("Prescripción / Plan", note.plan_treatment)
+    doc.section("Indicaciones y signos de alarma", note.indications_alarm_signs)
+    doc.section("Seguimiento", note.follow_up)
+
+
+# -------------------------
+# Resumen de una atención
+# -------------------------
+@_timed("encounter")
+def build_encounter_pdf(
+    enc: Encounter,
+    patient: Patient | None,
+    doctor: Doctor | None,
+    note: ClinicalNote | None,
+) -> bytes:
+    doc = Document("Resumen Clínico")
+    doc_name, doc_spec, doc_reg = doctor_meta(doctor)
+
+    doc.heading("Datos generales", keep=1)
+    doc.row("Centro", BRAND_NAME)
+    doc.row("Fecha del documento", datetime.now().strftime("%Y-%m-%d %H:%M"))
+    doc.row("Fecha de la atención", fmt_dt(best_datetime(enc)))
+    doc.row("Médico tratante", doc_name)
+    doc.row("Especialidad", doc_spec)
+    doc.row("Registro", doc_reg)
+    doc.row("Paciente", getattr(patient, "full_name", None) or "N/A")
+    doc.row("Tipo de consulta", getattr(enc, "visit_type", None) or "-")
+    doc.row("Motivo corto", getattr(enc, "chief_complaint_short", None) or "-")
+    doc.spacer(10)
+
+    _note_sections(doc, note)
+    doc.signature(doc_name, doc_spec, doc_reg)
+    return doc.render()
+
+
+def load_encounter_parts(db: Session, enc: Encounter):
+    if enc.archived:
+        return enc.patient, enc.doctor, enc.note
+    patient = db.query(Patient).filter(Patient.id == enc.patient_id).first()
+    doctor = db.query(Doctor).filter(Doctor.id == enc.doctor_id).first()
+    note = db.query(ClinicalNote).filter(ClinicalNote.encounter_id == enc.id).first()
+    return patient, doctor, note
+
+
+def render_encounter_pdf(db: Session, enc: Encounter) -> bytes:
+    patient, doctor, note = load_encounter_parts(db, enc)
+    return build_encounter_pdf(enc, patient, doctor, note)
+
+
+# -------------------------
+# Historia clínica consolidada
+# -------------------------
+@_timed("patient_history")
+def build_history_pdf(
+    patient: Patient,
+    encounters: list[Encounter],
+    doctors: dict[int, Doctor],
+    notes: dict[int, ClinicalNote],
+    evolutions: dict[int, list[EncounterEvolution]],
+    progress=None,
+) -> bytes:
+    def sort_key(enc: Encounter):
+        dt = best_datetime(enc)
+        return (dt is not None, dt, enc.id)
+
+    encounters_sorted = sorted(encounters, key=sort_key)
+    doc = Document("Historia Clínica — Consolidado")
+
+    doc.heading("Paciente", size=12, keep=1)
+    doc.row("Nombre", getattr(patient, "full_name", None) or "N/A")
+    doc.row("Generado", datetime.now().strftime("%Y-%m-%d %H:%M"))
+    doc.spacer(8)
+
+    if not encounters_sorted:
+        doc.text_line("No existen atenciones registradas para este paciente.")
+        return doc.render()
+
+    # ÍNDICE (con número de página real de cada atención)
+    doc.heading("Índice de atenciones", size=12, keep=1)
+    for idx, enc in enumerate(encounters_sorted, start=1):
+        dname, _, _ = doctor_meta(doctors.get(enc.doctor_id))
+        doc.index_entry(
+            f"{idx}. {fmt_dt(best_datetime(enc))}  |  "
+            f"{dname}  |  "
+            f"{(getattr(enc, 'visit_type', None) or '—')}  |  "
+            f"{(getattr(enc, 'chief_complaint_short', None) or '—')}",
+            anchor_key=f"enc-{enc.id}",
+        )
+    doc.page_break()
+
+    for idx, enc in enumerate(encounters_sorted, start=1):
+        attending = doctors.get(enc.doctor_id)
+        dname, dspec, dreg = doctor_meta(attending)
+
+        doc.heading(f"Atención {idx}", size=12, keep=4)
+        doc.anchor(f"enc-{enc.id}")
+        doc.row("Fecha de la atención", fmt_dt(best_datetime(enc)))
+        doc.row("Médico tratante", dname)
+        doc.row("Especialidad", dspec)
+        doc.row("Registro", dreg)
+        doc.spacer(2)
+
+        _note_sections(doc, notes.get(enc.id))
+
+        evols = evolutions.get(enc.id) or []
+        if evols:
+            doc.heading("Evoluciones / Addendum", keep=1)
+            for ev in evols:
+                author = doctors.get(ev.author_doctor_id)
+                who = author.name if author else f"Doctor ID {ev.author_doctor_id}"
+                doc.text_line(f"{fmt_dt(ev.created_at)} — {who}", font="Helvetica-Bold", size=9)
+                doc.paragraph(ev.content, cont_title="Evoluciones / Addendum (cont.)")
+                doc.spacer(6)
+
+        doc.signature(dname, dspec, dreg)
+        doc.rule()
+
+    on_page = (lambda n, total: progress(int(n * 100 / total), f"Página {n}/{total}")) if progress else None
+    return doc.render(on_page=on_page)
+
+
+def render_patient_history_pdf(db: Session, patient: Patient, progress=None) -> bytes:
+    """
+    Carga todo en pocas consultas (atenciones calientes y archivadas, notas,
+    evoluciones, doctores), sin consultas por atención.
+    """
+    encounters = encounter_store.find(db, patient_ids=[patient.id], with_payload=True)
+    enc_ids = [e.id for e in encounters if not e.archived]
+
+    notes = {}
+    evolutions: dict[int, list[EncounterEvolution]] = {}
+    for e in encounters:
+        if e.archived:
+            if e.note:
+                notes[e.id] = e.note
+            if e.evolutions:
+                evolutions[e.id] = e.evolutions
+    if enc_ids:
+        for n in db.query(ClinicalNote).filter(ClinicalNote.encounter_id.in_(enc_ids)).all():
+            notes[n.encounter_id] = n
+        evs = (
+            db.query(EncounterEvolution)
+            .filter(EncounterEvolution.encounter_id.in_(enc_ids))
+            .order_by(asc(EncounterEvolution.created_at), asc(EncounterEvolution.id))
+            .all()
+        )
+        for ev in evs:
+            evolutions.setdefault(ev.encounter_id, []).append(ev)
+
+    doctor_ids = {e.doctor_id for e in encounters}
+    doctor_ids |= {ev.author_doctor_id for evs in evolutions.values() for ev in evs}
+    doctors = {d.id: d for d in db.query(Doctor).filter(Doctor.id.in_(doctor_ids)).all()} if doctor_ids else {}
+
+    return build_history_pdf(patient, encounters, doctors, notes, evolutions, progress=progress)
@@ -0,0 +1,389 @@
+# =========================
+# ✅ app/services/pdf_layout.py
+# (Motor de maquetación PDF en dos pasadas: medir → pintar)
+# =========================
+"""
+Los documentos se describen como una lista de operaciones ya medidas
+(línea de texto, título, fila, firma, ...). La pasada 1 reparte esas
+operaciones en páginas sin dibujar nada; la pasada 2 pinta cada página una
+sola vez. Como la paginación se conoce antes de pintar, el índice puede
+mostrar números de página reales y el pie puede decir "Pág. n de N".
+"""
+import os
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Callable
+
+from reportlab.lib.colors import HexColor
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+BRAND_NAME = "NexaCenter"
+COLOR_TEXT = HexColor("#111111")
+COLOR_TITLE = HexColor("#2B2B2B")
+COLOR_MUTED = HexColor("#6B6B6B")
+COLOR_BG = HexColor("#F2F2F2")
+COLOR_WATERMARK = HexColor("#E6E6E6")
+LOGO_FILENAME = "logo.png"
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+LEFT, RIGHT = 40, 40
+CONTENT_WIDTH = PAGE_WIDTH - LEFT - RIGHT
+HEADER_TOP = PAGE_HEIGHT - 40
+LOGO_WIDTH = 140
+BOTTOM_Y = 60               # encima del pie de página
+
+LINE_HEIGHT = 12
+BLANK_HEIGHT = 6
+ROW_HEIGHT = 14
+SIGNATURE_HEIGHT = 140
+
+
+def _asset_path(filename: str) -> str:
+    base = os.path.dirname(os.path.dirname(__file__))
+    return os.path.join(base, "assets", filename)
+
+
+_logo: ImageReader | None = None
+_logo_loaded = False
+
+
+def _get_logo() -> ImageReader | None:
+    # Se lee una sola vez por proceso (antes se abría en cada página)
+    global _logo, _logo_loaded
+    if not _logo_loaded:
+        _logo_loaded = True
+        path = _asset_path(LOGO_FILENAME)
+        if os.path.exists(path):
+            try:
+                _logo = ImageReader(path)
+            except Exception:
+                _logo = None
+    return _logo
+
+
+def content_top() -> float:
+    """
+    Primera línea útil de cada página: debajo del logo (medido) o, sin logo,
+    debajo del título del encabezado.
+    """
+    img = _get_logo()
+    if img is None:
+        return PAGE_HEIGHT - 110
+    try:
+        iw, ih = img.getSize()
+        return min(PAGE_HEIGHT - 110, HEADER_TOP - ih * (LOGO_WIDTH / float(iw)) - 20)
+    except Exception:
+        return PAGE_HEIGHT - 110
+
+
+# -------------------------
+# Texto
+# -------------------------
+def wrap_text(text: str | None, max_width: float, font: str = "Helvetica", size: float = 10) -> list[str]:
+    """
+    Parte el texto en líneas que caben en max_width. Cada palabra se mide una
+    sola vez (Helvetica no tiene kerning: ancho(a + " " + b) = ancho(a) + espacio + ancho(b)).
+    Una línea vacía ("") representa un salto de párrafo.
+    """
+    if not text or not text.strip():
+        return ["-"]
+
+    space = stringWidth(" ", font, size)
+    lines = []
+    for p in text.strip().replace("\r\n", "\n").split("\n"):
+        words = p.split()
+        if not words:
+            lines.append("")
+            continue
+        current, current_w = words[0], stringWidth(words[0], font, size)
+        for w in words[1:]:
+            ww = stringWidth(w, font, size)
+            if current_w + space + ww <= max_width:
+                current += " " + w
+                current_w += space + ww
+            else:
+                lines.append(current)
+                current, current_w = w, ww
+        lines.append(current)
+    return lines
+
+
+# -------------------------
+# Operaciones
+# -------------------------
+Paint = Callable[[canvas.Canvas, float, "Layout"], None]
+
+
+@dataclass
+class _Op:
+    height: float
+    paint: Paint | None = None
+    keep_with_next: int = 0          # cuántas operaciones siguientes deben ir en la misma página
+    cont: list["_Op"] | None = None  # se repite arriba si esta operación abre página (título "(cont.)")
+    page_break: bool = False
+    anchor: str | None = None
+
+
+@dataclass
+class Layout:
+    pages: list[list[tuple[_Op, float]]] = field(default_factory=list)
+    anchors: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def page_count(self) -> int:
+        return len(self.pages)
+
+
+class Document:
+    def __init__(self, title_right: str):
+        self.title_right = title_right
+        self.ops: list[_Op] = []
+
+    # ---- bloques ----
+    def heading(self, text: str, size: float = 11, keep: int = 2):
+        self.ops.append(_Op(height=24, paint=_paint_heading(text, size), keep_with_next=keep))
+
+    def text_line(self, text: str, font: str = "Helvetica", size: float = 10, color=COLOR_TEXT):
+        def paint(c, y, layout):
+            c.setFont(font, size)
+            c.setFillColor(color)
+            c.drawString(LEFT, y, text)
+        self.ops.append(_Op(height=LINE_HEIGHT, paint=paint))
+
+    def paragraph(self, text: str | None, cont_title: str | None = None, font: str = "Helvetica", size: float = 10):
+        cont = [_Op(height=24, paint=_paint_heading(cont_title, 11))] if cont_title else None
+        for line in wrap_text(text, CONTENT_WIDTH, font, size):
+            if line == "":
+                self.ops.append(_Op(height=BLANK_HEIGHT, cont=cont))
+            else:
+                self.ops.append(_Op(height=LINE_HEIGHT, paint=_paint_line(line, font, size), cont=cont))
+
+    def section(self, title: str, text: str | None):
+        self.heading(title, keep=2)
+        self.paragraph(text, cont_title=f"{title} (cont.)")
+        self.spacer(6)
+
+    def row(self, label: str, value, label_width: float = 140):
+        value = str(value)
+
+        def paint(c, y, layout):
+            c.setFont("Helvetica", 10)
+            c.setFillColor(COLOR_MUTED)
+            c.drawString(LEFT, y, f"{label}:")
+            c.setFillColor(COLOR_TEXT)
+            c.drawString(LEFT + label_width, y, value)
+        self.ops.append(_Op(height=ROW_HEIGHT, paint=paint))
+
+    def spacer(self, height: float):
+        self.ops.append(_Op(height=height))
+
+    def rule(self, color=COLOR_BG, gap: float = 12):
+        def paint(c, y, layout):
+            c.setStrokeColor(color)
+            c.line(LEFT, y, PAGE_WIDTH - RIGHT, y)
+        self.ops.append(_Op(height=gap, paint=paint))
+
+    def page_break(self):
+        self.ops.append(_Op(height=0, page_break=True))
+
+    def anchor(self, key: str):
+        self.ops.append(_Op(height=0, anchor=key))
+
+    def index_entry(self, text: str, anchor_key: str, size: float = 9):
+        """
+        Entrada de índice con el número de página real del ancla (se resuelve al pintar).
+        """
+        lines = wrap_text(text, CONTENT_WIDTH - 50, "Helvetica", size)
+        for i, line in enumerate(lines):
+            self.ops.append(_Op(height=LINE_HEIGHT, paint=_paint_index_line(line, anchor_key if i == 0 else None, size)))
+        self.spacer(4)
+
+    def signature(self, name: str, specialty: str, registration: str):
+        self.ops.append(_Op(height=SIGNATURE_HEIGHT, paint=_paint_signature(name, specialty, registration)))
+
+    # ---- pasada 1: medir y paginar ----
+    def layout(self) -> Layout:
+        out = Layout()
+        page: list[tuple[_Op, float]] = []
+        top = content_top()
+        y = top
+        ops = self.ops
+
+        def new_page():
+            nonlocal page, y
+            out.pages.append(page)
+            page = []
+            y = top
+
+        for i, op in enumerate(ops):
+            if op.page_break:
+                if page:
+                    new_page()
+                continue
+            if op.anchor:
+                out.anchors[op.anchor] = len(out.pages) + 1
+                continue
+
+            needed = op.height
+            for nxt in ops[i + 1:i + 1 + op.keep_with_next]:
+                if nxt.page_break:
+                    break
+                needed += nxt.height
+
+            if y - needed < BOTTOM_Y and page:
+                new_page()
+                if op.cont:
+                    for cop in op.cont:
+                        page.append((cop, y))
+                        y -= cop.height
+                if op.paint is None and op.height <= BLANK_HEIGHT:
+                    continue  # no abrir página con un espacio en blanco
+
+            page.append((op, y))
+            y -= op.height
+
+        out.pages.append(page)
+        return out
+
+    # ---- pasada 2: pintar ----
+    def render(self, on_page: Callable[[int, int], None] | None = None) -> bytes:
+        layout = self.layout()
+        total = layout.page_count
+
+        buf = BytesIO()
+        c = canvas.Canvas(buf, pagesize=letter)
+        for n, placed in enumerate(layout.pages, start=1):
+            _paint_watermark(c)
+            _paint_header(c, self.title_right)
+            _paint_footer(c, n, total)
+            for op, y in placed:
+                if op.paint:
+                    op.paint(c, y, layout)
+            c.showPage()
+            if on_page:
+                on_page(n, total)
+        c.save()
+        return buf.getvalue()
+
+
+# -------------------------
+# Pintado
+# -------------------------
+def _paint_heading(text: str, size: float) -> Paint:
+    def paint(c, y, layout):
+        c.setFont("Helvetica-Bold", size)
+        c.setFillColor(COLOR_TITLE)
+        c.drawString(LEFT, y, text)
+        c.setStrokeColor(COLOR_MUTED)
+        c.line(LEFT, y - 10, PAGE_WIDTH - RIGHT, y - 10)
+    return paint
+
+
+def _paint_line(line: str, font: str, size: float) -> Paint:
+    def paint(c, y, layout):
+        c.setFont(font, size)
+        c.setFillColor(COLOR_TEXT)
+        c.drawString(LEFT, y, line)
+    return paint
+
+
+def _paint_index_line(line: str, anchor_key: str | None, size: float) -> Paint:
+    def paint(c, y, layout):
+        c.setFont("Helvetica", size)
+        c.setFillColor(COLOR_TEXT)
+        c.drawString(LEFT, y, line)
+        if anchor_key and anchor_key in layout.anchors:
+            c.setFillColor(COLOR_MUTED)
+            c.drawRightString(PAGE_WIDTH - RIGHT, y, f"pág. {layout.anchors[anchor_key]}")
+    return paint
+
+
+def _paint_watermark(c: canvas.Canvas):
+    c.saveState()
+    c.setFillColor(COLOR_WATERMARK)
+    c.setFont("Helvetica-Bold", 70)
+    c.translate(PAGE_WIDTH / 2, PAGE_HEIGHT / 2)
+    c.rotate(25)
+    c.drawCentredString(0, 0, BRAND_NAME.upper())
+    c.restoreState()
+
+
+def _paint_header(c: canvas.Canvas, title_right: str):
+    y = HEADER_TOP
+
+    img = _get_logo()
+    if img is not None:
+        try:
+            iw, ih = img.getSize()
+            desired_w = LOGO_WIDTH
+            desired_h = ih * (desired_w / float(iw))
+            c.drawImage(
+                img, LEFT, y - desired_h,
+                width=desired_w, height=desired_h,
+                mask="auto", preserveAspectRatio=True, anchor="nw",
+            )
+        except Exception:
+            pass
+
+    c.setFont("Helvetica-Bold", 18)
+    c.setFillColor(COLOR_TITLE)
+    c.drawRightString(PAGE_WIDTH - RIGHT, y - 15, title_right)
+
+
+def _paint_footer(c: canvas.Canvas, page_num: int, total: int):
+    c.setFont("Helvetica", 8)
+    c.setFillColor(COLOR_MUTED)
+    c.drawString(LEFT, 25, "Confidencial — Uso exclusivo para fines clínicos.")
+    c.drawRightString(PAGE_WIDTH - RIGHT, 25, f"Pág. {page_num} de {total}")
+
+
+def _paint_signature(name: str, specialty: str, registration: str) -> Paint:
+    def paint(c, y, layout):
+        c.setFont("Helvetica-Bold", 11)
+        c.setFillColor(COLOR_TITLE)
+        c.drawString(LEFT, y, "Validación profesional")
+        y -= 10
+
+        c.setStrokeColor(COLOR_MUTED)
+        c.line(LEFT, y, PAGE_WIDTH - RIGHT, y)
+        y -= 20
+
+        box_height = 100
+        c.setStrokeColor(COLOR_MUTED)
+        c.setFillColor(COLOR_BG)
+        c.roundRect(LEFT, y - box_height, CONTENT_WIDTH, box_height, 10, stroke=1, fill=1)
+
+        c.setFillColor(COLOR_MUTED)
+        c.setFont("Helvetica", 9)
+        c.drawString(LEFT + 14, y - 18, "Firma del profesional:")
+        c.drawString(LEFT + 14, y - 40, "Nombre:")
+        c.drawString(LEFT + 14, y - 56, "Especialidad:")
+        c.drawString(LEFT + 14, y - 72, "Registro profesional:")
+
+        c.setStrokeColor(COLOR_MUTED)
+        c.line(LEFT + 140, y - 22, LEFT + 320, y - 22)  # firma
+        c.line(LEFT + 140, y - 44, LEFT + 320, y - 44)  # nombre
+        c.line(LEFT + 140, y - 60, LEFT + 320, y - 60)  # especialidad
+        c.line(LEFT + 140, y - 76, LEFT + 320, y - 76)  # registro
+
+        c.setFillColor(COLOR_TEXT)
+        c.setFont("Helvetica", 9)
+        c.drawString(LEFT + 145, y - 40, name)
+        c.drawString(LEFT + 145, y - 56, specialty)
+        c.drawString(LEFT + 145, y - 72, registration)
+
+        c.setFillColor(COLOR_MUTED)
+        c.setFont("Helvetica", 9)
+        c.drawString(LEFT + 360, y - 18, "Sello (incluye registro):")
+
+        c.setStrokeColor(COLOR_MUTED)
+        c.setFillColor(HexColor("#FFFFFF"))
+        c.roundRect(LEFT + 360, y - 82, 165, 60, 8, stroke=1, fill=1)
+
+        c.setFillColor(COLOR_MUTED)
+        c.setFont("Helvetica-Oblique", 7)
+        c.drawCentredString(LEFT + 360 + 82.5, y - 54, "Colocar sello aquí")
+    return paint
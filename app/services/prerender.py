@@ -0,0 +1,95 @@
+# =========================
+# ✅ app/services/prerender.py
+# (PDF de la atención pre-renderizado al cerrar)
+# =========================
+"""
+Al cerrar una atención se encola su PDF; al vencer la ventana de edición
+(20 min) se encola otra vez por si la nota cambió. La descarga sirve el
+archivo guardado mientras su huella coincida con los datos actuales.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from ..models import Encounter
+from . import blobstore, jobs
+from .pdf_documents import build_encounter_pdf, doctor_meta, load_encounter_parts
+
+EDIT_WINDOW = timedelta(minutes=20)
+
+_NOTE_FIELDS = (
+    "chief_complaint", "hpi", "physical_exam", "complementary_tests", "assessment_dx",
+    "plan_treatment", "indications_alarm_signs", "follow_up",
+    "ta_sys", "ta_dia", "hr", "rr", "temp", "spo2",
+)
+
+
+def fingerprint(enc: Encounter, patient, doctor, note) -> str:
+    """
+    Huella de todo lo que se imprime en el PDF (salvo la fecha de generación).
+    """
+    data = {
+        "enc": [enc.id, enc.visit_type, enc.chief_complaint_short,
+                enc.created_at.isoformat() if enc.created_at else None,
+                enc.ended_at.isoformat() if enc.ended_at else None],
+        "patient": getattr(patient, "full_name", None),
+        "doctor": doctor_meta(doctor),
+        "note": [getattr(note, f) for f in _NOTE_FIELDS] if note else None,
+    }
+    raw = json.dumps(data, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def is_final(enc: Encounter, now: datetime | None = None) -> bool:
+    if enc.is_signed:
+        return True
+    now = now or datetime.utcnow()
+    return enc.ended_at is not None and now > enc.ended_at + EDIT_WINDOW
+
+
+def get_current(db: Session, enc: Encounter, fp: str) -> str | None:
+    """
+    sha256 del PDF guardado si sigue vigente (misma huella y blob presente).
+    """
+    ref = blobstore.get_ref(db, "encounter", enc.id, "pdf")
+    if ref and ref.source_fingerprint == fp and blobstore.available(ref.sha256):
+        return ref.sha256
+    return None
+
+
+def store(db: Session, enc: Encounter, fp: str, content: bytes) -> str:
+    blob = blobstore.put(db, content, "application/pdf")
+    blobstore.attach(db, blob, "encounter", enc.id, "pdf", source_fingerprint=fp)
+    db.commit()
+    return blob.sha256
+
+
+def schedule_on_close(db: Session, enc: Encounter, requested_by: int | None = None):
+    """
+    Encola el render inmediato y otro al vencer la ventana de edición.
+    """
+    params = {"encounter_id": enc.id}
+    jobs.enqueue(db, "encounter_pdf", params, requested_by=requested_by)
+    if enc.ended_at is not None:
+        jobs.enqueue(
+            db, "encounter_pdf", params, requested_by=requested_by,
+            run_after=enc.ended_at + EDIT_WINDOW + timedelta(seconds=5),
+        )
+
+
+@jobs.handler("encounter_pdf")
+def _encounter_pdf_job(db: Session, ctx: jobs.JobContext, params: dict):
+    enc = db.query(Encounter).filter(Encounter.id == int(params.get("encounter_id") or 0)).first()
+    if not enc:
+        raise ValueError("Consulta no encontrada")
+
+    patient, doctor, note = load_encounter_parts(db, enc)
+    fp = fingerprint(enc, patient, doctor, note)
+    if get_current(db, enc, fp):
+        ctx.progress(100, "PDF ya vigente")
+        return None
+
+    store(db, enc, fp, build_encounter_pdf(enc, patient, doctor, note))
+    return None
@@ -0,0 +1,285 @@
+# =========================
+# ✅ app/services/scheduler.py
+# (Tareas periódicas: citas vencidas y cola de recordatorios)
+# =========================
+"""
+Un task de asyncio por proceso; solo el que tiene el lock de la fila
+"scheduler" en scheduler_locks (líder) ejecuta la pasada. El lock es un
+lease con vencimiento: si el líder muere, otro lo toma al expirar.
+
+Cada pasada:
+1) citas scheduled/confirmed que terminaron hace más de APPT_REVIEW_GRACE_MIN
+   pasan a pending_review (UPDATE por lotes de SCHEDULER_BATCH filas);
+2) se encola el recordatorio de las citas de mañana con un solo INSERT…SELECT
+   y se cancelan los pendientes cuya cita se cerró o se reagendó;
+3) se recalcula el resumen de los pacientes cuya "próxima cita" ya pasó
+   (services/patient_summary.py);
+4) cada ANALYTICS_REFRESH_SECONDS se ponen al día los rollups diarios
+   (services/analytics.py);
+5) se archiva un lote de atenciones firmadas viejas (services/encounter_store.py).
+"""
+import asyncio
+import logging
+import os
+import socket
+import time as _time
+import uuid
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import exists, insert, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .. import clinic_time
+from ..database import SessionLocal
+from ..models import Appointment, AppointmentReminder, SchedulerLock
+from . import analytics, encounter_store, events, patient_summary
+
+log = logging.getLogger("nexa.scheduler")
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
+SCHEDULER_INTERVAL_SECONDS = float(os.getenv("SCHEDULER_INTERVAL_SECONDS", "60"))
+SCHEDULER_BATCH = int(os.getenv("SCHEDULER_BATCH", "500"))
+APPT_REVIEW_GRACE_MIN = int(os.getenv("APPT_REVIEW_GRACE_MIN", "30"))  # = ventana para iniciar atención
+
+LOCK_NAME = "scheduler"
+LEASE = timedelta(seconds=max(3 * SCHEDULER_INTERVAL_SECONDS, 30))
+
+OPEN_STATUSES = ("scheduled", "confirmed")
+
+# identifica a este proceso como dueño del lease
+_owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# última actualización de rollups hecha por este proceso (monotónico)
+_analytics_at: float | None = None
+
+
+# -------------------------
+# Elección de líder (lease en una fila)
+# -------------------------
+def acquire_lease(db: Session, name: str = LOCK_NAME, now: datetime | None = None) -> bool:
+    now = now or datetime.utcnow()
+    res = db.execute(
+        update(SchedulerLock)
+        .where(SchedulerLock.name == name)
+        .where((SchedulerLock.owner == _owner) | (SchedulerLock.expires_at < now))
+        .values(owner=_owner, expires_at=now + LEASE)
+    )
+    db.commit()
+    if res.rowcount == 1:
+        return True
+
+    try:
+        db.add(SchedulerLock(name=name, owner=_owner, expires_at=now + LEASE))
+        db.commit()
+        return True
+    except IntegrityError:
+        # la fila existe y otro proceso tiene el lease vigente
+        db.rollback()
+        return False
+
+
+def release_lease(db: Session, name: str = LOCK_NAME):
+    db.execute(
+        update(SchedulerLock)
+        .where(SchedulerLock.name == name, SchedulerLock.owner == _owner)
+        .values(expires_at=datetime.min)
+    )
+    db.commit()
+
+
+# -------------------------
+# Pasadas
+# -------------------------
+def sweep_past_appointments(db: Session, now: datetime | None = None, batch: int = SCHEDULER_BATCH) -> int:
+    """
+    scheduled/confirmed vencidas -> pending_review, en lotes.
+    `now` es hora local de la clínica (como end_at).
+    """
+    now = now or clinic_time.now()
+    cutoff = now - timedelta(minutes=APPT_REVIEW_GRACE_MIN)
+    total = 0
+    while True:
+        rows = db.execute(
+            select(Appointment.id, Appointment.doctor_id)
+            .where(Appointment.status.in_(OPEN_STATUSES))
+            .where(Appointment.end_at < cutoff)
+            .limit(batch)
+        ).all()
+        if not rows:
+            return total
+        db.execute(
+            update(Appointment)
+            .where(Appointment.id.in_([r.id for r in rows]))
+            .where(Appointment.status.in_(OPEN_STATUSES))
+            .values(status="pending_review", updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        total += len(rows)
+
+        per_doctor: dict[int, int] = {}
+        for r in rows:
+            per_doctor[r.doctor_id] = per_doctor.get(r.doctor_id, 0) + 1
+        for doctor_id, n in per_doctor.items():
+            events.publish(doctor_id, "appointment", {"action": "pending_review", "count": n})
+
+        if len(rows) < batch:
+            return total
+
+
+def queue_reminders(db: Session, now: datetime | None = None) -> tuple[int, int]:
+    """
+    Prepara la cola de recordatorios de mañana, todo en sentencias por conjunto:
+    cancela los pendientes cuya cita se cerró o se movió, reactiva los que
+    vuelven a coincidir y encola las citas abiertas que faltan.
+    Devuelve (nuevos, cancelados). "Mañana" es según la hora local de la clínica.
+    """
+    now = now or clinic_time.now()
+    day = datetime.combine(now.date() + timedelta(days=1), time.min)
+    day_end = day + timedelta(days=1)
+
+    stale = exists().where(
+        Appointment.id == AppointmentReminder.appointment_id,
+        or_(Appointment.status.not_in(OPEN_STATUSES), Appointment.start_at != AppointmentReminder.start_at),
+    )
+    canceled = db.execute(
+        update(AppointmentReminder)
+        .where(AppointmentReminder.status == "pending")
+        .where(stale)
+        .values(status="canceled")
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    matches = exists().where(
+        Appointment.id == AppointmentReminder.appointment_id,
+        Appointment.status.in_(OPEN_STATUSES),
+        Appointment.start_at == AppointmentReminder.start_at,
+    )
+    db.execute(
+        update(AppointmentReminder)
+        .where(AppointmentReminder.status == "canceled")
+        .where(AppointmentReminder.remind_for == day)
+        .where(matches)
+        .values(status="pending")
+        .execution_options(synchronize_session=False)
+    )
+
+    queued = exists().where(
+        AppointmentReminder.appointment_id == Appointment.id,
+        AppointmentReminder.start_at == Appointment.start_at,
+    )
+    src = (
+        select(
+            Appointment.id,
+            Appointment.doctor_id,
+            Appointment.patient_id,
+            literal(day),
+            Appointment.start_at,
+            literal("pending"),
+            literal(now),
+        )
+        .where(Appointment.status.in_(OPEN_STATUSES))
+        .where(Appointment.start_at >= day)
+        .where(Appointment.start_at < day_end)
+        .where(~queued)
+    )
+    added = db.execute(
+        insert(AppointmentReminder).from_select(
+            ["appointment_id", "doctor_id", "patient_id", "remind_for", "start_at", "status", "created_at"],
+            src,
+        )
+    ).rowcount
+    db.commit()
+    return added, canceled
+
+
+def refresh_analytics(db: Session, now: datetime | None = None, force: bool = False) -> int | None:
+    """
+    Rollups diarios; como mucho una vez cada ANALYTICS_REFRESH_SECONDS.
+    None si todavía no tocaba.
+    """
+    global _analytics_at
+    mono = _time.monotonic()
+    if not force and _analytics_at is not None and mono - _analytics_at < analytics.ANALYTICS_REFRESH_SECONDS:
+        return None
+    try:
+        written = analytics.refresh(db, now=now)
+    except Exception:
+        db.rollback()
+        log.exception("No se pudieron actualizar los rollups")
+        return None
+    _analytics_at = mono
+    return written
+
+
+def run_once(now: datetime | None = None) -> dict | None:
+    """
+    Una pasada completa si este proceso es líder; None si no lo es.
+    """
+    db = SessionLocal()
+    try:
+        if not acquire_lease(db, now=now):
+            return None
+        swept = sweep_past_appointments(db, now=now)
+        added, canceled = queue_reminders(db, now=now)
+        if swept or added or canceled:
+            log.info("scheduler: %s a pending_review, %s recordatorios, %s cancelados", swept, added, canceled)
+        summaries = patient_summary.refresh_passed_appointments(db, now=now)
+        rollups = refresh_analytics(db, now=now)
+        archived = encounter_store.archive_batch(db, now=now)
+        if archived:
+            log.info("scheduler: %s atenciones archivadas", archived)
+        return {
+            "pending_review": swept,
+            "reminders_added": added,
+            "reminders_canceled": canceled,
+            "patient_summaries": summaries,
+            "rollups": rollups,
+            "archived": archived,
+        }
+    finally:
+        db.close()
+
+
+# -------------------------
+# Task de asyncio
+# -------------------------
+_task: asyncio.Task | None = None
+
+
+async def _loop():
+    while True:
+        try:
+            # ⚡ la BD es síncrona: la pasada corre en el threadpool
+            await asyncio.to_thread(run_once)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("Error en la pasada del scheduler")
+        await asyncio.sleep(SCHEDULER_INTERVAL_SECONDS)
+
+
+def start():
+    global _task
+    if not SCHEDULER_ENABLED or _task is not None:
+        return
+    _task = asyncio.get_running_loop().create_task(_loop(), name="nexa-scheduler")
+
+
+async def stop():
+    global _task
+    if _task is None:
+        return
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
+
+    db = SessionLocal()
+    try:
+        release_lease(db)
+    finally:
+        db.close()
@@ -0,0 +1,89 @@
+# =========================
+# ✅ app/services/schema.py
+# (Columnas e índices nuevos sobre tablas existentes)
+# =========================
+"""
+`create_all` crea tablas nuevas pero no agrega columnas ni índices a las
+que ya existen. Estos helpers comparan los modelos con la BD y hacen
+`ALTER TABLE ... ADD COLUMN` / `CREATE INDEX` de lo que falte.
+
+Solo sirve para agregar columnas nullable o con server_default (lo único
+que SQLite permite agregar sin reconstruir la tabla). Renombrar o cambiar
+tipos sigue siendo manual.
+"""
+import logging
+
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.engine import Engine
+
+log = logging.getLogger("nexa.schema")
+
+
+def _column_ddl(engine: Engine, col) -> str:
+    preparer = engine.dialect.identifier_preparer
+    ddl = f"{preparer.quote(col.name)} {col.type.compile(dialect=engine.dialect)}"
+    if col.server_default is not None:
+        default = col.server_default.arg
+        default = default.text if hasattr(default, "text") else str(default)
+        ddl += f" DEFAULT {default}"
+    if not col.nullable:
+        ddl += " NOT NULL"
+    return ddl
+
+
+def add_missing_columns(engine: Engine, metadata: MetaData) -> list[str]:
+    """
+    Devuelve las columnas agregadas ("tabla.columna").
+    """
+    insp = inspect(engine)
+    existing_tables = set(insp.get_table_names())
+    added = []
+
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in present:
+                    continue
+                if not col.nullable and col.server_default is None:
+                    log.error("No se puede agregar %s.%s: NOT NULL sin server_default", table.name, col.name)
+                    continue
+                table_name = engine.dialect.identifier_preparer.quote(table.name)
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {_column_ddl(engine, col)}"))
+                added.append(f"{table.name}.{col.name}")
+
+    for name in added:
+        log.info("Columna agregada: %s", name)
+    return added
+
+
+def add_missing_indexes(engine: Engine, metadata: MetaData) -> list[str]:
+    """
+    Crea los índices declarados en los modelos (Index / index=True) que no
+    existan en tablas ya creadas. Devuelve sus nombres.
+    """
+    insp = inspect(engine)
+    existing_tables = set(insp.get_table_names())
+    added = []
+
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {ix["name"] for ix in insp.get_indexes(table.name)}
+        columns = {c["name"] for c in insp.get_columns(table.name)}
+        for index in table.indexes:
+            if index.name in present:
+                continue
+            missing = [c.name for c in index.columns if c.name not in columns]
+            if missing:
+                # la columna no se pudo agregar (ver add_missing_columns): sin índice, pero arranca
+                log.error("No se puede crear %s: faltan columnas %s en %s", index.name, ", ".join(missing), table.name)
+                continue
+            index.create(bind=engine, checkfirst=True)
+            added.append(index.name)
+
+    for name in added:
+        log.info("Índice creado: %s", name)
+    return added
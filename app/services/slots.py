@@ -0,0 +1,224 @@
+# =========================
+# ✅ app/services/slots.py
+# (Huecos libres de la agenda de un doctor)
+# =========================
+"""
+Horario laboral configurable por entorno:
+
+    WORK_HOURS="08:00-13:00,14:00-19:00"   tramos del día
+    WORK_DAYS="0,1,2,3,4,5"                0 = lunes ... 6 = domingo
+    SLOT_STEP_MIN=15                       grilla de inicios posibles
+
+Los inicios se alinean a la grilla desde el comienzo de cada tramo.
+"""
+import os
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .. import clinic_time
+from ..models import Appointment
+
+SLOT_STEP_MIN = int(os.getenv("SLOT_STEP_MIN", "15"))
+# ⚡ a partir de este rango se usa la versión vectorizada
+NUMPY_MIN_DAYS = int(os.getenv("SLOTS_NUMPY_MIN_DAYS", "14"))
+
+
+def _parse_hours(raw: str) -> list[tuple[time, time]]:
+    out = []
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        a, b = part.split("-")
+        t1 = datetime.strptime(a.strip(), "%H:%M").time()
+        t2 = datetime.strptime(b.strip(), "%H:%M").time()
+        if t2 > t1:
+            out.append((t1, t2))
+    return sorted(out)
+
+
+WORK_HOURS = _parse_hours(os.getenv("WORK_HOURS", "08:00-13:00,14:00-19:00"))
+WORK_DAYS = {int(x) for x in os.getenv("WORK_DAYS", "0,1,2,3,4,5").split(",") if x.strip()}
+
+
+def working_intervals(d_from: date, d_to: date) -> list[tuple[datetime, datetime]]:
+    out = []
+    d = d_from
+    while d <= d_to:
+        if d.weekday() in WORK_DAYS:
+            for t1, t2 in WORK_HOURS:
+                out.append((datetime.combine(d, t1), datetime.combine(d, t2)))
+        d += timedelta(days=1)
+    return out
+
+
+def busy_intervals(db: Session, doctor_id: int, start_dt: datetime, end_dt: datetime) -> list[tuple[datetime, datetime]]:
+    """
+    Citas no canceladas que tocan el rango, en una sola consulta ordenada.
+    """
+    rows = (
+        db.query(Appointment.start_at, Appointment.end_at)
+        .filter(Appointment.doctor_id == doctor_id)
+        .filter(Appointment.status != "canceled")
+        .filter(Appointment.start_at < end_dt)
+        .filter(Appointment.end_at > start_dt)
+        .order_by(Appointment.start_at.asc())
+        .all()
+    )
+    return [(r.start_at, r.end_at) for r in rows]
+
+
+def merge(intervals: list[tuple[datetime, datetime]]) -> list[tuple[datetime, datetime]]:
+    """
+    Une intervalos (ya ordenados por inicio) que se tocan o se pisan.
+    """
+    out: list[list[datetime]] = []
+    for s, e in intervals:
+        if out and s <= out[-1][1]:
+            if e > out[-1][1]:
+                out[-1][1] = e
+        else:
+            out.append([s, e])
+    return [(s, e) for s, e in out]
+
+
+def free_gaps(work, busy) -> list[tuple[datetime, datetime]]:
+    """
+    Barrido: tramos laborales menos citas (ambas listas ordenadas).
+    """
+    busy = merge(busy)
+    gaps = []
+    i = 0
+    for ws, we in work:
+        cur = ws
+        while i < len(busy) and busy[i][1] <= ws:
+            i += 1
+        j = i
+        while j < len(busy) and busy[j][0] < we:
+            bs, be = busy[j]
+            if bs > cur:
+                gaps.append((cur, bs))
+            cur = max(cur, be)
+            j += 1
+        if cur < we:
+            gaps.append((cur, we))
+    return gaps
+
+
+def _slots_sweep(work, gaps, duration: timedelta, step: timedelta, not_before: datetime):
+    """
+    Inicios de la grilla de cada tramo que caben completos en algún hueco.
+    """
+    out = []
+    g = 0
+    for ws, we in work:
+        while g < len(gaps) and gaps[g][1] <= ws:
+            g += 1
+        k = g
+        s = ws
+        while s + duration <= we:
+            while k < len(gaps) and gaps[k][1] < s + duration:
+                k += 1
+            if k == len(gaps) or gaps[k][0] >= we:
+                break
+            if gaps[k][0] <= s and s >= not_before:
+                out.append(s)
+                s += step
+            else:
+                # saltar al primer punto de la grilla dentro del hueco
+                s = max(s + step, ws + step * -(-(gaps[k][0] - ws) // step))
+    return out
+
+
+def _slots_numpy(work, busy, duration: timedelta, step: timedelta, not_before: datetime):
+    """
+    Misma respuesta que el barrido, vectorizada: todos los inicios candidatos
+    se prueban contra las citas unidas con searchsorted.
+    """
+    if not work:
+        return []
+    epoch = work[0][0]
+    step_m = int(step.total_seconds() // 60)
+    dur_m = int(duration.total_seconds() // 60)
+
+    def minutes(dt):
+        return int((dt - epoch).total_seconds() // 60)
+
+    ws = np.array([minutes(s) for s, _ in work], dtype=np.int64)
+    we = np.array([minutes(e) for _, e in work], dtype=np.int64)
+    counts = np.maximum((we - ws - dur_m) // step_m + 1, 0)
+    if counts.sum() == 0:
+        return []
+
+    # inicio de tramo repetido + desplazamiento dentro del tramo
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    starts = np.repeat(ws, counts) + offsets * step_m
+    ends = starts + dur_m
+
+    merged = merge(busy)
+    if merged:
+        bs = np.array([minutes(s) for s, _ in merged], dtype=np.int64)
+        be = np.array([minutes(e) for _, e in merged], dtype=np.int64)
+        # primera cita que termina después del inicio candidato
+        idx = np.searchsorted(be, starts, side="right")
+        clash = np.zeros(len(starts), dtype=bool)
+        has = idx < len(bs)
+        clash[has] = bs[idx[has]] < ends[has]
+        starts = starts[~clash]
+
+    starts = starts[starts >= minutes(not_before)]
+    return [epoch + timedelta(minutes=int(m)) for m in starts]
+
+
+def free_slots(
+    db: Session,
+    doctor_id: int,
+    d_from: date,
+    d_to: date,
+    duration_min: int,
+    step_min: int = SLOT_STEP_MIN,
+    now: datetime | None = None,
+) -> dict:
+    now = now or clinic_time.now()
+    work = working_intervals(d_from, d_to)
+    start_dt = datetime.combine(d_from, time.min)
+    end_dt = datetime.combine(d_to, time.min) + timedelta(days=1)
+    busy = busy_intervals(db, doctor_id, start_dt, end_dt)
+
+    duration = timedelta(minutes=duration_min)
+    step = timedelta(minutes=step_min)
+    gaps = free_gaps(work, busy)
+    if (d_to - d_from).days + 1 >= NUMPY_MIN_DAYS:
+        starts = _slots_numpy(work, busy, duration, step, now)
+    else:
+        starts = _slots_sweep(work, gaps, duration, step, now)
+
+    return {
+        "gaps": [(s, e) for s, e in gaps if e > now],
+        "slots": [(s, s + duration) for s in starts],
+    }
+
+
+def suggest(
+    busy: list[tuple[datetime, datetime]],
+    wanted: datetime,
+    duration: timedelta,
+    n: int = 3,
+    search_days: int = 3,
+    not_before: datetime | None = None,
+) -> list[datetime]:
+    """
+    Alternativas más cercanas a `wanted` (mismo día primero, luego días
+    siguientes) usando las citas ya cargadas; no consulta la BD.
+    """
+    step = timedelta(minutes=SLOT_STEP_MIN)
+    not_before = not_before or clinic_time.now()
+    day = wanted.date()
+    for extra in range(search_days + 1):
+        work = working_intervals(day, day + timedelta(days=extra))
+        starts = _slots_sweep(work, free_gaps(work, busy), duration, step, not_before)
+        if len(starts) >= n or extra == search_days:
+            return sorted(starts, key=lambda s: (abs(s - wanted), s))[:n]
+    return []
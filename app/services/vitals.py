@@ -0,0 +1,218 @@
+# =========================
+# ✅ app/services/vitals.py
+# (Series de signos vitales del paciente: estadísticas y reducción para gráficos)
+# =========================
+"""
+Los signos vitales viven en ClinicalNote (una fila por atención). `temp` es
+texto libre ("36,8", "37.2 °C", "99F"...); al escribirse se interpreta una
+vez y se guarda en `temp_c` (Float), que es lo que usan las series.
+
+Por serie se calcula con numpy: mínimo, máximo, media, último valor,
+promedio móvil y bandera de fuera de rango. Las series largas se reducen
+para el gráfico conservando el mínimo y el máximo de cada tramo (los picos
+fuera de rango no desaparecen al reducir).
+"""
+import logging
+import re
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session, undefer
+
+from ..models import ArchivedEncounter, ClinicalNote, Encounter
+from . import encounter_store
+
+log = logging.getLogger("nexa.vitals")
+
+# serie -> (unidad, mínimo normal, máximo normal) en adultos
+SERIES = {
+    "ta_sys": ("mmHg", 90, 140),
+    "ta_dia": ("mmHg", 60, 90),
+    "hr": ("lpm", 60, 100),
+    "rr": ("rpm", 12, 20),
+    "spo2": ("%", 94, 100),
+    "temp_c": ("°C", 36.0, 37.5),
+}
+
+DEFAULT_MAX_POINTS = 200
+DEFAULT_WINDOW = 3
+
+_NUMBER = re.compile(r"[-+]?\d+(?:[.,]\d+)?")
+
+
+# -------------------------
+# temp (texto) -> temp_c
+# -------------------------
+def parse_temp(value) -> float | None:
+    """
+    "36,8" -> 36.8 · "37.2 °C" -> 37.2 · "99F" -> 37.2. Fuera de 25–45 °C -> None.
+    """
+    if value is None:
+        return None
+    m = _NUMBER.search(str(value))
+    if not m:
+        return None
+    t = float(m.group(0).replace(",", "."))
+    if 86 <= t <= 113:  # escrito en °F
+        t = (t - 32) * 5 / 9
+    if not (25 <= t <= 45):
+        return None
+    return round(t, 1)
+
+
+@event.listens_for(ClinicalNote.temp, "set")
+def _sync_temp_c(target: ClinicalNote, value, _old, _initiator):
+    # escrituras por ORM (formulario, PUT); el PATCH (UPDATE directo) setea temp_c él mismo
+    target.temp_c = parse_temp(value)
+
+
+def backfill_temp_c(db: Session, batch: int = 500) -> int:
+    """
+    Completa temp_c en notas anteriores a la columna. Las que no se pueden
+    interpretar quedan en NULL (se reintentan en el próximo arranque).
+    """
+    done = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.query(ClinicalNote.id, ClinicalNote.temp)
+            .filter(ClinicalNote.id > last_id)
+            .filter(ClinicalNote.temp.isnot(None), ClinicalNote.temp_c.is_(None))
+            .order_by(ClinicalNote.id)
+            .limit(batch)
+            .all()
+        )
+        if not rows:
+            break
+        last_id = rows[-1].id
+        updates = [{"id": r.id, "temp_c": parse_temp(r.temp)} for r in rows]
+        updates = [u for u in updates if u["temp_c"] is not None]
+        if updates:
+            db.bulk_update_mappings(ClinicalNote, updates)
+            db.commit()
+            done += len(updates)
+    if done:
+        log.info("temp_c completado en %s notas", done)
+    return done
+
+
+# -------------------------
+# Series
+# -------------------------
+def load(db: Session, patient_id: int):
+    """
+    Todas las mediciones del paciente (atenciones calientes en una consulta,
+    archivadas desde su payload), ordenadas por fecha.
+    Devuelve (fechas, encounter_ids, {serie: np.array float con nan}).
+    """
+    cols = [getattr(ClinicalNote, name) for name in SERIES]
+    rows = (
+        db.query(Encounter.created_at, Encounter.id, *cols)
+        .join(ClinicalNote, ClinicalNote.encounter_id == Encounter.id)
+        .filter(Encounter.patient_id == patient_id)
+        .order_by(Encounter.created_at.asc(), Encounter.id.asc())
+        .all()
+    )
+    archived = [
+        encounter_store.ArchivedEncounterView(r)
+        for r in db.query(ArchivedEncounter)
+        .options(undefer(ArchivedEncounter.payload))
+        .filter(ArchivedEncounter.patient_id == patient_id)
+        .all()
+    ]
+    if archived:
+        rows = sorted(
+            [*rows, *[(e.created_at, e.id, *[getattr(e.note, name, None) for name in SERIES]) for e in archived if e.note]],
+            key=lambda r: (r[0], r[1]),
+        )
+    times = [r[0] for r in rows]
+    enc_ids = np.array([r[1] for r in rows], dtype=np.int64)
+    # None -> nan en un solo paso (dtype=float convierte None en nan)
+    matrix = np.array([r[2:] for r in rows], dtype=float).reshape(len(rows), len(SERIES))
+    return times, enc_ids, {name: matrix[:, i] for i, name in enumerate(SERIES)}
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Promedio de los últimos `window` valores (menos al principio de la serie).
+    """
+    n = len(values)
+    if n == 0:
+        return values
+    c = np.cumsum(values)
+    prev = np.concatenate((np.zeros(window), c[:-window] if window < n else np.empty(0)))[:n]
+    counts = np.minimum(np.arange(1, n + 1), window)
+    return (c - prev) / counts
+
+
+def downsample_indices(values: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Índices a conservar: primero, último y el mínimo y máximo de cada tramo.
+    """
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max(1, (max_points - 2) // 2)
+    keep = [np.array([0, n - 1])]
+    for chunk in np.array_split(np.arange(1, n - 1), buckets):
+        if len(chunk):
+            seg = values[chunk]
+            keep.append(chunk[[int(np.argmin(seg)), int(np.argmax(seg))]])
+    return np.unique(np.concatenate(keep))
+
+
+def series_summary(
+    times: list[datetime],
+    enc_ids: np.ndarray,
+    values: np.ndarray,
+    low: float,
+    high: float,
+    window: int,
+    max_points: int,
+) -> dict:
+    mask = ~np.isnan(values)
+    idx = np.flatnonzero(mask)
+    v = values[mask]
+
+    if len(v) == 0:
+        return {"stats": {"count": 0}, "points": [], "downsampled": False}
+
+    avg = rolling_mean(v, window)
+    flags = np.where(v < low, -1, np.where(v > high, 1, 0))
+
+    stats = {
+        "count": int(len(v)),
+        "min": float(v.min()),
+        "max": float(v.max()),
+        "mean": round(float(v.mean()), 2),
+        "last": float(v[-1]),
+        "last_at": times[idx[-1]].isoformat(),
+        "out_of_range": int(np.count_nonzero(flags)),
+    }
+
+    keep = downsample_indices(v, max_points)
+    flag_names = {-1: "low", 0: None, 1: "high"}
+    points = [
+        {
+            "t": times[idx[k]].isoformat(),
+            "v": float(v[k]),
+            "avg": round(float(avg[k]), 2),
+            "flag": flag_names[int(flags[k])],
+            "encounter_id": int(enc_ids[idx[k]]),
+        }
+        for k in keep
+    ]
+    return {"stats": stats, "points": points, "downsampled": len(keep) < len(v)}
+
+
+def patient_vitals(db: Session, patient_id: int, window: int = DEFAULT_WINDOW, max_points: int = DEFAULT_MAX_POINTS) -> dict:
+    times, enc_ids, data = load(db, patient_id)
+    series = {}
+    for name, (unit, low, high) in SERIES.items():
+        series[name] = {
+            "unit": unit,
+            "normal": [low, high],
+            **series_summary(times, enc_ids, data[name], low, high, window, max_points),
+        }
+    return {"measurements": len(times), "window": window, "series": series}
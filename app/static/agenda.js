@@ -0,0 +1,288 @@
+// =========================
+// ✅ app/static/agenda.js
+// (Agenda: navegación día a día sin recargar, precarga de ventanas vecinas
+//  y actualización en vivo por SSE)
+// =========================
+(function () {
+  "use strict";
+
+  const root = document.getElementById("agenda-days");
+  if (!root || !window.fetch) return;
+
+  const WINDOW_BEFORE = 1; // ayer
+  const WINDOW_AFTER = 7;  // +7 días
+  const PREFETCH_DAYS = 7; // margen que se precarga a cada lado
+  const CHUNK_DAYS = 14;   // tamaño de cada pedido extra
+
+  // día (YYYY-MM-DD) -> [citas]
+  const days = new Map();
+  // rango ya cargado [loadedFrom, loadedTo]
+  let loadedFrom = null;
+  let loadedTo = null;
+  // rango -> { etag, rows } (para revalidar con If-None-Match)
+  const etags = new Map();
+  const pending = new Map();
+
+  let base = root.dataset.base;
+
+  // -------------------------
+  // Fechas (siempre en UTC para no depender de la zona del navegador)
+  // -------------------------
+  function parseDay(s) {
+    const [y, m, d] = s.split("-").map(Number);
+    return new Date(Date.UTC(y, m - 1, d));
+  }
+
+  function fmtDay(dt) {
+    return dt.toISOString().slice(0, 10);
+  }
+
+  function addDays(s, n) {
+    const dt = parseDay(s);
+    dt.setUTCDate(dt.getUTCDate() + n);
+    return fmtDay(dt);
+  }
+
+  function esc(v) {
+    return String(v == null ? "" : v)
+      .replace(/&/g, "&amp;")
+      .replace(/</g, "&lt;")
+      .replace(/>/g, "&gt;")
+      .replace(/"/g, "&quot;");
+  }
+
+  // -------------------------
+  // Carga
+  // -------------------------
+  function fetchRange(from, to) {
+    const key = from + "|" + to;
+    if (pending.has(key)) return pending.get(key);
+
+    const headers = { Accept: "application/json" };
+    const cached = etags.get(key);
+    if (cached) headers["If-None-Match"] = cached.etag;
+
+    const p = fetch(`/api/agenda?from=${from}&to=${to}`, { credentials: "same-origin", headers })
+      .then((res) => {
+        if (res.status === 304 && cached) return cached.rows;
+        if (!res.ok) throw new Error("agenda " + res.status);
+        return res.json().then((data) => {
+          const etag = res.headers.get("ETag");
+          if (etag) etags.set(key, { etag, rows: data.rows });
+          return data.rows;
+        });
+      })
+      .then((rows) => {
+        for (let d = from; d <= to; d = addDays(d, 1)) days.set(d, []);
+        for (const r of rows) days.get(r.day).push(r);
+        if (loadedFrom === null || from < loadedFrom) loadedFrom = from;
+        if (loadedTo === null || to > loadedTo) loadedTo = to;
+      })
+      .finally(() => pending.delete(key));
+
+    pending.set(key, p);
+    return p;
+  }
+
+  function ensureLoaded(from, to) {
+    // espera la precarga en curso antes de decidir qué falta
+    const inFlight = Array.from(pending.values()).map((p) => p.catch(() => {}));
+    return Promise.all(inFlight).then(() => loadMissing(from, to));
+  }
+
+  function loadMissing(from, to) {
+    const jobs = [];
+    if (loadedFrom === null) {
+      jobs.push(fetchRange(from, to));
+    } else {
+      if (from < loadedFrom) jobs.push(fetchRange(from, addDays(loadedFrom, -1)));
+      if (to > loadedTo) jobs.push(fetchRange(addDays(loadedTo, 1), to));
+    }
+    return Promise.all(jobs);
+  }
+
+  function prefetchAround(b) {
+    const from = addDays(b, -WINDOW_BEFORE - PREFETCH_DAYS);
+    const to = addDays(b, WINDOW_AFTER + PREFETCH_DAYS);
+    // ⚡ se pide de a bloques para que el rango nunca sea enorme
+    if (loadedFrom !== null && from < loadedFrom) {
+      fetchRange(addDays(loadedFrom, -CHUNK_DAYS), addDays(loadedFrom, -1)).catch(() => {});
+    }
+    if (loadedTo !== null && to > loadedTo) {
+      fetchRange(addDays(loadedTo, 1), addDays(loadedTo, CHUNK_DAYS)).catch(() => {});
+    }
+  }
+
+  // -------------------------
+  // Render (mismo marcado que dashboard.html)
+  // -------------------------
+  function renderAppt(a, day) {
+    return `
+            <div style="display:flex; gap:12px; align-items:center; justify-content:space-between; padding:10px 0; border-bottom:1px solid rgba(255,255,255,0.06);">
+              <div style="min-width:120px;">
+                <strong>${esc(a.start)}</strong>
+                <span class="muted">– ${esc(a.end)}</span>
+              </div>
+
+              <div style="flex:1;">
+                <div><strong>${esc(a.patient)}</strong></div>
+                <div class="muted" style="margin-top:2px;">
+                  ${a.reason ? esc(a.reason) : "—"}
+                </div>
+              </div>
+
+              <div class="muted" style="min-width:110px; text-align:right;">
+                ${esc(a.status)}
+              </div>
+
+              <div style="display:flex; gap:8px; align-items:center;">
+                <form method="post" action="/app/appointments/${a.id}/cancel?date=${base}" style="display:inline;">
+                  <button class="btn btn-ghost" type="submit">Cancelar</button>
+                </form>
+
+                <details>
+                  <summary class="btn btn-ghost" style="cursor:pointer;">Reagendar</summary>
+                  <form method="post" action="/app/appointments/${a.id}/reschedule" style="margin-top:10px;">
+                    <input class="input" type="hidden" name="date" value="${day}">
+                    <div style="display:flex; gap:8px; align-items:center; flex-wrap:wrap;">
+                      <input class="input" type="time" name="time" value="${esc(a.start)}" required>
+                      <input class="input" type="number" name="duration_min" value="${a.duration_min}" min="10" max="240" required>
+                      <button class="btn btn-primary" type="submit">Guardar</button>
+                    </div>
+                  </form>
+                </details>
+              </div>
+            </div>`;
+  }
+
+  function renderDay(day) {
+    const appts = days.get(day) || [];
+    const body = appts.length === 0
+      ? `<div class="muted" style="margin-top:10px;">Sin citas.</div>`
+      : `<div class="list" style="margin-top:10px;">${appts.map((a) => renderAppt(a, day)).join("")}</div>`;
+
+    return `
+    <div class="card" style="margin-top:14px;">
+      <div style="display:flex; align-items:center; justify-content:space-between; gap:10px;">
+        <h3 style="margin:0;">${day}</h3>
+        <a class="btn btn-ghost" href="/app/appointments/new?date=${day}">Agendar</a>
+      </div>
+      ${body}
+    </div>`;
+  }
+
+  function setText(id, text) {
+    const el = document.getElementById(id);
+    if (el) el.textContent = text;
+  }
+
+  function setHref(id, href) {
+    const el = document.getElementById(id);
+    if (el) el.setAttribute("href", href);
+  }
+
+  function render(b) {
+    base = b;
+    const start = addDays(b, -WINDOW_BEFORE);
+    const end = addDays(b, WINDOW_AFTER);
+
+    const html = [];
+    for (let d = start; d <= end; d = addDays(d, 1)) html.push(renderDay(d));
+    root.innerHTML = html.join("");
+    root.dataset.base = b;
+
+    setText("agenda-title-date", b);
+    setText("agenda-start", start);
+    setText("agenda-end", end);
+    setHref("agenda-prev", "/app?date=" + addDays(b, -1));
+    setHref("agenda-next", "/app?date=" + addDays(b, 1));
+    setHref("agenda-new", "/app/appointments/new?date=" + b);
+    const input = document.getElementById("agenda-date");
+    if (input) input.value = b;
+  }
+
+  function goTo(b, push) {
+    const start = addDays(b, -WINDOW_BEFORE);
+    const end = addDays(b, WINDOW_AFTER);
+    return ensureLoaded(start, end).then(() => {
+      render(b);
+      if (push) history.pushState({ base: b }, "", "/app?date=" + b);
+      prefetchAround(b);
+    });
+  }
+
+  // -------------------------
+  // Navegación
+  // -------------------------
+  function bindShift(id, delta) {
+    const el = document.getElementById(id);
+    if (!el) return;
+    el.addEventListener("click", (ev) => {
+      if (ev.metaKey || ev.ctrlKey || ev.shiftKey || ev.button !== 0) return;
+      ev.preventDefault();
+      // si la API falla se sigue el enlace normal (recarga del servidor)
+      goTo(addDays(base, delta), true).catch(() => { window.location = el.href; });
+    });
+  }
+
+  bindShift("agenda-prev", -1);
+  bindShift("agenda-next", 1);
+
+  window.addEventListener("popstate", (ev) => {
+    const b = (ev.state && ev.state.base) || root.dataset.initial;
+    if (b) goTo(b, false).catch(() => window.location.reload());
+  });
+
+  // -------------------------
+  // Eventos en vivo (SSE): se parchea la vista en vez de recargar la página
+  // -------------------------
+  let refreshTimer = null;
+
+  function refreshVisible() {
+    const start = addDays(base, -WINDOW_BEFORE);
+    const end = addDays(base, WINDOW_AFTER);
+    // lo cacheado fuera de la ventana puede estar viejo: se descarta y se vuelve a precargar
+    for (const d of Array.from(days.keys())) {
+      if (d < start || d > end) days.delete(d);
+    }
+    loadedFrom = start;
+    loadedTo = end;
+    const b = base;
+    fetchRange(start, end)
+      .then(() => { if (b === base) render(b); prefetchAround(b); })
+      .catch(() => {});
+  }
+
+  function scheduleRefresh() {
+    // varias citas seguidas (p. ej. una serie) -> un solo pedido
+    clearTimeout(refreshTimer);
+    refreshTimer = setTimeout(refreshVisible, 300);
+  }
+
+  function showLive(text) {
+    const el = document.getElementById("agenda-live");
+    if (!el) return;
+    const now = new Date();
+    el.textContent = `${text} · ${String(now.getHours()).padStart(2, "0")}:${String(now.getMinutes()).padStart(2, "0")}`;
+  }
+
+  if (window.EventSource) {
+    const es = new EventSource("/api/events");
+    es.addEventListener("appointment", scheduleRefresh);
+    es.addEventListener("resync", scheduleRefresh);
+    es.addEventListener("checkin", (ev) => {
+      const d = JSON.parse(ev.data);
+      showLive(`✅ Check-in: ${d.patient} (sesión ${d.session}/${d.total_sessions})`);
+    });
+    // al reconectar pudo perderse algo: se revalida la ventana (ETag)
+    let dropped = false;
+    es.addEventListener("error", () => { dropped = true; });
+    es.addEventListener("open", () => { if (dropped) { dropped = false; scheduleRefresh(); } });
+  }
+
+  // ✅ la primera vista viene del servidor; se precarga alrededor en segundo plano
+  root.dataset.initial = base;
+  history.replaceState({ base }, "", window.location.href);
+  fetchRange(addDays(base, -WINDOW_BEFORE - PREFETCH_DAYS), addDays(base, WINDOW_AFTER + PREFETCH_DAYS))
+    .catch(() => {});
+})();
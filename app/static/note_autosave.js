@@ -0,0 +1,122 @@
+// =========================
+// ✅ app/static/note_autosave.js
+// (Nota clínica: autosave en segundo plano con PATCH de solo lo que cambió)
+// =========================
+(function () {
+  "use strict";
+
+  const form = document.getElementById("note-form");
+  if (!form || !form.dataset.autosave || !window.fetch) return;
+
+  const URL_ = form.dataset.autosave;
+  const DEBOUNCE_MS = 1200;
+  const RETRY_MS = 5000;
+
+  const statusEl = document.getElementById("note-autosave-status");
+  let version = parseInt(form.dataset.version || "0", 10);
+
+  // nombre -> último valor que el servidor confirmó
+  const saved = new Map();
+  let timer = null;
+  let inFlight = null;
+  let stopped = false;
+
+  function fields() {
+    return Array.from(form.querySelectorAll("input[name], textarea[name]")).filter((el) => !el.disabled);
+  }
+
+  fields().forEach((el) => saved.set(el.name, el.value));
+
+  function setStatus(msg, cls) {
+    if (!statusEl) return;
+    statusEl.textContent = msg;
+    statusEl.className = "muted" + (cls ? " " + cls : "");
+  }
+
+  function pendingChanges() {
+    const changes = {};
+    fields().forEach((el) => {
+      if (saved.get(el.name) !== el.value) changes[el.name] = el.value;
+    });
+    return changes;
+  }
+
+  function schedule(ms) {
+    if (stopped) return;
+    clearTimeout(timer);
+    timer = setTimeout(save, ms);
+  }
+
+  async function save(opts) {
+    clearTimeout(timer);
+    if (stopped) return;
+    if (inFlight) {
+      // al terminar el guardado en curso se vuelve a mirar si quedó algo
+      await inFlight;
+      if (stopped) return;
+    }
+
+    const changes = pendingChanges();
+    if (Object.keys(changes).length === 0) return;
+
+    setStatus("Guardando…");
+    inFlight = (async () => {
+      try {
+        const res = await fetch(URL_, {
+          method: "PATCH",
+          headers: { "Content-Type": "application/json", Accept: "application/json" },
+          credentials: "same-origin",
+          keepalive: !!(opts && opts.keepalive),
+          body: JSON.stringify({ version: version, changes: changes }),
+        });
+        const data = await res.json().catch(() => ({}));
+
+        if (res.ok) {
+          version = data.version;
+          form.dataset.version = String(version);
+          // solo lo enviado: si se siguió escribiendo, eso queda pendiente
+          Object.keys(changes).forEach((name) => saved.set(name, changes[name]));
+          const t = new Date().toTimeString().slice(0, 5);
+          setStatus("Guardado automáticamente " + t + " ✅");
+          if (Object.keys(pendingChanges()).length) schedule(DEBOUNCE_MS);
+        } else if (res.status === 409) {
+          stopped = true;
+          setStatus(data.detail || "La nota cambió en otro lugar. Recarga la página.", "err");
+        } else if (res.status === 401 || res.status === 403) {
+          stopped = true;
+          setStatus(data.detail || "No se pudo guardar (sesión o permisos).", "err");
+        } else if (res.status === 422) {
+          // valor inválido (p. ej. letras en FC): se espera a que lo corrijan
+          setStatus(data.detail || "Hay un valor inválido.", "err");
+        } else {
+          setStatus("Error al guardar, reintentando…", "err");
+          schedule(RETRY_MS);
+        }
+      } catch (e) {
+        setStatus("Sin conexión, reintentando…", "err");
+        schedule(RETRY_MS);
+      } finally {
+        inFlight = null;
+      }
+    })();
+    return inFlight;
+  }
+
+  form.addEventListener("input", () => {
+    setStatus("Cambios sin guardar…");
+    schedule(DEBOUNCE_MS);
+  });
+
+  // al salir de un campo no se espera al debounce
+  form.addEventListener("focusout", () => schedule(0));
+
+  document.addEventListener("visibilitychange", () => {
+    if (document.visibilityState === "hidden") save({ keepalive: true });
+  });
+
+  // el botón "Guardar nota" sigue haciendo el POST completo: no competir con él
+  form.addEventListener("submit", () => {
+    stopped = true;
+    clearTimeout(timer);
+  });
+})();
@@ -0,0 +1,76 @@
+# =========================
+# ✅ app/templating.py
+# (Entorno Jinja único para todas las rutas UI)
+# =========================
+"""
+Todas las rutas HTML usan este mismo `templates`:
+
+- auto_reload apagado salvo TEMPLATES_AUTO_RELOAD=1 (desarrollo): en
+  producción no se hace stat() de cada plantilla en cada request;
+- FileSystemBytecodeCache en JINJA_CACHE_DIR: al reiniciar no se vuelve a
+  compilar el código de las plantillas;
+- `precompile()` al arrancar carga todas (incluida base.html) en la caché;
+- cada render se mide en el histograma nexa_template_render_seconds;
+- `asset_url('styles.css')` da la URL con huella (services/assets.py).
+"""
+import logging
+import os
+import time
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template, select_autoescape
+
+from .services import assets, metrics
+
+log = logging.getLogger("nexa.templating")
+
+TEMPLATES_DIR = "app/templates"
+TEMPLATES_AUTO_RELOAD = os.getenv("TEMPLATES_AUTO_RELOAD", "0") == "1"
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", "./artifacts/jinja")
+
+RENDER_SECONDS = metrics.histogram(
+    "nexa_template_render_seconds", "Tiempo de render de plantillas Jinja", ["template"]
+)
+
+
+class TimedTemplate(Template):
+    def render(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            RENDER_SECONDS.observe(time.perf_counter() - t0, template=self.name or "<string>")
+
+
+def _bytecode_cache():
+    try:
+        os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+        return FileSystemBytecodeCache(JINJA_CACHE_DIR)
+    except OSError:
+        # p. ej. disco de solo lectura: se sigue sin caché en disco
+        log.warning("Sin caché de bytecode Jinja (%s no escribible)", JINJA_CACHE_DIR)
+        return None
+
+
+env = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=select_autoescape(["html", "xml"]),
+    auto_reload=TEMPLATES_AUTO_RELOAD,
+    bytecode_cache=_bytecode_cache(),
+    cache_size=400,
+)
+env.template_class = TimedTemplate
+env.globals["asset_url"] = assets.url
+
+templates = Jinja2Templates(env=env)
+
+
+def precompile() -> int:
+    """
+    Carga y compila todas las plantillas. Si alguna tiene un error de
+    sintaxis, falla al arrancar y no en el primer request.
+    """
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return len(names)
@@ -0,0 +1,84 @@
+"""
+Benchmark del motor de maquetación PDF (app/services/pdf_layout.py).
+
+Genera la historia consolidada con 1, 50 y 500 atenciones sintéticas (sin BD)
+y mide tiempo de pasada 1 (paginación), tiempo total, páginas y tamaño.
+
+    python -m benchmarks.bench_pdf_layout
+"""
+import random
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.services import pdf_documents
+from app.services.pdf_layout import Document
+
+FRASES = [
+    "Paciente refiere dolor lumbar de 3 días de evolución, que se irradia a miembro inferior derecho.",
+    "Niega fiebre, náusea o vómito. Antecedente de hipertensión arterial en tratamiento con losartán.",
+    "Al examen: abdomen blando, depresible, no doloroso a la palpación. Ruidos hidroaéreos presentes.",
+    "Se indica reposo relativo, hidratación oral y control en 48 horas o antes si presenta signos de alarma.",
+    "Sesión de fisioterapia número 4 de 10, buena tolerancia al ejercicio, mejora del rango de movimiento.",
+]
+
+
+def _text(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(FRASES) for _ in range(n))
+
+
+def _dataset(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    doctor = SimpleNamespace(id=1, name="Dra. Yiria Rosario Collantes Santos", specialty="Médico General", registration="1312059627")
+    patient = SimpleNamespace(id=1, full_name="Paciente Benchmark")
+    base = datetime(2024, 1, 1, 9, 0)
+
+    encounters, notes, evols = [], {}, {}
+    for i in range(1, n + 1):
+        enc = SimpleNamespace(
+            id=i, patient_id=1, doctor_id=1, visit_type="Ambulatorio",
+            chief_complaint_short="Control", created_at=base + timedelta(days=i), ended_at=base + timedelta(days=i, minutes=30),
+        )
+        encounters.append(enc)
+        notes[i] = SimpleNamespace(
+            chief_complaint=_text(rng, 1), hpi=_text(rng, rng.randint(2, 12)), physical_exam=_text(rng, rng.randint(1, 6)),
+            complementary_tests=_text(rng, 1), assessment_dx=_text(rng, 1), plan_treatment=_text(rng, rng.randint(1, 4)),
+            indications_alarm_signs=_text(rng, 1), follow_up=_text(rng, 1),
+            ta_sys=120, ta_dia=80, hr=72, rr=16, temp="36.7", spo2=98,
+        )
+        if i % 5 == 0:
+            evols[i] = [SimpleNamespace(author_doctor_id=1, created_at=enc.ended_at + timedelta(days=1), content=_text(rng, 2))]
+    return patient, encounters, {1: doctor}, notes, evols
+
+
+def main():
+    print(f"{'atenciones':>10} {'pasada1 (s)':>12} {'total (s)':>10} {'páginas':>8} {'KB':>8}")
+    for n in (1, 50, 500):
+        patient, encounters, doctors, notes, evols = _dataset(n)
+
+        # pasada 1 sola (medición + paginación)
+        captured: list[Document] = []
+        original_render = Document.render
+
+        def capture(self, on_page=None):
+            captured.append(self)
+            return original_render(self, on_page)
+
+        Document.render = capture
+        try:
+            t0 = time.perf_counter()
+            pdf = pdf_documents.build_history_pdf(patient, encounters, doctors, notes, evols)
+            total = time.perf_counter() - t0
+        finally:
+            Document.render = original_render
+
+        doc = captured[0]
+        t1 = time.perf_counter()
+        layout = doc.layout()
+        pass1 = time.perf_counter() - t1
+
+        print(f"{n:>10} {pass1:>12.4f} {total:>10.3f} {layout.page_count:>8} {len(pdf) / 1024:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Benchmark de CompressedText (app/db_types.py) sobre notas clínicas sintéticas.
+
+Genera un corpus de notas en español (campos cortos y campos largos de
+enfermedad actual / examen físico), las guarda en una BD SQLite temporal por
+códec (off, zlib y zstd si está instalado) y mide:
+
+- tamaño guardado en las columnas y del archivo tras VACUUM;
+- escritura (INSERT de todas las notas, un commit por lote de 200);
+- lectura completa (todas las filas) y lecturas puntuales por id.
+
+    python -m benchmarks.bench_text_compression
+    BENCH_NOTES=10000 python -m benchmarks.bench_text_compression
+"""
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, func, insert, select, text, type_coerce
+from sqlalchemy.types import Text
+
+from app import db_types
+from app.db_types import CompressedText
+
+NOTES = int(os.getenv("BENCH_NOTES", "2000"))
+POINT_READS = int(os.getenv("BENCH_POINT_READS", "500"))
+BATCH = 200
+
+FIELDS = (
+    "chief_complaint", "hpi", "physical_exam", "complementary_tests",
+    "assessment_dx", "plan_treatment", "indications_alarm_signs", "follow_up",
+)
+
+SINTOMAS = [
+    "dolor lumbar", "cefalea holocraneana", "dolor abdominal difuso", "tos productiva", "disnea de medianos esfuerzos",
+    "dolor en rodilla derecha", "mareo", "odinofagia", "dolor cervical", "parestesias en mano izquierda",
+]
+TIEMPOS = ["2 días", "una semana", "3 semanas", "48 horas", "un mes", "varios meses"]
+ANTECEDENTES = [
+    "hipertensión arterial en tratamiento con losartán 50 mg cada día",
+    "diabetes mellitus tipo 2 con metformina 850 mg cada 12 horas",
+    "hipotiroidismo con levotiroxina 75 mcg en ayunas",
+    "sin antecedentes patológicos de importancia",
+    "apendicectomía hace 10 años",
+    "asma bronquial intermitente con salbutamol a demanda",
+]
+EXAMEN = [
+    "Paciente consciente, orientado en tiempo, espacio y persona, hidratado, afebril.",
+    "Cardiopulmonar: ruidos cardíacos rítmicos, sin soplos; murmullo vesicular conservado, sin ruidos agregados.",
+    "Abdomen blando, depresible, doloroso a la palpación profunda en {zona}, sin signos de irritación peritoneal.",
+    "Columna: contractura paravertebral {lado}, Lasègue negativo, fuerza y sensibilidad conservadas.",
+    "Extremidades sin edema, pulsos distales presentes y simétricos, llenado capilar menor a 2 segundos.",
+    "Rodilla {lado} con leve derrame articular, dolor a la flexión máxima, cajón anterior negativo.",
+]
+ZONAS = ["epigastrio", "fosa ilíaca derecha", "hipocondrio derecho", "mesogastrio"]
+LADOS = ["derecha", "izquierda", "bilateral"]
+PLAN = [
+    "Paracetamol 1 g vía oral cada 8 horas por 5 días.",
+    "Ibuprofeno 400 mg vía oral cada 8 horas con alimentos por 3 días.",
+    "Fisioterapia: 10 sesiones, ejercicios de fortalecimiento y estiramiento.",
+    "Omeprazol 20 mg vía oral en ayunas por 14 días.",
+    "Control de presión arterial en casa dos veces al día y registro en bitácora.",
+    "Se solicita biometría hemática, química sanguínea y examen general de orina.",
+]
+ALARMA = (
+    "Acudir a emergencias si presenta fiebre mayor a 38.5 °C, dolor que no cede con la medicación, "
+    "dificultad para respirar, vómitos persistentes o pérdida de fuerza en extremidades."
+)
+
+
+def _hpi(rng: random.Random) -> str:
+    partes = []
+    for _ in range(rng.randint(1, 8)):
+        partes.append(
+            f"Paciente refiere {rng.choice(SINTOMAS)} de {rng.choice(TIEMPOS)} de evolución, "
+            f"de intensidad {rng.randint(3, 9)}/10, que {rng.choice(['empeora', 'mejora'])} con "
+            f"{rng.choice(['el reposo', 'la actividad física', 'los cambios de posición', 'la ingesta de alimentos'])}. "
+            f"Como antecedente presenta {rng.choice(ANTECEDENTES)}."
+        )
+    return " ".join(partes)
+
+
+def _exam(rng: random.Random) -> str:
+    frases = rng.sample(EXAMEN, rng.randint(2, len(EXAMEN)))
+    return " ".join(f.format(zona=rng.choice(ZONAS), lado=rng.choice(LADOS)) for f in frases)
+
+
+def corpus(n: int, seed: int = 11) -> list[dict]:
+    rng = random.Random(seed)
+    notes = []
+    for _ in range(n):
+        notes.append({
+            "chief_complaint": rng.choice(SINTOMAS).capitalize(),
+            "hpi": _hpi(rng),
+            "physical_exam": _exam(rng),
+            "complementary_tests": rng.choice(["Ninguno", "Rx de columna lumbar sin alteraciones óseas.", "Pendientes."]),
+            "assessment_dx": f"{rng.choice(SINTOMAS).capitalize()} (CIE-10 M{rng.randint(10, 99)}.{rng.randint(0, 9)})",
+            "plan_treatment": " ".join(rng.sample(PLAN, rng.randint(1, 4))),
+            "indications_alarm_signs": ALARMA,
+            "follow_up": f"Control en {rng.choice(['48 horas', '1 semana', '15 días', '1 mes'])}.",
+        })
+    return notes
+
+
+def _run(codec: str, notes: list[dict], tmpdir: str) -> dict:
+    path = os.path.join(tmpdir, f"notes_{codec}.db")
+    engine = create_engine(f"sqlite:///{path}")
+    meta = MetaData()
+    table = Table(
+        "bench_notes", meta,
+        Column("id", Integer, primary_key=True),
+        *[Column(f, CompressedText(codec)) for f in FIELDS],
+    )
+    meta.create_all(engine)
+
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        for i in range(0, len(notes), BATCH):
+            conn.execute(insert(table), notes[i:i + BATCH])
+    write_s = time.perf_counter() - t0
+
+    with engine.connect() as conn:
+        t0 = time.perf_counter()
+        rows = conn.execute(select(table)).all()
+        read_all_s = time.perf_counter() - t0
+        assert rows[0]._mapping["hpi"] == notes[0]["hpi"]
+
+        rng = random.Random(3)
+        t0 = time.perf_counter()
+        for _ in range(POINT_READS):
+            conn.execute(select(table).where(table.c.id == rng.randint(1, len(notes)))).one()
+        point_ms = (time.perf_counter() - t0) * 1000 / POINT_READS
+
+        stored = sum(
+            conn.execute(select(func.coalesce(func.sum(func.length(type_coerce(table.c[f], Text))), 0))).scalar()
+            for f in FIELDS
+        )
+        conn.execute(text("VACUUM"))
+    engine.dispose()
+
+    return {
+        "codec": codec,
+        "stored_kb": stored / 1024,
+        "file_kb": os.path.getsize(path) / 1024,
+        "write_s": write_s,
+        "read_all_s": read_all_s,
+        "point_ms": point_ms,
+    }
+
+
+def main():
+    notes = corpus(NOTES)
+    plain_chars = sum(len(v) for n in notes for v in n.values())
+    long_share = sum(1 for n in notes for v in n.values() if len(v.encode()) >= db_types.TEXT_COMPRESSION_MIN_BYTES)
+    print(
+        f"{NOTES} notas · {plain_chars / NOTES:.0f} caracteres por nota · "
+        f"{long_share} campos >= {db_types.TEXT_COMPRESSION_MIN_BYTES} B (candidatos a comprimir)"
+    )
+
+    codecs = ["off", "zlib"] + (["zstd"] if db_types.zstandard is not None else [])
+    print(f"{'códec':>6} {'columnas KB':>12} {'archivo KB':>11} {'escritura s':>12} {'lectura s':>10} {'por id ms':>10}")
+    with tempfile.TemporaryDirectory(prefix="nexa-textbench-") as tmpdir:
+        base = None
+        for codec in codecs:
+            r = _run(codec, notes, tmpdir)
+            base = base or r
+            print(
+                f"{r['codec']:>6} {r['stored_kb']:>12.0f} {r['file_kb']:>11.0f} {r['write_s']:>12.3f} "
+                f"{r['read_all_s']:>10.3f} {r['point_ms']:>10.3f}"
+                f"   ({r['file_kb'] / base['file_kb']:.0%} del archivo sin comprimir)"
+            )
+    if db_types.zstandard is None:
+        print("(zstd omitido: el paquete zstandard no está instalado)")
+
+
+if __name__ == "__main__":
+    main()